@@ -0,0 +1,165 @@
+import os
+import time
+import queue
+import threading
+import subprocess
+
+# 单条命令的默认超时时间（秒）
+DEFAULT_TIMEOUT = 5.0
+
+
+class ADBShellError(Exception):
+    """常驻shell通道异常（进程退出、输出流中断等）"""
+
+
+class ADBShellTimeout(ADBShellError):
+    """命令在超时时间内没有返回结束标记"""
+
+
+# 常驻adb shell通道
+class ADBShell:
+    """一个长期存活的 `adb shell` 进程，命令通过stdin逐条发送。
+
+    每条命令后追加一个唯一的结束标记和返回码，读取端据此切分输出，
+    因此同一个进程可以连续执行任意多条命令而无需重新创建adb进程。
+    超时或进程退出时通道会被关闭，下一次调用时自动重启；
+    调用close()后通道不再重启，之后的命令直接抛出ADBShellError。
+    """
+
+    def __init__(self, adb_path, serial=None, name='default'):
+        self.adb_path = adb_path
+        self.serial = serial
+        self.name = name
+        self.restarts = 0
+        self._proc = None
+        self._lines = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._seq = 0
+        # 每个通道使用随机前缀，避免命令输出中意外出现相同的标记
+        self._token = os.urandom(4).hex()
+
+    def _start(self):
+        """启动adb shell进程和输出读取线程"""
+        args = [self.adb_path]
+        if self.serial:
+            args += ['-s', self.serial]
+        args.append('shell')
+        self._proc = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0
+        )
+        self._lines = queue.Queue()
+        reader = threading.Thread(target=self._read_output, args=(self._proc, self._lines))
+        reader.daemon = True
+        reader.start()
+
+    @staticmethod
+    def _read_output(proc, lines):
+        """持续读取进程输出，按行放入队列，EOF时放入None"""
+        try:
+            for raw in iter(proc.stdout.readline, b''):
+                lines.put(raw)
+        except Exception:
+            pass
+        lines.put(None)
+
+    def alive(self):
+        """通道进程是否仍在运行"""
+        return self._proc is not None and self._proc.poll() is None
+
+    def close(self):
+        """关闭通道，正在执行的命令中断且不再重启"""
+        self._closed = True
+        self._kill()
+
+    def _kill(self):
+        """结束通道进程（出错时调用，下一条命令会重启进程）"""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            proc.kill()
+            proc.wait(timeout=1)
+        except Exception:
+            pass
+
+    def run(self, command, timeout=DEFAULT_TIMEOUT, retries=1):
+        """执行一条命令，返回 (返回码, 输出文本)
+
+        通道在执行中途断开时自动重启并重试，超时则直接抛出ADBShellTimeout，
+        避免对慢命令重复施压。
+        """
+        with self._lock:
+            while True:
+                try:
+                    return self._run_locked(command, timeout)
+                except ADBShellTimeout:
+                    raise
+                except ADBShellError:
+                    if retries <= 0:
+                        raise
+                    retries -= 1
+
+    def _run_locked(self, command, timeout):
+        if self._closed:
+            self._kill()
+            raise ADBShellError(f"shell通道已关闭: {command}")
+        if not self.alive():
+            if self._proc is not None:
+                self._kill()
+            if self._seq:
+                self.restarts += 1
+            self._start()
+            if self._closed:
+                # 启动期间被close()，close看不到新进程，由这里结束
+                self._kill()
+                raise ADBShellError(f"shell通道已关闭: {command}")
+
+        self._seq += 1
+        marker = f'__PM_{self._token}_{self._seq}__'
+        # 用{}分组使多行命令的stderr也被合并，最后输出结束标记和返回码
+        payload = f'{{ {command}\n}} 2>&1; echo "{marker}:$?"\n'
+        try:
+            self._proc.stdin.write(payload.encode('utf-8'))
+            self._proc.stdin.flush()
+        except Exception as e:
+            self._kill()
+            raise ADBShellError(f"写入shell通道失败: {str(e)}")
+
+        deadline = time.monotonic() + timeout
+        output = []
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise queue.Empty()
+                raw = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                # 输出流已无法与命令对齐，只能关闭通道
+                self._kill()
+                raise ADBShellTimeout(f"命令超时({timeout}s): {command}")
+            if raw is None:
+                self._kill()
+                raise ADBShellError(f"shell通道已断开: {command}")
+
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            index = line.find(marker)
+            if index < 0:
+                output.append(line)
+                continue
+            # 命令输出末尾没有换行时，结束标记会与最后一行输出连在一起
+            if index > 0:
+                output.append(line[:index])
+            try:
+                code = int(line[index + len(marker) + 1:].strip() or 0)
+            except ValueError:
+                code = -1
+            return code, '\n'.join(output)
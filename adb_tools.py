@@ -0,0 +1,590 @@
+import os
+import time
+import threading
+import subprocess
+
+import probe
+import frames
+import app_sampler
+import power
+import metrics
+import snapshot
+import device_profile
+from adb_shell import ADBShell, ADBShellError, ADBShellTimeout, DEFAULT_TIMEOUT
+
+# adb connect / disconnect 的超时时间（秒）
+CONNECT_TIMEOUT = 10
+DEFAULT_WIRELESS_PORT = 5555
+# 重新查找目标应用进程的间隔（秒）：发现新启动的子进程；应用尚未运行时使用较短的间隔
+APP_RESOLVE_INTERVAL = 30.0
+APP_RETRY_INTERVAL = 2.0
+
+
+def normalize_address(address):
+    """无线调试地址补全端口：192.168.1.5 -> 192.168.1.5:5555"""
+    address = address.strip()
+    if address.startswith('['):
+        # IPv6：[fe80::1] 或 [fe80::1]:5555
+        return address if ']:' in address else f'{address}:{DEFAULT_WIRELESS_PORT}'
+    return address if ':' in address else f'{address}:{DEFAULT_WIRELESS_PORT}'
+
+
+# ADB命令工具类
+class ADBTools:
+    # 每个设备/通道一个常驻shell，键为 (serial, channel)
+    _shells = {}
+    _shells_lock = threading.Lock()
+    # 每台设备的数据源探测结果，键为序列号
+    _capabilities = {}
+    # 每台设备的静态信息（系统属性、CPU拓扑），键为序列号，重新连接或手动刷新时才重新读取
+    _profiles = {}
+    # 正在抓取原始输出的设备，键为序列号，值为capture.CaptureWriter
+    _captures = {}
+    # 目标应用的进程（包名、{pid: 进程名}、页大小），键为序列号，包名变化或进程退出时重新查找
+    _app_targets = {}
+
+    @staticmethod
+    def get_adb_path():
+        """获取ADB可执行文件的路径"""
+        # 环境变量ADB_PATH优先（如指向tools/fake_adb.py在无真机环境中测试）
+        if os.environ.get('ADB_PATH'):
+            return os.environ['ADB_PATH']
+        # 其次检查内置ADB路径
+        adb_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'adb', 'adb.exe')
+        if os.path.exists(adb_path):
+            return adb_path
+        # 如果内置ADB不存在，返回系统ADB命令
+        return 'adb'
+
+    @staticmethod
+    def get_shell(serial=None, channel='default'):
+        """获取（必要时创建）设备的常驻shell通道"""
+        key = (serial, channel)
+        with ADBTools._shells_lock:
+            shell = ADBTools._shells.get(key)
+            if shell is None:
+                shell = ADBShell(ADBTools.get_adb_path(), serial, channel)
+                ADBTools._shells[key] = shell
+            return shell
+
+    @staticmethod
+    def close_shells(serial=None):
+        """关闭指定设备（默认全部）的常驻shell通道"""
+        with ADBTools._shells_lock:
+            keys = [key for key in ADBTools._shells if serial is None or key[0] == serial]
+            shells = [ADBTools._shells.pop(key) for key in keys]
+        for shell in shells:
+            shell.close()
+        # 通道关闭意味着断开或重连，缓存的探测结果不再可信
+        if serial is None:
+            ADBTools._capabilities.clear()
+            ADBTools._profiles.clear()
+            ADBTools._app_targets.clear()
+        else:
+            ADBTools.invalidate_device(serial)
+
+    @staticmethod
+    def shell(command, timeout=DEFAULT_TIMEOUT, serial=None, channel='default'):
+        """通过常驻shell执行命令并返回输出，返回码非0时抛出CalledProcessError"""
+        sent_at = time.time()
+        started = time.perf_counter()
+        try:
+            code, output = ADBTools.get_shell(serial, channel).run(command, timeout)
+        except ADBShellError as e:
+            metrics.command_failed(channel, timeout=isinstance(e, ADBShellTimeout))
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            metrics.observe('adb_command_duration_seconds', duration, channel=channel)
+        capture = ADBTools._captures.get(serial)
+        if capture:
+            capture.command(sent_at, channel, metrics.current_collector(), command, code, output, duration)
+        if code != 0:
+            metrics.command_failed(channel)
+            raise subprocess.CalledProcessError(code, command, output)
+        return output
+
+    @staticmethod
+    @metrics.collector('ping')
+    def ping(serial=None):
+        """通过常驻shell确认设备仍可响应，不创建新进程"""
+        try:
+            return ADBTools.shell('echo ok', timeout=2, serial=serial).strip() == 'ok'
+        except Exception as e:
+            print(f"设备无响应: {str(e)}")
+            return False
+
+    @staticmethod
+    @metrics.collector('probe_device')
+    def probe_device(serial=None):
+        """一次往返探测设备上可用的数据源（节点路径、单位、权限、FPS方法）并缓存"""
+        output = ADBTools.shell(probe.build_probe_command(), timeout=15, serial=serial)
+        caps = probe.parse_probe(output, serial)
+        caps.shell_restarts = ADBTools.get_shell(serial).restarts
+        ADBTools._capabilities[serial] = caps
+        for metric, reason in caps.reasons.items():
+            print(f"指标 {metric} 不可用: {reason}")
+        return caps
+
+    @staticmethod
+    def get_capabilities(serial=None, refresh=False):
+        """获取缓存的探测结果
+
+        shell通道重启过（设备可能重启）时核对boot_id，变化则重新探测。
+        """
+        caps = ADBTools._capabilities.get(serial)
+        if caps is None or refresh:
+            return ADBTools.probe_device(serial)
+        restarts = ADBTools.get_shell(serial).restarts
+        if restarts != caps.shell_restarts:
+            boot_id = ADBTools.shell(f'cat {probe.BOOT_ID_PATH}', serial=serial).strip()
+            if boot_id != caps.boot_id:
+                print(f"设备 {serial or ''} 已重启，重新探测数据源")
+                return ADBTools.probe_device(serial)
+            caps.shell_restarts = restarts
+        return caps
+
+    @staticmethod
+    @metrics.collector('load_profile')
+    def load_profile(serial=None):
+        """一次往返读取设备的系统属性和CPU拓扑并缓存"""
+        output = ADBTools.shell(device_profile.build_profile_command(), timeout=10, serial=serial)
+        profile = device_profile.parse_profile(output, serial)
+        ADBTools._profiles[serial] = profile
+        return profile
+
+    @staticmethod
+    def get_profile(serial=None, refresh=False):
+        """获取缓存的设备静态信息，没有缓存或refresh时重新读取"""
+        profile = ADBTools._profiles.get(serial)
+        if profile is None or refresh:
+            return ADBTools.load_profile(serial)
+        return profile
+
+    @staticmethod
+    def cached_profile(serial=None):
+        """已缓存的设备静态信息，没有缓存时返回None（不读取设备）"""
+        return ADBTools._profiles.get(serial)
+
+    @staticmethod
+    def cached_capabilities(serial=None):
+        """已缓存的探测结果，没有缓存时返回None（不探测设备）"""
+        return ADBTools._capabilities.get(serial)
+
+    @staticmethod
+    def set_capture(serial, capture):
+        """开始（capture为None时停止）抓取设备上所有命令的原始输出"""
+        if capture is None:
+            ADBTools._captures.pop(serial, None)
+        else:
+            ADBTools._captures[serial] = capture
+
+    @staticmethod
+    def get_capture(serial):
+        return ADBTools._captures.get(serial)
+
+    @staticmethod
+    def invalidate_device(serial=None):
+        """清除设备的探测缓存和静态信息，下次读取时重新探测"""
+        ADBTools._capabilities.pop(serial, None)
+        ADBTools._profiles.pop(serial, None)
+        ADBTools._app_targets.pop(serial, None)
+
+    @staticmethod
+    def check_adb():
+        """检查ADB是否可用"""
+        try:
+            adb_path = ADBTools.get_adb_path()
+            # 检查ADB版本和设备连接状态
+            version_output = subprocess.check_output([adb_path, 'version'], universal_newlines=True)
+            devices_output = subprocess.check_output([adb_path, 'devices'], universal_newlines=True)
+            
+            # 验证是否有设备连接
+            if 'List of devices attached' in devices_output and len(devices_output.strip().split('\n')) > 1:
+                return True
+            return False
+        except Exception as e:
+            print(f"ADB检查失败: {str(e)}")
+            return False
+
+    @staticmethod
+    @metrics.collector('get_device_info')
+    def get_device_info(serial=None):
+        """获取设备信息（型号、系统版本、安卓版本），来自缓存的设备静态信息"""
+        try:
+            return ADBTools.get_profile(serial).device_info()
+        except Exception as e:
+            print(f"获取设备信息失败: {str(e)}")
+            metrics.fallback('device_info')
+            return {'model': '未知', 'os_version': '未知', 'api_level': '未知'}
+    
+    @staticmethod
+    def get_devices():
+        """获取已连接的设备列表"""
+        devices = []
+        try:
+            adb_path = ADBTools.get_adb_path()
+            result = subprocess.check_output([adb_path, 'devices'], universal_newlines=True)
+            lines = result.strip().split('\n')[1:]
+            for line in lines:
+                if line.strip() and '\t' in line:
+                    device_id, status = line.split('\t')
+                    if status == 'device':
+                        devices.append(device_id)
+            return devices
+        except:
+            return []
+    
+    @staticmethod
+    def connect_wireless(address, timeout=CONNECT_TIMEOUT):
+        """无线连接设备，address为 ip 或 ip:port（默认端口5555），不影响其他已连接的设备"""
+        address = normalize_address(address)
+        try:
+            result = subprocess.run([ADBTools.get_adb_path(), 'connect', address], stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, universal_newlines=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False, f"连接 {address} 超时（{timeout}秒）"
+        except Exception as e:
+            return False, str(e)
+        output = result.stdout.strip()
+        # 成功时输出 "connected to ..." 或 "already connected to ..."，失败时为 "failed to connect ..." 等
+        if 'connected to' in output.lower():
+            return True, output
+        return False, output or f"连接 {address} 失败"
+
+    @staticmethod
+    def disconnect_wireless(address, timeout=CONNECT_TIMEOUT):
+        """只断开指定地址的无线连接，并关闭它的shell通道"""
+        address = normalize_address(address)
+        try:
+            subprocess.run([ADBTools.get_adb_path(), 'disconnect', address], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=timeout)
+        except Exception as e:
+            print(f"断开 {address} 失败: {str(e)}")
+        ADBTools.close_shells(address)
+    
+    @staticmethod
+    @metrics.collector('get_focused_package')
+    def get_focused_package(serial=None):
+        """获取前台应用包名（解析dumpsys window中的mCurrentFocus）"""
+        output = ADBTools.shell('dumpsys window | grep -E "mCurrentFocus|mFocusedApp"', serial=serial)
+        return frames.parse_focused_package(output)
+
+    @staticmethod
+    def create_frame_collector(serial=None, method=None, poll_interval=frames.POLL_INTERVAL):
+        """创建后台帧采集器，使用独立的shell通道以免阻塞其他指标
+
+        method默认使用探测结果，'agent'表示帧数据由设备端采样代理提供。
+        """
+        caps = ADBTools.get_capabilities(serial)
+
+        def shell(command, timeout):
+            with metrics.collecting('frames'):
+                return ADBTools.shell(command, timeout=timeout, serial=serial, channel='frames')
+
+        return frames.FrameCollector(shell, method=method or caps.fps_method or 'surfaceflinger',
+                                     poll_interval=poll_interval)
+
+    @staticmethod
+    @metrics.collector('get_fps')
+    def get_fps(serial=None):
+        """获取当前FPS
+
+        单次读取前台图层的帧时间戳缓冲区并计算最近1秒的帧数，
+        不再清空缓冲区后休眠等待；持续监控请使用create_frame_collector。
+        """
+        try:
+            collector = ADBTools.create_frame_collector(serial)
+            collector.collect_once()
+            return collector.latest()['fps']
+        except Exception as e:
+            print(f"获取FPS失败: {str(e)}")
+            return None
+
+    @staticmethod
+    @metrics.collector('get_cpu_freq')
+    def get_cpu_freq(serial=None):
+        """获取每个CPU核心的频率 (MHz)"""
+        try:
+            # 核心编号来自缓存的设备静态信息，不再每次读取possible
+            try:
+                core_indexes = ADBTools.get_profile(serial).core_indexes()
+            except Exception:
+                core_indexes = []
+            if not core_indexes:
+                core_indexes = range(8)  # 默认假设8核
+                metrics.fallback('cpu_count')
+
+            # 获取每个核心的频率
+            core_freqs = {}
+            for i in core_indexes:
+                try:
+                    # 尝试读取每个核心的频率
+                    paths = [
+                        f'/sys/devices/system/cpu/cpu{i}/cpufreq/scaling_cur_freq',
+                        f'/sys/devices/system/cpu/cpu{i}/cpufreq/cpuinfo_cur_freq'
+                    ]
+                    
+                    for path in paths:
+                        try:
+                            result = ADBTools.shell(f'cat {path}', serial=serial)
+                            if result.strip() and result.strip().isdigit():
+                                core_freqs[f'core_{i}'] = int(result.strip()) // 1000
+                                break
+                        except:
+                            continue
+                    
+                    if f'core_{i}' not in core_freqs:
+                        core_freqs[f'core_{i}'] = 1500  # 默认值
+                        metrics.fallback('cpu_freq')
+                except:
+                    core_freqs[f'core_{i}'] = 1500  # 默认值
+                    metrics.fallback('cpu_freq')
+            
+            return core_freqs
+        except Exception as e:
+            print(f"获取CPU频率失败: {str(e)}")
+            metrics.fallback('cpu_freq')
+            return {'core_0': 1500}  # 至少返回一个核心的默认值
+
+    # 上一次/proc/stat的读数，键为设备序列号
+    _prev_cpu_stats = {}
+    # 上一次读取的目标应用进程/线程的累计CPU时间，键为设备序列号
+    _prev_app_stats = {}
+
+    @staticmethod
+    def reset_delta_state(serial=None):
+        """清除设备的增量计算状态（重新连接或开始新会话时调用，避免出现虚假的尖峰）"""
+        ADBTools._prev_cpu_stats.pop(serial, None)
+        ADBTools._prev_app_stats.pop(serial, None)
+
+    @staticmethod
+    def _compute_cpu_load(current_stats, serial=None):
+        """根据与上一次/proc/stat的差值计算每个核心的负载，并更新历史数据"""
+        core_loads = {}
+        prev_stats = ADBTools._prev_cpu_stats.get(serial, {})
+        for core_num, current in current_stats.items():
+            prev = prev_stats.get(core_num)
+            load = 0
+            if prev:
+                total_delta = current['total'] - prev['total']
+                idle_delta = current['idle'] - prev['idle']
+                if total_delta > 0:
+                    load = min(100, max(0, int(100.0 * (total_delta - idle_delta) / total_delta)))
+            core_loads[core_num] = load
+
+        # 更新历史数据
+        ADBTools._prev_cpu_stats[serial] = current_stats
+        return core_loads
+
+    @staticmethod
+    def update_cpu_load(sample, serial=None):
+        """根据快照中的/proc/stat计算CPU负载，没有上一次读数时把负载标记为估算值"""
+        if not sample.cpu_stat:
+            return
+        if serial not in ADBTools._prev_cpu_stats:
+            sample.estimated.add('cpu_load')
+        sample.cpu_load = ADBTools._compute_cpu_load(sample.cpu_stat, serial)
+
+    @staticmethod
+    @metrics.collector('get_cpu_load')
+    def get_cpu_load(serial=None):
+        """获取每个CPU核心的负载 (%)"""
+        try:
+            # 获取每个核心的负载
+            result = ADBTools.shell('cat /proc/stat', serial=serial)
+            sample = snapshot.PerfSnapshot(time.time())
+            sample.cpu_stat = snapshot.parse_proc_stat(result)
+            ADBTools.update_cpu_load(sample, serial)
+            if 'cpu_load' in sample.estimated or not sample.cpu_load:
+                metrics.fallback('cpu_load')
+            return {f'core_{i}': load for i, load in sorted(sample.cpu_load.items())} or {'core_0': 0}
+        except Exception as e:
+            print(f"获取CPU负载失败: {str(e)}")
+            metrics.fallback('cpu_load')
+            return {'core_0': 0}  # 至少返回一个核心的默认值
+
+    @staticmethod
+    @metrics.collector('get_gpu_load')
+    def get_gpu_load(serial=None):
+        """获取GPU负载 (%)，优先使用无需root权限的方法"""
+        try:
+            paths = [
+                '/sys/class/kgsl/kgsl-3d0/gpu_busy_percentage',
+                '/sys/class/kgsl/kgsl-3d0/devfreq/gpu_load'
+            ]
+            
+            # 首先尝试不使用root权限读取
+            for path in paths:
+                try:
+                    result = ADBTools.shell(f'cat {path}', serial=serial)
+                    if result.strip() and not 'Permission denied' in result:
+                        return int(result.strip())
+                except Exception as e:
+                    continue
+            
+            # 如果无法访问，返回估算值
+            print("无法访问GPU负载数据（设备未root），将返回估算值")
+            metrics.fallback('gpu_load')
+            return 30  # 返回一个合理的估计值
+        except Exception as e:
+            print(f"获取GPU负载失败: {str(e)}")
+            metrics.fallback('gpu_load')
+            return 0
+
+    @staticmethod
+    @metrics.collector('get_gpu_freq')
+    def get_gpu_freq(serial=None):
+        """获取GPU频率 (MHz)，优先使用无需root权限的方法"""
+        try:
+            # 不同设备GPU频率文件路径可能不同，这里尝试更多可能的路径
+            paths = [
+                '/sys/class/kgsl/kgsl-3d0/gpuclk',
+                '/sys/class/kgsl/kgsl-3d0/devfreq/cur_freq',
+                '/sys/class/kgsl/kgsl-3d0/freq',
+                '/sys/kernel/gpu/gpu_clock',
+                '/sys/class/devfreq/gpufreq/cur_freq',
+                '/sys/class/kgsl/kgsl-3d0/clock',
+                '/sys/kernel/debug/gpu/clock',
+                '/sys/devices/platform/kgsl-3d0/kgsl/kgsl-3d0/gpuclk',
+                '/sys/devices/soc/1c00000.qcom,kgsl-3d0/kgsl/kgsl-3d0/gpuclk',
+                '/sys/devices/platform/gpusysfs/gpu_clock'
+            ]
+            
+            # 首先尝试不使用root权限读取
+            for path in paths:
+                try:
+                    result = ADBTools.shell(f'cat {path}', serial=serial)
+                    if result.strip() and not 'Permission denied' in result:
+                        # 尝试转换为整数并计算MHz
+                        value = int(result.strip())
+                        # 根据数值大小判断单位并转换
+                        if value > 1000000:  # Hz
+                            return value // 1000000
+                        elif value > 1000:  # kHz
+                            return value // 1000
+                        else:  # 已经是MHz
+                            return value
+                except Exception as e:
+                    continue
+            
+            # 如果无法访问文件系统，尝试从dumpsys获取GPU信息
+            try:
+                result = ADBTools.shell('dumpsys gfxinfo', serial=serial)
+                # 解析dumpsys输出以获取GPU相关信息
+                if 'GPU' in result:
+                    metrics.fallback('gpu_freq')
+                    return 500  # 返回一个典型的GPU频率值
+            except Exception as e:
+                print(f"从dumpsys获取GPU信息失败: {str(e)}")
+            
+            print("无法访问GPU频率数据，将返回估算值")
+            metrics.fallback('gpu_freq')
+            return 400  # 返回一个合理的默认值
+        except Exception as e:
+            print(f"获取GPU频率失败: {str(e)}")
+            metrics.fallback('gpu_freq')
+            return 400  # 返回默认值而不是0，避免图表显示异常
+    
+    @staticmethod
+    @metrics.collector('get_battery_info')
+    def get_battery_info(serial=None):
+        """获取电池信息（电流和功率），dumpsys battery较慢且更新不频繁，监控中使用get_power_samples"""
+        try:
+            result = ADBTools.shell('dumpsys battery', serial=serial)
+
+            # 只匹配完整的键名（"voltage"之外还有"max charging voltage"等行）
+            current_raw = None
+            voltage = 0
+            for line in result.split('\n'):
+                key, _, value = line.partition(':')
+                key = key.strip().lower()
+                if key == 'current now':
+                    current_raw = snapshot.parse_int(value)
+                elif key == 'voltage':
+                    voltage = (snapshot.parse_int(value) or 0) / 1000  # mV转换为V
+
+            # 电流与current_now节点的原始值相同，已探测过的设备按校准换算单位和方向
+            caps = ADBTools._capabilities.get(serial)
+            calibration = caps.battery_calibration if caps else None
+            current = snapshot.battery_reading(current_raw, None, calibration)[0] if current_raw is not None else 0
+
+            return {
+                'current': current,            # mA
+                'power': current * voltage     # mW
+            }
+        except Exception:
+            metrics.fallback('battery')
+            return {'current': 0, 'power': 0}
+
+    @staticmethod
+    @metrics.collector('get_snapshot')
+    def get_snapshot(serial=None, groups=snapshot.SNAPSHOT_GROUPS, channel='default'):
+        """一次ADB往返读取/proc/stat、cpufreq、kgsl和power_supply，返回同一时刻的PerfSnapshot
+
+        只读取探测阶段确认可用的节点，不可用的指标保持为None。
+        groups可只读取部分分组（cpu/gpu/battery），channel指定使用的shell通道。
+        """
+        caps = ADBTools.get_capabilities(serial)
+        timestamp = time.time()
+        output = ADBTools.shell(caps.snapshot_command(groups), serial=serial, channel=channel)
+        sample = caps.parse_snapshot(output, timestamp)
+        ADBTools.update_cpu_load(sample, serial)
+        return sample
+
+    @staticmethod
+    @metrics.collector('get_power_samples')
+    def get_power_samples(serial=None, rate=power.DEFAULT_RATE, duration=1.0, channel='default'):
+        """在设备上按rate（次/秒）连续读取duration秒的current_now/voltage_now，一次往返返回全部读数
+
+        返回 [(时间, 电流mA, 电压V)]，单位和电流方向按探测时的校准换算；没有电池节点时返回[]。
+        """
+        caps = ADBTools.get_capabilities(serial)
+        if not caps.current_path:
+            return []
+        rate = max(power.MIN_RATE, min(power.MAX_RATE, rate))
+        count = max(1, int(round(rate * duration)))
+        command = power.build_sample_command(caps.current_path, caps.voltage_path, count, 1.0 / rate)
+        output = ADBTools.shell(command, timeout=duration + DEFAULT_TIMEOUT, serial=serial, channel=channel)
+        return power.parse_samples(output, time.time(), caps.battery_calibration)
+
+    @staticmethod
+    @metrics.collector('resolve_app')
+    def resolve_app(package, serial=None, channel='default'):
+        """查找应用的所有进程（包名及 包名:子进程）并缓存"""
+        output = ADBTools.shell(app_sampler.build_resolve_command(package), timeout=5, serial=serial,
+                                channel=channel)
+        _, pids, page_size = app_sampler.parse_resolve(output)
+        target = {'package': package, 'pids': pids, 'page_size': page_size, 'resolved_at': time.monotonic()}
+        ADBTools._app_targets[serial] = target
+        return target
+
+    @staticmethod
+    def update_app_load(sample, serial=None):
+        """根据与上一次读数的差值计算应用各进程、线程的CPU占用"""
+        ADBTools._prev_app_stats[serial] = app_sampler.compute_usage(sample, ADBTools._prev_app_stats.get(serial))
+
+    @staticmethod
+    @metrics.collector('get_app_sample')
+    def get_app_sample(package, serial=None, channel='default'):
+        """一次ADB往返读取目标应用所有进程的stat/statm和所有线程的stat，返回AppSample
+
+        进程只在包名变化、进程退出或定期（发现新的子进程）时重新查找，
+        不需要dumpsys meminfo或top，可以按推送周期持续采样。没有目标应用或应用未运行时返回None。
+        """
+        if not app_sampler.valid_package(package):
+            return None
+        target = ADBTools._app_targets.get(serial)
+        if target is None or target['package'] != package or time.monotonic() - target['resolved_at'] >= \
+                (APP_RESOLVE_INTERVAL if target['pids'] else APP_RETRY_INTERVAL):
+            target = ADBTools.resolve_app(package, serial, channel)
+        if not target['pids']:
+            return None
+        timestamp = time.time()
+        output = ADBTools.shell(app_sampler.build_sample_command(target['pids']), serial=serial, channel=channel)
+        sample = app_sampler.parse_sample(output, target['pids'], target['page_size'], package, timestamp)
+        if sample.missing:
+            # 进程已退出（应用重启或子进程结束），下次重新查找
+            ADBTools._app_targets.pop(serial, None)
+        ADBTools.update_app_load(sample, serial)
+        return sample
@@ -0,0 +1,323 @@
+import os
+import time
+import tempfile
+import threading
+import subprocess
+
+import frames
+import metrics
+import snapshot
+from adb_tools import ADBTools
+
+# 代理脚本及其运行状态在设备上的位置（/data/local/tmp对shell用户可写）
+AGENT_PATH = '/data/local/tmp/perf_agent.sh'
+AGENT_PID_PATH = '/data/local/tmp/perf_agent.pid'
+AGENT_LAYER_PATH = '/data/local/tmp/perf_agent.layer'
+
+# 默认采样频率（次/秒）和允许的最大频率
+DEFAULT_RATE = 10
+MAX_RATE = 20
+# 帧时间戳的读取间隔（秒），与主机轮询模式一致
+FRAME_INTERVAL = frames.POLL_INTERVAL
+# 输出流中断后的重启等待时间（秒），逐次翻倍直到上限
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 10.0
+
+# 记录格式：每条记录以 "@@r <序号>" 开始、"@@e" 结束，中间每行一项数据
+RECORD_MARK = '@@r '
+LATENCY_MARK = '@@l '
+END_MARK = '@@e'
+
+
+def build_agent_script(caps):
+    """根据探测结果生成设备端采样脚本，只读取可用的节点
+
+    节点用shell内建的read读取；每次采样只创建一个子进程（sleep，toybox中的外部命令），
+    使用SurfaceFlinger时每隔frame_every次采样再执行一次dumpsys，图层名由主机写入AGENT_LAYER_PATH。
+    """
+    lines = [
+        '# 性能监控采样代理，参数: <采样间隔秒数> <每隔几次采样读取一次帧数据>',
+        'exec 2>/dev/null',
+        f'echo $$ > {AGENT_PID_PATH}',
+        'interval=${1:-0.1}',
+        'frame_every=${2:-5}',
+        'n=0',
+        'while :; do',
+        f'  echo "{RECORD_MARK}$n"',
+        f'  while read -r l; do case $l in cpu[0-9]*) echo "$l";; cpu*) ;; *) break;; esac; done < {snapshot.PROC_STAT}',
+    ]
+    if caps.cpu_freq_glob():
+        lines.append(f'  for f in {caps.cpu_freq_glob()}; do read -r v < $f && '
+                     f'c=${{f#/sys/devices/system/cpu/cpu}} && echo "f ${{c%%/*}} $v"; done')
+    if caps.gpu_freq_path:
+        lines.append(f'  read -r v < {caps.gpu_freq_path} && echo "gf $v"')
+    if caps.gpu_load_path:
+        lines.append(f'  read -r v < {caps.gpu_load_path} && echo "gl $v"')
+    if caps.battery_path:
+        lines.append('  while read -r l; do case $l in '
+                     'POWER_SUPPLY_CURRENT_NOW=*|POWER_SUPPLY_VOLTAGE_NOW=*) echo "b $l";; '
+                     f'esac; done < {caps.battery_path}')
+    if caps.fps_method == 'surfaceflinger':
+        lines += [
+            f'  if [ $((n % frame_every)) -eq 0 ] && read -r layer < {AGENT_LAYER_PATH}; then',
+            f'    echo "{LATENCY_MARK}$layer"',
+            '    dumpsys SurfaceFlinger --latency "$layer"',
+            '  fi',
+        ]
+    lines += [
+        f'  echo "{END_MARK}"',
+        '  n=$((n + 1))',
+        '  sleep $interval',
+        'done',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class AgentRecord:
+    """代理输出的一条记录：一次采样的计数器，以及可选的帧时间戳数据"""
+    __slots__ = ('seq', 'snapshot', 'layer', 'latency')
+
+    def __init__(self, seq, timestamp):
+        self.seq = seq
+        self.snapshot = snapshot.PerfSnapshot(timestamp)
+        self.layer = None
+        self.latency = None  # SurfaceFlinger --latency 原始输出
+
+
+class AgentParser:
+    """流式解析代理输出，逐行送入，记录结束时返回完整的AgentRecord"""
+
+    def __init__(self, gpu_freq_unit=None, battery_calibration=None):
+        self.gpu_freq_unit = gpu_freq_unit
+        self.battery_calibration = battery_calibration
+        self._record = None
+        self._cpu_lines = []
+        self._battery = {}
+        self._latency = None
+
+    def feed(self, line, timestamp=None):
+        """送入一行输出（不含换行符），返回完成的记录或None
+
+        timestamp为收到该行的时间，默认为当前时间（回放抓包时传入抓取时间）。
+        """
+        if line.startswith(RECORD_MARK):
+            try:
+                seq = int(line[len(RECORD_MARK):])
+            except ValueError:
+                seq = None
+            self._record = AgentRecord(seq, timestamp if timestamp is not None else time.time())
+            self._cpu_lines = []
+            self._battery = {}
+            self._latency = None
+            return None
+
+        record = self._record
+        if record is None:
+            return None  # 丢弃第一条记录之前的残余输出
+        if line == END_MARK:
+            self._record = None
+            return self._finish(record)
+        if self._latency is not None:
+            self._latency.append(line)
+        elif line.startswith('cpu'):
+            self._cpu_lines.append(line)
+        elif line.startswith('f '):
+            parts = line.split()
+            if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+                record.snapshot.cpu_freq[int(parts[1])] = int(parts[2]) // 1000
+        elif line.startswith('gf '):
+            value = snapshot.parse_int(line[3:])
+            if value is not None:
+                record.snapshot.gpu_freq = snapshot.gpu_freq_to_mhz(value, self.gpu_freq_unit)
+        elif line.startswith('gl '):
+            record.snapshot.gpu_load = snapshot.parse_int(line[3:])
+        elif line.startswith('b '):
+            key, _, value = line[2:].partition('=')
+            self._battery[key.strip()] = value.strip()
+        elif line.startswith(LATENCY_MARK):
+            record.layer = line[len(LATENCY_MARK):]
+            self._latency = []
+        return None
+
+    def _finish(self, record):
+        record.snapshot.cpu_stat = snapshot.parse_proc_stat('\n'.join(self._cpu_lines))
+        if self._battery:
+            record.snapshot.battery = snapshot.battery_from_uevent(self._battery, self.battery_calibration)
+        if self._latency is not None:
+            record.latency = '\n'.join(self._latency)
+        return record
+
+
+# 设备端采样代理
+class DeviceAgent:
+    """把采样脚本推送到设备，在一条 `adb exec-out` 输出流上持续接收记录
+
+    采样循环在设备上运行，主机不再为每次采样发送命令，适合10~20Hz的高频采样。
+    对外提供与CollectorScheduler相同的 latest/stats/running 接口，
+    cpu/gpu/battery 三个分组返回同一条记录的快照。
+    停止时通过pid文件结束设备端脚本；即使主机异常退出，脚本也会在
+    下一次写入已关闭的输出流时因SIGPIPE退出。
+    """
+
+    def __init__(self, serial, rate=DEFAULT_RATE):
+        self.serial = serial
+        self.rate = max(1, min(MAX_RATE, int(rate or DEFAULT_RATE)))
+        self.frame_collector = None
+        self.records = 0
+        self.restarts = 0
+        self.errors = 0
+        self.last_error = None
+        self._caps = None
+        self._latest = None
+        self._proc = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """推送脚本并启动输出流，失败时抛出异常（调用方可回退到轮询模式）"""
+        if self._running:
+            return
+        self._caps = ADBTools.get_capabilities(self.serial)
+        self._kill_remote()
+        self._push(build_agent_script(self._caps))
+
+        # 前台图层仍由主机解析，代理只负责读取帧时间戳
+        if self._caps.fps_method == 'surfaceflinger':
+            self.frame_collector = ADBTools.create_frame_collector(
+                self.serial, method='agent', poll_interval=frames.FOCUS_INTERVAL)
+            self.frame_collector.on_layer = self._set_layer
+        elif self._caps.fps_method:
+            self.frame_collector = ADBTools.create_frame_collector(self.serial)
+        if self.frame_collector:
+            self.frame_collector.start()
+
+        self._running = True
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._running = False
+        if self.frame_collector:
+            self.frame_collector.stop()
+        self._kill_remote()
+        proc, self._proc = self._proc, None
+        if proc:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    def running(self):
+        return self._running
+
+    def latest(self, name):
+        """返回最近一条记录的快照和采样时间 (value, sampled_at)"""
+        with self._lock:
+            sample = self._latest
+        return sample, sample.timestamp if sample else None
+
+    def stats(self):
+        with self._lock:
+            sampled_at = self._latest.timestamp if self._latest else None
+        return {
+            'agent': {
+                'rate': self.rate,
+                'sampled_at': sampled_at,
+                'records': self.records,
+                'restarts': self.restarts,
+                'errors': self.errors,
+                'last_error': self.last_error
+            }
+        }
+
+    def _push(self, script):
+        # 脚本在设备上由sh执行，必须使用LF换行
+        fd, path = tempfile.mkstemp(suffix='.sh')
+        try:
+            with os.fdopen(fd, 'w', newline='\n') as f:
+                f.write(script)
+            subprocess.check_output([ADBTools.get_adb_path(), '-s', self.serial, 'push', path, AGENT_PATH],
+                                    stderr=subprocess.STDOUT)
+        finally:
+            os.remove(path)
+
+    def _kill_remote(self):
+        """结束设备上正在运行的代理（包括上一次异常退出遗留的）"""
+        try:
+            ADBTools.shell(f'kill $(cat {AGENT_PID_PATH}) 2>/dev/null; '
+                           f'rm -f {AGENT_PID_PATH} {AGENT_LAYER_PATH}; true',
+                           timeout=2, serial=self.serial)
+        except Exception as e:
+            print(f"[{self.serial}] 结束采样代理失败: {str(e)}")
+
+    def _set_layer(self, layer):
+        """前台图层变化时通知代理读取新图层"""
+        if layer:
+            command = f'echo {frames.quote_layer(layer)} > {AGENT_LAYER_PATH}'
+        else:
+            command = f'rm -f {AGENT_LAYER_PATH}'
+        try:
+            ADBTools.shell(command, timeout=2, serial=self.serial, channel='frames')
+        except Exception as e:
+            print(f"[{self.serial}] 更新代理图层失败: {str(e)}")
+
+    def _run(self):
+        delay = RESTART_DELAY
+        while self._running:
+            received = self.records
+            try:
+                self._stream()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"[{self.serial}] 采样代理异常: {str(e)}")
+            if not self._running:
+                break
+            if self.records > received:
+                delay = RESTART_DELAY
+            self.restarts += 1
+            metrics.inc('agent_restarts_total', serial=self.serial)
+            print(f"[{self.serial}] 采样代理输出中断，{delay}秒后重启")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    def _stream(self):
+        frame_every = max(1, int(round(FRAME_INTERVAL * self.rate)))
+        args = [ADBTools.get_adb_path(), '-s', self.serial, 'exec-out',
+                'sh', AGENT_PATH, f'{1.0 / self.rate:.3f}', str(frame_every)]
+        self._proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        # 重新开始的输出流与之前的/proc/stat读数不连续
+        ADBTools.reset_delta_state(self.serial)
+        parser = AgentParser(self._caps.gpu_freq_unit, self._caps.battery_calibration)
+        capture = ADBTools.get_capture(self.serial)
+        if capture:
+            capture.event(time.time(), 'agent_start')
+        proc = self._proc
+        for raw in iter(proc.stdout.readline, b''):
+            if not self._running:
+                break
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            if capture:
+                capture.agent_line(time.time(), line)
+            record = parser.feed(line)
+            if record is not None:
+                self._handle(record)
+        try:
+            proc.kill()
+            proc.wait(timeout=1)
+        except Exception:
+            pass
+
+    def _handle(self, record):
+        sample = record.snapshot
+        ADBTools.update_cpu_load(sample, self.serial)
+        with self._lock:
+            self._latest = sample
+            self.records += 1
+        metrics.inc('agent_records_total', serial=self.serial)
+        collector = self.frame_collector
+        # 图层切换前读取的数据属于旧图层，直接丢弃
+        if record.latency is not None and collector and record.layer == collector.layer:
+            collector.add_latency(record.latency)
+            collector.polled_at = sample.timestamp
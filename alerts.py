@@ -0,0 +1,450 @@
+import os
+import json
+import math
+import fnmatch
+import threading
+from collections import deque
+
+# 滑动窗口长度（秒）和分段数：窗口按段滑动，每段过期时整段移出，更新为O(1)，内存与采样频率无关
+WINDOW = 60.0
+SLOTS = 12
+# EWMA的时间常数（秒），按样本间隔换算平滑系数，不同采样频率下平滑程度相同
+EWMA_TAU = 5.0
+# 分位数草图的相对误差，以及每个指标最多保留的桶数（超出时合并最小的桶）
+SKETCH_ACCURACY = 0.01
+SKETCH_MAX_BINS = 512
+# 帧率低于目标帧率的该比例时计为掉帧样本
+FPS_BELOW_RATIO = 0.9
+DEFAULT_FPS_TARGET = 60
+# 内存中保留的最近告警事件数
+RECENT_EVENTS = 100
+
+STATS = ('value', 'ewma', 'min', 'max', 'mean', 'p50', 'p95', 'p99')
+OPERATORS = ('>', '<')
+SEVERITIES = ('info', 'warning', 'critical')
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alert_rules.json')
+
+# 默认规则：持续for秒越过threshold时触发，回到clear以内时解除（clear与threshold之间为回差，避免反复触发）
+DEFAULT_RULES = [
+    {'id': 'low_fps', 'metric': 'fps', 'stat': 'ewma', 'op': '<', 'threshold': 45, 'clear': 50, 'for': 3,
+     'severity': 'warning', 'message': '帧率过低'},
+    {'id': 'cpu_overload', 'metric': 'cpu_load', 'stat': 'ewma', 'op': '>', 'threshold': 85, 'clear': 75,
+     'for': 5, 'severity': 'warning', 'message': 'CPU平均负载过高'},
+    {'id': 'core_saturated', 'metric': 'cpu_load.core_*', 'stat': 'ewma', 'op': '>', 'threshold': 95,
+     'clear': 85, 'for': 10, 'severity': 'info', 'message': 'CPU核心持续满载'},
+    {'id': 'gpu_overload', 'metric': 'gpu_load', 'stat': 'ewma', 'op': '>', 'threshold': 90, 'clear': 80,
+     'for': 5, 'severity': 'warning', 'message': 'GPU负载过高'},
+    {'id': 'high_power', 'metric': 'power', 'stat': 'ewma', 'op': '>', 'threshold': 6000, 'clear': 5000,
+     'for': 10, 'severity': 'info', 'message': '功耗过高'},
+]
+
+# 按核心展开的指标，键为 <指标>.core_<编号>，同时给出所有核心的平均值
+CORE_METRICS = ('cpu_freq', 'cpu_load')
+SCALAR_METRICS = ('fps', 'gpu_freq', 'gpu_load', 'current', 'power')
+# 质量标记为这些值时不计入统计（第一次的CPU负载等估算值、过旧的读数）
+SKIPPED_QUALITY = ('estimated', 'stale', 'missing')
+
+
+class QuantileSketch:
+    """固定内存的近似分位数（对数分桶，相对误差SKETCH_ACCURACY），支持加入和移出计数
+
+    负值（充电时的电流和功率）按绝对值分桶单独存放，读取时按相反的顺序排在0和正值之前。
+    """
+    __slots__ = ('bins', 'negative', 'zero', 'count')
+
+    _gamma = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+    _log_gamma = math.log(_gamma)
+
+    def __init__(self):
+        self.bins = {}
+        self.negative = {}
+        self.zero = 0   # 等于0的值（负载为0等）
+        self.count = 0
+
+    @classmethod
+    def index(cls, value):
+        """值所在的桶：(1, 编号) 为正值，(-1, 编号) 为负值（按绝对值编号），0为None"""
+        if value == 0:
+            return None
+        return (1 if value > 0 else -1), math.ceil(math.log(abs(value)) / cls._log_gamma)
+
+    def _store(self, sign):
+        return self.bins if sign > 0 else self.negative
+
+    def add(self, index, count=1):
+        self.count += count
+        if index is None:
+            self.zero += count
+            return
+        sign, index = index
+        bins = self._store(sign)
+        bins[index] = bins.get(index, 0) + count
+        if len(bins) > SKETCH_MAX_BINS:
+            # 把绝对值最小的两个桶合并，精度只在最接近0的值上下降
+            lowest, second = sorted(bins)[:2]
+            bins[second] += bins.pop(lowest)
+
+    def merge(self, other, sign=1):
+        """加入（sign=-1时移出）另一个草图的计数"""
+        self.count += sign * other.count
+        self.zero += sign * other.zero
+        for bins, other_bins in ((self.bins, other.bins), (self.negative, other.negative)):
+            for index, count in other_bins.items():
+                remaining = bins.get(index, 0) + sign * count
+                if remaining > 0:
+                    bins[index] = remaining
+                else:
+                    bins.pop(index, None)
+
+    def _value(self, index):
+        # 桶的中点，相对误差不超过SKETCH_ACCURACY
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+    def quantile(self, q):
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # 负值从绝对值最大的桶开始
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if rank < seen:
+                return -self._value(index)
+        seen += self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return self._value(index)
+        if self.bins:
+            return self._value(max(self.bins))
+        if self.zero or not self.negative:
+            return 0.0
+        return -self._value(min(self.negative))
+
+
+class _Slot:
+    __slots__ = ('start', 'count', 'total', 'low', 'high', 'below', 'sketch')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.total = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.below = 0
+        self.sketch = QuantileSketch()
+
+
+class WindowStats:
+    """单个指标的流式统计：最新值、EWMA、滑动窗口内的min/max/均值/分位数，以及低于below的样本数
+
+    窗口由SLOTS段组成，按样本时间滑动（精度为一段的长度），
+    每次更新为O(1)，内存只与段数和草图桶数有关。
+    """
+
+    def __init__(self, window=WINDOW, slots=SLOTS, tau=EWMA_TAU, below=None):
+        self.slot_length = window / slots
+        self.tau = tau
+        self.below = below
+        self.value = None
+        self.ewma = None
+        self.updated_at = None
+        self.total_count = 0
+        self.total_below = 0
+        self._slots = deque(maxlen=slots)
+        self._sketch = QuantileSketch()
+
+    def add(self, timestamp, value):
+        if self.updated_at is not None and timestamp < self.updated_at:
+            return  # 乱序的样本
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            alpha = 1 - math.exp(-(timestamp - self.updated_at) / self.tau)
+            self.ewma += alpha * (value - self.ewma)
+        self.value = value
+        self.updated_at = timestamp
+        self.total_count += 1
+
+        slot = self._current_slot(timestamp)
+        slot.count += 1
+        slot.total += value
+        slot.low = min(slot.low, value)
+        slot.high = max(slot.high, value)
+        if self.below is not None and value < self.below:
+            slot.below += 1
+            self.total_below += 1
+        index = QuantileSketch.index(value)
+        slot.sketch.add(index)
+        self._sketch.add(index)
+
+    def _current_slot(self, timestamp):
+        start = math.floor(timestamp / self.slot_length) * self.slot_length
+        if self._slots and self._slots[-1].start == start:
+            return self._slots[-1]
+        self._expire(timestamp)
+        if len(self._slots) == self._slots.maxlen:
+            self._sketch.merge(self._slots[0].sketch, -1)
+        slot = _Slot(start)
+        self._slots.append(slot)
+        return slot
+
+    def _expire(self, timestamp):
+        # 移出已滑出窗口的段（设备暂停后恢复时可能一次移出多段）
+        window = self.slot_length * self._slots.maxlen
+        while self._slots and self._slots[0].start <= timestamp - window:
+            self._sketch.merge(self._slots.popleft().sketch, -1)
+
+    def stat(self, name):
+        """按名称取统计值（规则判定使用）"""
+        if name == 'value':
+            return self.value
+        if name == 'ewma':
+            return self.ewma
+        if name in ('p50', 'p95', 'p99'):
+            return self._sketch.quantile(int(name[1:]) / 100)
+        slots = [slot for slot in self._slots if slot.count]
+        if not slots:
+            return None
+        if name == 'min':
+            return min(slot.low for slot in slots)
+        if name == 'max':
+            return max(slot.high for slot in slots)
+        if name == 'mean':
+            return sum(slot.total for slot in slots) / sum(slot.count for slot in slots)
+        raise ValueError(f'未知的统计项: {name}')
+
+    def snapshot(self):
+        result = {name: _round(self.stat(name)) for name in STATS}
+        result['count'] = sum(slot.count for slot in self._slots)
+        result['window'] = _round(self.slot_length * len(self._slots))
+        if self.below is not None:
+            result['below'] = sum(slot.below for slot in self._slots)
+            result['below_total'] = self.total_below
+            result['total'] = self.total_count
+        return result
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def sample_values(data):
+    """从推送的样本中取参与统计的指标值，估算值和过旧的读数不计入"""
+    quality = data.get('quality') or {}
+    values = {}
+    for metric in SCALAR_METRICS:
+        if data.get(metric) is not None and quality.get(metric) not in SKIPPED_QUALITY:
+            values[metric] = data[metric]
+    for metric in CORE_METRICS:
+        cores = data.get(metric) or {}
+        if not cores or quality.get(metric) in SKIPPED_QUALITY:
+            continue
+        for core, value in cores.items():
+            if value is not None:
+                values[f'{metric}.{core}'] = value
+        present = [value for value in cores.values() if value is not None]
+        if present:
+            values[metric] = sum(present) / len(present)
+    app = data.get('app') or {}
+    if not app.get('estimated'):
+        for key in ('cpu', 'rss'):
+            if app.get(key) is not None:
+                values[f'app_{key}'] = app[key]
+    return values
+
+
+# 规则
+def validate_rules(rules):
+    """检查并规范化规则列表，格式错误时抛出ValueError"""
+    if not isinstance(rules, list):
+        raise ValueError('规则必须是列表')
+    normalized = []
+    ids = set()
+    for rule in rules:
+        if not isinstance(rule, dict):
+            raise ValueError('每条规则必须是对象')
+        rule_id = str(rule.get('id') or '').strip()
+        if not rule_id or rule_id in ids:
+            raise ValueError(f'规则id为空或重复: {rule_id}')
+        ids.add(rule_id)
+        if not rule.get('metric'):
+            raise ValueError(f'规则 {rule_id} 缺少metric')
+        stat = rule.get('stat', 'value')
+        op = rule.get('op', '>')
+        severity = rule.get('severity', 'warning')
+        if stat not in STATS or op not in OPERATORS or severity not in SEVERITIES:
+            raise ValueError(f'规则 {rule_id} 的stat/op/severity无效')
+        try:
+            threshold = float(rule['threshold'])
+            clear = float(rule.get('clear', threshold))
+            duration = float(rule.get('for', 0))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'规则 {rule_id} 的threshold/clear/for必须是数字')
+        if (op == '>' and clear > threshold) or (op == '<' and clear < threshold):
+            raise ValueError(f'规则 {rule_id} 的clear必须在threshold的恢复一侧')
+        normalized.append({'id': rule_id, 'metric': str(rule['metric']), 'stat': stat, 'op': op,
+                           'threshold': threshold, 'clear': clear, 'for': max(0.0, duration),
+                           'severity': severity, 'message': str(rule.get('message') or rule_id)})
+    return normalized
+
+
+def load_rules(path=RULES_PATH):
+    """读取规则文件，不存在或格式错误时使用默认规则"""
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return validate_rules(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"读取告警规则 {path} 失败，使用默认规则: {str(e)}")
+    return validate_rules(DEFAULT_RULES)
+
+
+def save_rules(rules, path=RULES_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rules, f, ensure_ascii=False, indent=2)
+
+
+class RuleSet:
+    """所有会话共用的规则，修改后各会话在下一个样本时生效"""
+
+    def __init__(self, rules=None):
+        self.rules = validate_rules(DEFAULT_RULES if rules is None else rules)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def update(self, rules):
+        rules = validate_rules(rules)
+        with self._lock:
+            self.rules = rules
+            self.version += 1
+        return rules
+
+
+# 告警引擎
+class AlertEngine:
+    """一个会话的流式统计和告警判定，样本到达时更新，返回状态变化产生的告警事件
+
+    每个 (规则, 指标) 的状态为 ok -> pending（越过阈值但未满for秒）-> firing -> ok，
+    触发和解除各产生一个事件。时间使用样本时间，回放抓包时得到相同的告警。
+    """
+
+    def __init__(self, serial, rule_set=None, fps_target=DEFAULT_FPS_TARGET):
+        self.serial = serial
+        self.rule_set = rule_set or RuleSet()
+        self.fps_target = fps_target
+        self.fired = 0
+        self._stats = {}
+        self._states = {}
+        self._matches = {}
+        self._version = None
+        self._recent = deque(maxlen=RECENT_EVENTS)
+        self._lock = threading.Lock()
+
+    def add(self, data):
+        timestamp = data['timestamp']
+        events = []
+        with self._lock:
+            for key, value in sample_values(data).items():
+                stats = self._stats.get(key)
+                if stats is None:
+                    below = self.fps_target * FPS_BELOW_RATIO if key == 'fps' else None
+                    stats = self._stats[key] = WindowStats(below=below)
+                stats.add(timestamp, value)
+            rules = self.rule_set.rules
+            if self._version != self.rule_set.version:
+                # 规则已修改：只保留仍存在且内容未变的规则的状态
+                self._version = self.rule_set.version
+                current = {rule['id']: rule for rule in rules}
+                self._states = {key: state for key, state in self._states.items()
+                                if current.get(key[0]) == state['rule']}
+                self._matches = {}
+            for rule in rules:
+                for key in self._match(rule):
+                    event = self._evaluate(rule, key, timestamp)
+                    if event:
+                        events.append(event)
+            self._recent.extend(events)
+        return events
+
+    def _match(self, rule):
+        pattern = rule['metric']
+        if not any(char in pattern for char in '*?['):
+            return (pattern,) if pattern in self._stats else ()
+        # 通配规则（如 cpu_load.core_*）按已出现的指标展开，指标集合变化时重新匹配
+        cached = self._matches.get(pattern)
+        if cached is None or cached[0] != len(self._stats):
+            cached = self._matches[pattern] = (len(self._stats), fnmatch.filter(self._stats, pattern))
+        return cached[1]
+
+    def _evaluate(self, rule, key, timestamp):
+        value = self._stats[key].stat(rule['stat'])
+        if value is None:
+            return None
+        state = self._states.get((rule['id'], key))
+        if state is None:
+            state = self._states[(rule['id'], key)] = {'rule': rule, 'state': 'ok', 'since': None}
+        if rule['op'] == '>':
+            breached, recovered = value > rule['threshold'], value <= rule['clear']
+        else:
+            breached, recovered = value < rule['threshold'], value >= rule['clear']
+
+        if state['state'] == 'firing':
+            if recovered:
+                state['state'] = 'ok'
+                return self._event(rule, key, 'resolved', value, timestamp, timestamp - state['since'])
+            return None
+        if not breached:
+            state['state'] = 'ok'
+            return None
+        if state['state'] == 'ok':
+            state['state'] = 'pending'
+            state['since'] = timestamp
+        if timestamp - state['since'] >= rule['for']:
+            state['state'] = 'firing'
+            self.fired += 1
+            return self._event(rule, key, 'firing', value, timestamp, timestamp - state['since'])
+        return None
+
+    def _event(self, rule, key, state, value, timestamp, duration):
+        return {
+            'serial': self.serial,
+            'rule': rule['id'],
+            'metric': key,
+            'stat': rule['stat'],
+            'state': state,
+            'severity': rule['severity'],
+            'message': rule['message'],
+            'value': _round(value),
+            'threshold': rule['threshold'] if state == 'firing' else rule['clear'],
+            'timestamp': timestamp,
+            'duration': _round(duration)
+        }
+
+    def active(self):
+        """正在触发的告警"""
+        with self._lock:
+            return [{'rule': rule_id, 'metric': key, 'since': state['since'], 'severity': state['rule']['severity'],
+                     'message': state['rule']['message']}
+                    for (rule_id, key), state in self._states.items() if state['state'] == 'firing']
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def snapshot(self):
+        """各指标的实时统计，按核心的指标在 cores 中"""
+        with self._lock:
+            metrics = {}
+            cores = {}
+            for key, stats in sorted(self._stats.items()):
+                metric, _, core = key.partition('.')
+                if core:
+                    cores.setdefault(metric, {})[core] = stats.snapshot()
+                else:
+                    metrics[key] = stats.snapshot()
+        return {'serial': self.serial, 'fps_target': self.fps_target, 'window': WINDOW,
+                'metrics': metrics, 'cores': cores, 'active': self.active(), 'fired': self.fired}
@@ -0,0 +1,441 @@
+import os
+import re
+from contextlib import closing
+
+import numpy as np
+
+import power
+import storage
+
+# 相邻样本的间隔超过中位间隔的多少倍时视为中断（暂停、断开、两次会话之间），按中位间隔计时
+GAP_FACTOR = 5.0
+# 从SQLite读取时每批的行数，逐批转换为数组
+LOAD_BATCH = 65536
+# 已结束的录制读取一次后把列数组缓存在录制文件旁边，之后直接加载（读取SQLite占分析耗时的大部分）
+CACHE_SUFFIX = '.columns.npz'
+# 频率驻留最多列出的频点数，超出时（频率不是离散频点）改为等宽分桶
+MAX_FREQUENCY_STATES = 64
+PERCENTILES = (1, 5, 50, 90, 95, 99)
+# CPU负载直方图的分桶（%）
+LOAD_BINS = np.linspace(0, 100, 11)
+# 帧率稳定度：帧率与中位数的偏差在该比例以内的时间占比
+FPS_STABLE_TOLERANCE = 0.1
+# 每种指标统计时保留的小数位数
+DIGITS = 3
+
+SCALAR_METRICS = ('fps', 'frame_time_p50', 'frame_time_p90', 'frame_time_p99',
+                  'gpu_load', 'gpu_freq', 'current', 'power', 'app_cpu', 'app_rss')
+# 对比多个会话时逐项计算差值的统计项（按核心的CPU负载在核心数一致时追加）
+COMPARE_KEYS = (
+    'duration',
+    'fps.time_weighted_mean', 'fps.p1', 'fps.p5', 'fps.std', 'fps.stability',
+    'frame_time_p90.p50', 'frame_time_p99.p50',
+    'jank.per_10min', 'jank.rate', 'big_jank.per_10min', 'big_jank.rate',
+    'cpu_load.average.time_weighted_mean', 'cpu_load.average.p95',
+    'cpu_freq.average.time_weighted_mean',
+    'gpu_load.time_weighted_mean', 'gpu_load.p95', 'gpu_freq.time_weighted_mean',
+    'current.time_weighted_mean', 'power.time_weighted_mean', 'power.p95',
+    'energy.energy_mwh', 'energy.charge_mah',
+    'power_trace.energy_mwh', 'power_trace.avg_power_mw', 'power_trace.peak_power_mw', 'power_trace.p99_power_mw',
+    'app_cpu.time_weighted_mean', 'app_cpu.p95', 'app_rss.time_weighted_mean', 'app_rss.max',
+)
+
+_CORE_COLUMN_RE = re.compile(r'^(cpu_freq|cpu_load)_(\d+)$')
+
+
+def _number(value, digits=DIGITS):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, digits)
+
+
+# 加载
+def cache_path(session_id, directory=storage.RECORDINGS_DIR):
+    return os.path.join(directory, f'{session_id}{CACHE_SUFFIX}')
+
+
+def load_session(session_id, start=None, end=None, directory=storage.RECORDINGS_DIR):
+    """把一个会话的录制读入列数组
+
+    返回 {'session_id', 'meta', 'timestamp', 'columns': {列名: 数组}, 'cores': [核心编号],
+    'cpu_load': (样本数, 核心数) 数组, 'cpu_freq': 同上, 'power': (读数数, 3) 的高频 (时间, 电流, 电压),
+    'marks': [能耗标记区间]}，空值为NaN。
+    """
+    with closing(storage.open_recording(session_id, directory)) as db:
+        meta = storage.recording_meta(db)
+        names, table, readings = _load_cache(session_id, directory)
+        if table is None:
+            columns = storage.select_columns(storage.recording_columns(db))
+            names = ['timestamp'] + columns
+            table = _read_table(db, columns, len(names))
+            readings = _read_power(db)
+            if 'stopped_at' in meta:
+                _save_cache(session_id, directory, names, table, readings)
+        marks = storage.read_events(db, 'power_mark')
+    if start is not None or end is not None:
+        table = _slice(table, start, end)
+        readings = _slice(readings, start, end)
+        marks = [mark for mark in marks if (start is None or mark['started_at'] >= start) and
+                 (end is None or (mark['stopped_at'] or mark['started_at']) <= end)]
+    data = _split_columns(session_id, meta, names, table)
+    data['power'] = readings
+    data['marks'] = marks
+    return data
+
+
+def _slice(table, start, end):
+    """按第一列（时间）截取 [start, end] 范围内的行"""
+    timestamp = table[:, 0]
+    first = np.searchsorted(timestamp, start, 'left') if start is not None else 0
+    last = np.searchsorted(timestamp, end, 'right') if end is not None else len(timestamp)
+    return table[first:last]
+
+
+def _read_table(db, columns, width):
+    cursor = storage.select_rows(db, columns)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(LOAD_BATCH)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=float))
+    return np.concatenate(chunks) if chunks else np.empty((0, width))
+
+
+def _read_power(db):
+    rows = storage.read_power(db)
+    chunks = []
+    while True:
+        batch = rows.fetchmany(LOAD_BATCH) if rows else []
+        if not batch:
+            break
+        chunks.append(np.array(batch, dtype=float))
+    return np.concatenate(chunks) if chunks else np.empty((0, 3))
+
+
+def _load_cache(session_id, directory):
+    """读取列缓存，缓存不存在、比录制文件旧或缺少高频读数（旧版本的缓存）时返回 (None, None, None)"""
+    path = cache_path(session_id, directory)
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(storage.recording_path(session_id, directory)):
+            return None, None, None
+        with np.load(path) as cached:
+            return [str(name) for name in cached['names']], cached['table'], cached['power']
+    except (OSError, KeyError, ValueError):
+        return None, None, None
+
+
+def _save_cache(session_id, directory, names, table, readings):
+    path = cache_path(session_id, directory)
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, names=np.array(names), table=table, power=readings)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"写入分析缓存 {path} 失败: {str(e)}")
+
+
+def _split_columns(session_id, meta, names, table):
+    data = {'session_id': session_id, 'meta': meta, 'timestamp': table[:, 0], 'columns': {}}
+    cores = {}
+    for index, name in enumerate(names[1:], 1):
+        match = _CORE_COLUMN_RE.match(name)
+        if match:
+            cores.setdefault(int(match.group(2)), {})[match.group(1)] = index
+        else:
+            data['columns'][name] = table[:, index]
+    data['cores'] = sorted(cores)
+    empty = np.full(len(table), np.nan)
+    for metric in storage.CORE_METRICS:
+        data[metric] = np.column_stack([table[:, cores[core][metric]] if metric in cores[core] else empty
+                                        for core in data['cores']]) if cores else np.empty((len(table), 0))
+    return data
+
+
+def merge_sessions(loaded):
+    """把多个已加载的会话按时间顺序拼接为一个（核心取并集，缺少的核心为NaN），用于长时间拷机的整体统计"""
+    loaded = sorted(loaded, key=lambda data: data['timestamp'][0] if len(data['timestamp']) else 0)
+    cores = sorted(set(core for data in loaded for core in data['cores']))
+    merged = {
+        'session_id': ','.join(data['session_id'] for data in loaded),
+        'meta': {'sessions': [data['meta'] for data in loaded]},
+        'timestamp': np.concatenate([data['timestamp'] for data in loaded]) if loaded else np.empty(0),
+        'columns': {},
+        'cores': cores
+    }
+    for name in SCALAR_METRICS + ('jank', 'big_jank'):
+        merged['columns'][name] = np.concatenate(
+            [data['columns'].get(name, np.full(len(data['timestamp']), np.nan)) for data in loaded]
+        ) if loaded else np.empty(0)
+    for metric in storage.CORE_METRICS:
+        parts = []
+        for data in loaded:
+            part = np.full((len(data['timestamp']), len(cores)), np.nan)
+            for index, core in enumerate(data['cores']):
+                part[:, cores.index(core)] = data[metric][:, index]
+            parts.append(part)
+        merged[metric] = np.concatenate(parts) if parts else np.empty((0, len(cores)))
+    merged['power'] = np.concatenate([data['power'] for data in loaded]) if loaded else np.empty((0, 3))
+    merged['marks'] = [mark for data in loaded for mark in data['marks']]
+    return merged
+
+
+# 统计
+def sample_weights(timestamp):
+    """每个样本代表的时长（秒）：到下一个样本的间隔，中断处和最后一个样本按中位间隔计"""
+    if len(timestamp) < 2:
+        return np.zeros(len(timestamp))
+    gaps = np.diff(timestamp)
+    typical = float(np.median(gaps))
+    gaps = np.where((gaps > typical * GAP_FACTOR) | (gaps < 0), typical, gaps)
+    return np.append(gaps, typical)
+
+
+def metric_stats(values, weights):
+    """一列数值的统计：样本均值、时间加权均值、标准差、分位数和有效时间占比，没有数据时返回None"""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return None
+    v = values[valid]
+    w = weights[valid]
+    total = w.sum()
+    stats = {
+        'count': int(valid.sum()),
+        'coverage': _number(total / weights.sum()) if weights.sum() > 0 else None,
+        'min': _number(v.min()),
+        'max': _number(v.max()),
+        'mean': _number(v.mean()),
+        'time_weighted_mean': _number((v * w).sum() / total) if total > 0 else _number(v.mean()),
+        'std': _number(v.std()),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(v, PERCENTILES)):
+        stats[f'p{p}'] = _number(value)
+    return stats
+
+
+def fps_stats(fps, weights):
+    """帧率统计，另含稳定度（帧率在中位数±10%以内的时间占比）和变异系数"""
+    stats = metric_stats(fps, weights)
+    if stats is None:
+        return None
+    valid = ~np.isnan(fps)
+    v = fps[valid]
+    w = weights[valid]
+    median = np.median(v)
+    stable = np.abs(v - median) <= median * FPS_STABLE_TOLERANCE
+    stats['stability'] = _number(w[stable].sum() / w.sum()) if w.sum() > 0 else None
+    stats['cv'] = _number(v.std() / v.mean()) if v.mean() > 0 else None
+    return stats
+
+
+def counter_increments(counter):
+    """累计计数列的逐样本增量；计数变小（采集器重启后从0开始）时取新值作为增量"""
+    valid = counter[~np.isnan(counter)]
+    if len(valid) < 2:
+        return np.zeros(0)
+    steps = np.diff(valid)
+    return np.where(steps < 0, valid[1:], steps)
+
+
+def jank_stats(counter, duration, frames):
+    total = float(counter_increments(counter).sum())
+    return {
+        'total': int(total),
+        'per_10min': _number(total / duration * 600) if duration > 0 else None,
+        # 按帧率积分估算的总帧数计算卡顿率
+        'rate': _number(total / frames, 6) if frames > 0 else None
+    }
+
+
+def load_histogram(values, weights):
+    """按时间加权的负载分布，返回各区间的时间占比"""
+    valid = ~np.isnan(values)
+    counts, _ = np.histogram(np.clip(values[valid], 0, 100), bins=LOAD_BINS, weights=weights[valid])
+    total = counts.sum()
+    return {
+        'bins': [_number(edge) for edge in LOAD_BINS],
+        'time': [_number(count / total, 4) if total > 0 else 0 for count in counts]
+    }
+
+
+def residency(values, weights):
+    """频率驻留：每个频点的时间占比，按频率升序返回 [[频率, 占比], ...]"""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return []
+    frequencies, inverse = np.unique(values[valid], return_inverse=True)
+    if len(frequencies) > MAX_FREQUENCY_STATES:
+        # 频率连续变化（如按负载换算的估算值）时按等宽区间统计，频率取区间下限
+        time, edges = np.histogram(values[valid], bins=MAX_FREQUENCY_STATES, weights=weights[valid])
+        frequencies = edges[:-1]
+    else:
+        time = np.bincount(inverse, weights=weights[valid])
+    total = time.sum()
+    return [[_number(frequency), _number(t / total, 4) if total > 0 else 0]
+            for frequency, t in zip(frequencies, time)]
+
+
+def core_stats(matrix, cores, weights, metric):
+    """所有核心平均值的统计，以及每个核心的统计和负载直方图/频率驻留"""
+    counts = (~np.isnan(matrix)).sum(axis=1)
+    average = np.where(counts > 0, np.nansum(matrix, axis=1) / np.maximum(counts, 1), np.nan)
+    result = {'average': metric_stats(average, weights), 'cores': {}}
+    for index, core in enumerate(cores):
+        column = matrix[:, index]
+        stats = metric_stats(column, weights)
+        if stats is None:
+            continue
+        if metric == 'cpu_load':
+            stats['histogram'] = load_histogram(column, weights)
+        else:
+            stats['residency'] = residency(column, weights)
+        result['cores'][f'core_{core}'] = stats
+    return result
+
+
+def energy_stats(current, power, weights):
+    """对电流（mA）和功率（mW）按时间积分，得到电量（mAh）和能耗（mWh/J）"""
+    result = {}
+    valid = ~np.isnan(power)
+    if valid.any():
+        energy = float((power[valid] * weights[valid]).sum()) / 3600
+        result['energy_mwh'] = _number(energy)
+        result['energy_j'] = _number(energy * 3.6)
+        result['coverage'] = _number(weights[valid].sum() / weights.sum()) if weights.sum() > 0 else None
+    valid = ~np.isnan(current)
+    if valid.any():
+        result['charge_mah'] = _number(float((current[valid] * weights[valid]).sum()) / 3600)
+    return result
+
+
+def power_trace_stats(readings):
+    """高频电流/电压读数的梯形积分（间隔超过power.MAX_GAP的空档不计入），以及平均、峰值和P99功率"""
+    if len(readings) < 2:
+        return None
+    timestamp, current, voltage = readings[:, 0], readings[:, 1], readings[:, 2]
+    watts = current * voltage
+    elapsed = np.diff(timestamp)
+    valid = (elapsed > 0) & (elapsed <= power.MAX_GAP)
+    duration = float(elapsed[valid].sum())
+    charge = float(((current[:-1] + current[1:]) / 2 * elapsed)[valid].sum()) / 3600
+    segments = valid & ~np.isnan(watts[:-1]) & ~np.isnan(watts[1:])
+    energy = float(((watts[:-1] + watts[1:]) / 2 * elapsed)[segments].sum()) / 3600
+    measured = watts[~np.isnan(watts)]
+    return {
+        'samples': int(len(readings)),
+        'rate': _number(len(readings) / duration, 1) if duration > 0 else None,
+        'duration': _number(duration),
+        'gaps': int((elapsed > power.MAX_GAP).sum()),
+        'energy_mwh': _number(energy, 4),
+        'energy_j': _number(energy * 3.6),
+        'charge_mah': _number(charge, 4),
+        'avg_power_mw': _number(energy * 3600 / duration, 2) if duration > 0 else None,
+        'avg_current_ma': _number(charge * 3600 / duration, 2) if duration > 0 else None,
+        'peak_power_mw': _number(measured.max(), 2) if len(measured) else None,
+        'p99_power_mw': _number(np.percentile(measured, 99), 2) if len(measured) else None,
+    }
+
+
+def mark_stats(marks):
+    """标记区间按名称汇总（键中的 "." 替换为 "_"，便于对比时按路径取值），同名区间依次加 #2、#3"""
+    result = {}
+    for mark in marks:
+        key = mark['name'].replace('.', '_')
+        suffix = 2
+        name = key
+        while name in result:
+            name = f'{key}#{suffix}'
+            suffix += 1
+        result[name] = {field: mark.get(field) for field in
+                        ('started_at', 'stopped_at', 'duration', 'energy_mwh', 'charge_mah', 'avg_power_mw',
+                         'avg_current_ma', 'peak_power_mw', 'samples')}
+    return result
+
+
+def summarize(data):
+    """对已加载（或合并）的会话做批量统计"""
+    timestamp = data['timestamp']
+    columns = data['columns']
+    empty = np.full(len(timestamp), np.nan)
+    weights = sample_weights(timestamp)
+    duration = float(weights.sum())
+    fps = columns.get('fps', empty)
+    valid_fps = ~np.isnan(fps)
+    frames = float((fps[valid_fps] * weights[valid_fps]).sum())
+
+    summary = {
+        'session_id': data['session_id'],
+        'serial': data['meta'].get('serial'),
+        'samples': int(len(timestamp)),
+        'start': _number(timestamp[0]) if len(timestamp) else None,
+        'end': _number(timestamp[-1]) if len(timestamp) else None,
+        # 有效时长（不含中断），单位秒
+        'duration': _number(duration),
+        'interval': _number(np.median(np.diff(timestamp))) if len(timestamp) > 1 else None,
+        'fps': fps_stats(fps, weights),
+        'jank': jank_stats(columns.get('jank', empty), duration, frames),
+        'big_jank': jank_stats(columns.get('big_jank', empty), duration, frames),
+        'cores': data['cores'],
+        'cpu_load': core_stats(data['cpu_load'], data['cores'], weights, 'cpu_load'),
+        'cpu_freq': core_stats(data['cpu_freq'], data['cores'], weights, 'cpu_freq'),
+        'energy': energy_stats(columns.get('current', empty), columns.get('power', empty), weights),
+        'power_trace': power_trace_stats(data.get('power', np.empty((0, 3)))),
+        'marks': mark_stats(data.get('marks', [])),
+    }
+    for name in SCALAR_METRICS[1:]:
+        summary[name] = metric_stats(columns.get(name, empty), weights)
+    if summary['gpu_freq'] is not None:
+        summary['gpu_freq']['residency'] = residency(columns['gpu_freq'], weights)
+    return summary
+
+
+def analyze(session_id, start=None, end=None, directory=storage.RECORDINGS_DIR):
+    """读取一个会话并返回统计结果"""
+    return summarize(load_session(session_id, start, end, directory))
+
+
+def analyze_sessions(session_ids, start=None, end=None, directory=storage.RECORDINGS_DIR):
+    """把多个会话（如一周的拷机录制）合并为一个时间序列统计"""
+    return summarize(merge_sessions([load_session(session_id, start, end, directory)
+                                     for session_id in session_ids]))
+
+
+# 对比
+def lookup(summary, key):
+    """按 'fps.p5' 形式的路径从统计结果中取值"""
+    value = summary
+    for part in key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(session_ids, directory=storage.RECORDINGS_DIR):
+    """并列对比多个会话，以第一个会话为基准计算每个统计项的差值和变化百分比"""
+    summaries = [analyze(session_id, directory=directory) for session_id in session_ids]
+    keys = list(COMPARE_KEYS)
+    core_sets = set(tuple(summary['cores']) for summary in summaries)
+    if len(core_sets) == 1:
+        for core in summaries[0]['cores']:
+            keys += [f'cpu_load.cores.core_{core}.time_weighted_mean', f'cpu_load.cores.core_{core}.p95']
+    # 各会话中都有的标记区间（同一测试场景）逐项对比能耗，是回归测试的主要指标
+    for name in summaries[0]['marks']:
+        if all(name in summary['marks'] for summary in summaries[1:]):
+            keys += [f'marks.{name}.energy_mwh', f'marks.{name}.avg_power_mw', f'marks.{name}.peak_power_mw']
+
+    table = []
+    for key in keys:
+        values = [lookup(summary, key) for summary in summaries]
+        if all(value is None for value in values):
+            continue
+        base = values[0]
+        row = {'metric': key, 'values': values, 'deltas': [], 'percent': []}
+        for value in values:
+            if value is None or base is None:
+                row['deltas'].append(None)
+                row['percent'].append(None)
+                continue
+            row['deltas'].append(_number(value - base))
+            row['percent'].append(_number((value - base) / abs(base) * 100, 2) if base else None)
+        table.append(row)
+    return {'baseline': session_ids[0] if session_ids else None, 'sessions': summaries, 'table': table}
@@ -0,0 +1,182 @@
+import re
+import time
+
+PID_MARK = '@@pid '
+PS_MARK = '@@ps'
+END_MARK = '@@end'
+UPTIME_PATH = '/proc/uptime'
+
+# /proc/<pid>/stat中的时间单位（USER_HZ），Android上固定为100
+CLK_TCK = 100
+DEFAULT_PAGE_SIZE = 4096
+# 输出CPU占用最高的线程数
+TOP_THREADS = 5
+
+# /proc/<pid>/stat 中 ")" 之后的字段下标
+_STATE = 0
+_UTIME = 11
+_STIME = 12
+_NUM_THREADS = 17
+
+_PACKAGE_RE = re.compile(r'^[A-Za-z][\w.]*$')
+
+
+class AppSample:
+    """一次读取目标应用所有进程和线程的结果，CPU占用由调用方根据上一次的累计时间计算"""
+    __slots__ = ('timestamp', 'package', 'uptime', 'processes', 'threads', 'missing', 'estimated')
+
+    def __init__(self, timestamp, package):
+        self.timestamp = timestamp
+        self.package = package
+        self.uptime = None    # 设备开机时长（秒），作为计算CPU占用的时间基准
+        self.processes = {}   # pid -> {'name', 'ticks', 'rss', 'threads', 'cpu'}，rss单位MB
+        self.threads = {}     # tid -> {'pid', 'name', 'ticks', 'cpu'}
+        self.missing = []     # 已退出的进程（需要重新查找pid）
+        self.estimated = False  # 没有上一次读数，CPU占用为0
+
+    def to_dict(self, top=TOP_THREADS):
+        """推送给网页的结构：应用总计、每个进程，以及CPU占用最高的几个线程"""
+        processes = [dict(process, pid=pid) for pid, process in sorted(self.processes.items())]
+        threads = sorted(self.threads.items(), key=lambda item: item[1]['cpu'], reverse=True)[:top]
+        return {
+            'package': self.package,
+            'cpu': round(sum(process['cpu'] for process in processes), 1),
+            'rss': round(sum(process['rss'] or 0 for process in processes), 1),
+            'threads': sum(process['threads'] or 0 for process in processes),
+            'processes': [{key: process[key] for key in ('pid', 'name', 'cpu', 'rss', 'threads')}
+                          for process in processes],
+            'top_threads': [{'tid': tid, 'pid': thread['pid'], 'name': thread['name'], 'cpu': thread['cpu']}
+                            for tid, thread in threads],
+            'estimated': self.estimated
+        }
+
+
+def valid_package(package):
+    """包名只能包含字母、数字、下划线和点（会拼接到设备端命令中）"""
+    return bool(package and _PACKAGE_RE.match(package))
+
+
+def build_resolve_command(package):
+    """一次往返读取内存页大小和进程列表（旧版本的toolbox ps不支持 -A -o）
+
+    包名随分隔行一起输出，抓包回放时只凭输出即可还原目标进程。
+    """
+    return (f'getconf PAGESIZE 2>/dev/null; echo "{PS_MARK} {package}"; '
+            f'ps -A -o PID,NAME 2>/dev/null || ps 2>/dev/null; echo {END_MARK}')
+
+
+def parse_resolve(output):
+    """从进程列表中找出应用的进程（包名本身和 包名:子进程），返回 (包名, {pid: 进程名}, 页大小)"""
+    head, _, table = output.partition(PS_MARK)
+    page_size = head.strip()
+    page_size = int(page_size) if page_size.isdigit() else DEFAULT_PAGE_SIZE
+    package, _, table = table.partition('\n')
+    package = package.strip()
+    pids = {}
+    for line in table.split('\n') if package else ():
+        parts = line.split()
+        if not parts:
+            continue
+        name = parts[-1]
+        if name != package and not name.startswith(package + ':'):
+            continue
+        # toybox: "PID NAME"；toolbox: "USER PID PPID VSIZE RSS WCHAN PC S NAME"
+        pid = next((part for part in parts[:-1] if part.isdigit()), None)
+        if pid is not None:
+            pids[int(pid)] = name
+    return package, pids, page_size
+
+
+def build_sample_command(pids):
+    """一次往返读取开机时长和每个进程的statm、stat以及所有线程的stat"""
+    pid_list = ' '.join(str(pid) for pid in sorted(pids))
+    return (f'cat {UPTIME_PATH}; for p in {pid_list}; do echo "{PID_MARK}$p"; '
+            f'cat /proc/$p/statm /proc/$p/stat /proc/$p/task/*/stat 2>/dev/null; done; echo {END_MARK}')
+
+
+def parse_stat(line):
+    """解析一行/proc/<pid>/stat，返回 (id, 名称, 状态, utime+stime, 线程数)
+
+    名称在括号中且可能包含空格和括号，以最后一个 ")" 分隔。
+    """
+    head, sep, tail = line.rpartition(')')
+    if not sep or ' (' not in head:
+        return None
+    id_text, _, name = head.partition(' (')
+    fields = tail.split()
+    if not id_text.strip().isdigit() or len(fields) <= _NUM_THREADS:
+        return None
+    try:
+        ticks = int(fields[_UTIME]) + int(fields[_STIME])
+        threads = int(fields[_NUM_THREADS])
+    except ValueError:
+        return None
+    return int(id_text), name, fields[_STATE], ticks, threads
+
+
+def parse_sample(output, pids, page_size, package, timestamp=None):
+    """解析build_sample_command的输出，pids为 {pid: 进程名}"""
+    sample = AppSample(timestamp or time.time(), package)
+    lines = output.split('\n')
+    if lines and lines[0].split():
+        try:
+            sample.uptime = float(lines[0].split()[0])
+        except ValueError:
+            pass
+    pid = None
+    expect = None
+    for line in lines[1:]:
+        if line.startswith(PID_MARK):
+            pid = int(line[len(PID_MARK):].strip())
+            expect = 'statm'
+            continue
+        if pid is None or line == END_MARK or not line.strip():
+            continue
+        if expect == 'statm':
+            expect = 'stat'
+            fields = line.split()
+            if len(fields) >= 2 and fields[1].isdigit():
+                rss = round(int(fields[1]) * page_size / 1048576, 1)
+                sample.processes[pid] = {'name': pids.get(pid), 'ticks': 0, 'rss': rss, 'threads': None, 'cpu': 0}
+                continue
+        parsed = parse_stat(line)
+        if parsed is None:
+            continue
+        stat_id, name, _, ticks, threads = parsed
+        if expect == 'stat' and stat_id == pid:
+            expect = 'task'
+            process = sample.processes.setdefault(
+                pid, {'name': pids.get(pid), 'ticks': 0, 'rss': None, 'threads': None, 'cpu': 0})
+            process['ticks'] = ticks
+            process['threads'] = threads
+        else:
+            sample.threads[stat_id] = {'pid': pid, 'name': name, 'ticks': ticks, 'cpu': 0}
+    sample.missing = [pid for pid in pids if pid not in sample.processes]
+    return sample
+
+
+def compute_usage(sample, prev):
+    """根据与上一次读数的累计时间差计算每个进程和线程的CPU占用（100%为一个核心跑满，与top一致）
+
+    prev为上一次返回的状态（没有时为None），返回新的状态供下一次计算。
+    """
+    state = {
+        'package': sample.package,
+        'uptime': sample.uptime,
+        'processes': {pid: process['ticks'] for pid, process in sample.processes.items()},
+        'threads': {tid: thread['ticks'] for tid, thread in sample.threads.items()}
+    }
+    if not prev or prev['package'] != sample.package or prev['uptime'] is None or sample.uptime is None:
+        sample.estimated = True
+        return state
+    elapsed = (sample.uptime - prev['uptime']) * CLK_TCK
+    if elapsed <= 0:
+        sample.estimated = True
+        return state
+    for key, items in (('processes', sample.processes), ('threads', sample.threads)):
+        previous = prev[key]
+        for item_id, item in items.items():
+            # 新出现的进程/线程（pid复用时累计时间可能变小）没有可比较的读数，占用记为0
+            delta = item['ticks'] - previous.get(item_id, item['ticks'])
+            item['cpu'] = round(100.0 * max(0, delta) / elapsed, 1)
+    return state
@@ -0,0 +1,378 @@
+import os
+import re
+import json
+import time
+import zlib
+import threading
+
+import agent
+import alerts
+import power
+import probe
+import app_sampler
+import frames
+import storage
+from adb_tools import ADBTools
+
+CAPTURE_VERSION = 1
+# 抓包文件的扩展名，与同一会话的录制文件放在同一目录
+CAPTURE_SUFFIX = '.capture.gz'
+# 缓冲的数据每隔多少秒压缩写入一次（同步刷新，进程异常退出时已写入的部分仍可读取）
+FLUSH_INTERVAL = 1.0
+READ_CHUNK = 256 * 1024
+# 循环回放时两轮之间的最小间隔（秒），避免样本很少的抓包空转
+MIN_LOOP_GAP = 0.1
+
+# 每行一个JSON数组，第二项为类型：
+#   [t, 'd', 命令编号, 命令]                       命令第一次出现时定义编号，之后只写编号
+#   [t, 'c', 通道, 采集方法, 命令编号, 返回码, 输出, 耗时]  一条shell命令的原始输出，t为发送时间
+#   [t, 'a', 行]                                  采样代理输出的一行
+#   [t, 'e', 事件]                                 reset（采集器重启）/ agent_start（代理输出流重启）
+#   [t, 't']                                      监控循环推送了一个样本
+# 第一行为文件头 {"version", "serial", "started_at", ...}
+
+
+def capture_path(session_id, directory=storage.RECORDINGS_DIR):
+    return os.path.join(directory, f'{session_id}{CAPTURE_SUFFIX}')
+
+
+# 原始输出抓包
+class CaptureWriter:
+    """把设备命令的原始输出追加写入gzip压缩的JSON行文件
+
+    压缩流在每次写入时做同步刷新而不是结束，文件始终可以读取到最近一次写入为止，
+    重复出现的命令只保存一次，输出本身高度重复，压缩后体积很小。
+    """
+
+    def __init__(self, path, serial, meta=None):
+        self.path = path
+        self.serial = serial
+        self.entries = 0
+        self.closed = False
+        self._commands = {}
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'wb')
+        header = {'version': CAPTURE_VERSION, 'serial': serial, 'started_at': time.time()}
+        header.update(meta or {})
+        self._write(header)
+
+    def command(self, timestamp, channel, collector, command, code, output, duration=0):
+        with self._lock:
+            if self.closed:
+                return
+            command_id = self._commands.get(command)
+            if command_id is None:
+                command_id = self._commands[command] = len(self._commands)
+                self._write([round(timestamp, 4), 'd', command_id, command])
+            self._write([round(timestamp, 4), 'c', channel, collector, command_id, code, output,
+                         round(duration, 4)])
+
+    def agent_line(self, timestamp, line):
+        with self._lock:
+            if not self.closed:
+                self._write([round(timestamp, 4), 'a', line])
+
+    def event(self, timestamp, name):
+        with self._lock:
+            if not self.closed:
+                self._write([round(timestamp, 4), 'e', name])
+
+    def tick(self, timestamp):
+        with self._lock:
+            if not self.closed:
+                self._write([round(timestamp, 4), 't'])
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._flush()
+            self._file.write(self._compressor.flush())
+            self._file.close()
+
+    def _write(self, entry):
+        self._buffer.append(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.entries += 1
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if self._buffer:
+            data = self._compressor.compress(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+            self._file.write(data + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self._file.flush()
+
+
+def iter_capture(path):
+    """逐行读取抓包文件，返回 (文件头, 条目生成器)；未正常结束的文件读取到最后一个完整行为止"""
+    def lines():
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        pending = b''
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                try:
+                    pending += decompressor.decompress(chunk)
+                except zlib.error as e:
+                    print(f"抓包文件 {path} 已损坏，读取到此为止: {str(e)}")
+                    break
+                *complete, pending = pending.split(b'\n')
+                for line in complete:
+                    yield line
+        if pending:
+            yield pending
+
+    entries = (json.loads(line) for line in lines() if line)
+    header = next(entries, None)
+    if not isinstance(header, dict):
+        raise ValueError(f'不是有效的抓包文件: {path}')
+    return header, entries
+
+
+def list_captures(directory=storage.RECORDINGS_DIR):
+    """列出目录中的抓包文件（会话ID、设备、开始时间、大小）"""
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(CAPTURE_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            header, _ = iter_capture(path)
+        except (OSError, ValueError) as e:
+            print(f"读取抓包 {name} 失败: {str(e)}")
+            continue
+        captures.append({
+            'capture_id': name[:-len(CAPTURE_SUFFIX)],
+            'serial': header.get('serial'),
+            'started_at': header.get('started_at'),
+            'mode': header.get('mode'),
+            'interval': header.get('interval'),
+            'size': os.path.getsize(path)
+        })
+    return captures
+
+
+def open_capture(capture_id, directory=storage.RECORDINGS_DIR):
+    """抓包文件路径，不存在时抛出FileNotFoundError"""
+    path = capture_path(capture_id, directory)
+    if not re.match(r'^[\w.-]+$', capture_id) or not os.path.exists(path):
+        raise FileNotFoundError(f'抓包不存在: {capture_id}')
+    return path
+
+
+# 回放
+class Replay:
+    """把抓包中的原始输出按原顺序送入与实时采集相同的解析器，每个推送点生成一个样本
+
+    快照由探测结果（DeviceCapabilities.parse_snapshot）解析，CPU负载由ADBTools的增量计算得到，
+    目标应用的进程/线程由app_sampler解析，电流/电压批次由power解析，帧数据由FrameCollector.feed解析，
+    代理输出由AgentParser解析，样本由build_performance_data合并，因此修正解析器后重新回放即可得到修正后的指标。
+    对外提供与CollectorScheduler相同的latest接口。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header, _ = iter_capture(path)
+        self.serial = self.header.get('serial')
+        self.samples_count = 0
+        # 增量计算状态使用独立的键，不影响同一设备的实时采集
+        self._delta_key = f'replay:{id(self)}'
+        self._reset()
+
+    def _reset(self):
+        self.caps = None
+        self.frame_collector = None
+        self._app_target = None
+        self._latest = {}
+        self._agent_parser = None
+        ADBTools.reset_delta_state(self._delta_key)
+
+    def latest(self, name):
+        return self._latest.get(name, (None, None))
+
+    def samples(self):
+        """按顺序生成所有样本（与实时推送的数据结构相同），不等待"""
+        from session import build_performance_data
+
+        self._reset()
+        self.samples_count = 0
+        header, entries = iter_capture(self.path)
+        commands = {}
+        try:
+            for entry in entries:
+                timestamp, kind = entry[0], entry[1]
+                if kind == 't':
+                    frame_info = self._frame_info()
+                    self.samples_count += 1
+                    yield build_performance_data(self.serial, self, frame_info, now=timestamp, power_collector=self)
+                elif kind == 'c':
+                    _, _, channel, collector, command_id, code, output, duration = entry
+                    self._command(timestamp, channel, collector, commands.get(command_id, ''), code, output,
+                                  timestamp + duration)
+                elif kind == 'a':
+                    self._agent_line(timestamp, entry[2])
+                elif kind == 'd':
+                    commands[entry[2]] = entry[3]
+                elif kind == 'e':
+                    if entry[2] == 'reset':
+                        ADBTools.reset_delta_state(self._delta_key)
+                    elif entry[2] == 'agent_start':
+                        ADBTools.reset_delta_state(self._delta_key)
+                        self._agent_parser = None
+        finally:
+            ADBTools.reset_delta_state(self._delta_key)
+
+    def _frame_info(self):
+        if self.frame_collector is None:
+            return {}
+        return self.frame_collector.latest()
+
+    def _command(self, timestamp, channel, collector, command, code, output, received_at):
+        if collector == 'probe_device':
+            self.caps = probe.parse_probe(output, self.serial)
+            method = self.header.get('mode') == 'agent' and self.caps.fps_method == 'surfaceflinger'
+            self.frame_collector = frames.FrameCollector(
+                None, method='agent' if method else (self.caps.fps_method or 'surfaceflinger'))
+        elif code != 0 or self.caps is None:
+            return
+        elif collector == 'get_snapshot':
+            sample = self.caps.parse_snapshot(output, timestamp)
+            ADBTools.update_cpu_load(sample, self._delta_key)
+            # 轮询模式下每个分组使用同名的shell通道，default通道读取全部分组
+            groups = (channel,) if channel in ('cpu', 'gpu', 'battery') else ('cpu', 'gpu', 'battery')
+            for group in groups:
+                self._latest[group] = (sample, timestamp)
+        elif collector == 'get_power_samples':
+            readings = power.parse_samples(output, received_at, self.caps.battery_calibration)
+            if readings:
+                self._latest['power'] = (power.summarize_batch(readings), readings[-1][0])
+        elif collector == 'resolve_app':
+            self._app_target = app_sampler.parse_resolve(output)
+        elif collector == 'get_app_sample' and self._app_target:
+            package, pids, page_size = self._app_target
+            sample = app_sampler.parse_sample(output, pids, page_size, package, timestamp)
+            ADBTools.update_app_load(sample, self._delta_key)
+            self._latest['app'] = (sample, timestamp)
+        elif collector == 'frames' and self.frame_collector:
+            # 帧统计以收到输出的时间推算设备当前时间，与实时采集一致
+            self.frame_collector.feed(command, output, int(received_at * 1e9))
+            self.frame_collector.polled_at = received_at
+
+    def _agent_line(self, timestamp, line):
+        if self.caps is None:
+            return
+        if self._agent_parser is None:
+            self._agent_parser = agent.AgentParser(self.caps.gpu_freq_unit, self.caps.battery_calibration)
+        record = self._agent_parser.feed(line, timestamp)
+        if record is None:
+            return
+        sample = record.snapshot
+        ADBTools.update_cpu_load(sample, self._delta_key)
+        for group in ('cpu', 'gpu', 'battery'):
+            self._latest[group] = (sample, sample.timestamp)
+        collector = self.frame_collector
+        if record.latency is not None and collector and record.layer == collector.layer:
+            collector.add_latency(record.latency, int(timestamp * 1e9))
+            collector.polled_at = sample.timestamp
+
+
+def reprocess(capture_id, directory=storage.RECORDINGS_DIR, rule_set=None):
+    """以最快速度回放抓包并写入一个新的录制（按rule_set重新判定告警），返回新录制的会话ID和耗时"""
+    replay = Replay(open_capture(capture_id, directory))
+    session_id = storage.new_session_id(f'{replay.serial}_replay', directory)
+    recorder = storage.SessionRecorder(
+        session_id, replay.serial, meta={'source_capture': capture_id, 'replayed_at': time.time()},
+        directory=directory, ring_size=1)
+    engine = alerts.AlertEngine(replay.serial, rule_set)
+    started = time.monotonic()
+    try:
+        for data in replay.samples():
+            recorder.append(data)
+            for event in engine.add(data):
+                recorder.record_event('alert', event['timestamp'], event)
+    finally:
+        recorder.close()
+    return {'session_id': session_id, 'samples': replay.samples_count, 'alerts': engine.fired,
+            'seconds': round(time.monotonic() - started, 3)}
+
+
+class ReplayRunner:
+    """按原始节奏（可加速）把回放的样本推送给网页，可循环播放，用作可复现的服务器负载源
+
+    publish(serial, event, data) 与DeviceSession相同，serial为推送时使用的设备名。
+    """
+
+    def __init__(self, capture_id, publish, serial=None, speed=1.0, loop=False, directory=storage.RECORDINGS_DIR):
+        self.capture_id = capture_id
+        self.replay = Replay(open_capture(capture_id, directory))
+        self.publish = publish
+        self.serial = serial or f'replay:{capture_id}'
+        self.speed = max(0.01, float(speed))
+        self.loop = loop
+        self._loop_gap = self._tick_interval() / self.speed if loop else 0
+        self.published = 0
+        self.running = False
+        self._stop_event = threading.Event()
+
+    def _tick_interval(self):
+        """抓包中样本的平均间隔（秒），样本少于2个时无法循环回放，抛出ValueError"""
+        _, entries = iter_capture(self.replay.path)
+        ticks = [entry[0] for entry in entries if entry[1] == 't']
+        if len(ticks) < 2:
+            raise ValueError(f'抓包 {self.capture_id} 的样本少于2个，不能循环回放')
+        return (ticks[-1] - ticks[0]) / (len(ticks) - 1)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._stop_event.clear()
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+
+    def stats(self):
+        return {'capture_id': self.capture_id, 'serial': self.serial, 'speed': self.speed,
+                'loop': self.loop, 'running': self.running, 'published': self.published}
+
+    def _run(self):
+        try:
+            while self.running:
+                first = None
+                started = time.monotonic()
+                for data in self.replay.samples():
+                    if first is None:
+                        first = data['timestamp']
+                    # 按原始时间间隔（除以倍速）推送
+                    delay = (data['timestamp'] - first) / self.speed - (time.monotonic() - started)
+                    if delay > 0 and self._stop_event.wait(delay):
+                        return
+                    if not self.running:
+                        return
+                    data['serial'] = self.serial
+                    self.publish(self.serial, 'performance_data', data)
+                    self.published += 1
+                if not self.loop:
+                    break
+                # 最后一个样本与下一轮第一个样本之间按原始间隔等待
+                if self._stop_event.wait(max(self._loop_gap, MIN_LOOP_GAP)):
+                    return
+        except Exception as e:
+            print(f"回放抓包 {self.capture_id} 失败: {str(e)}")
+        finally:
+            self.running = False
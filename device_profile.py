@@ -0,0 +1,137 @@
+import re
+import time
+
+import probe
+
+PROFILE_MARK = '@@profile '
+CPU_DIR = '/sys/devices/system/cpu'
+
+# 设备信息使用的属性，值为 (字段名, 属性名候选列表)
+PROFILE_PROPS = (
+    ('model', ('ro.product.model',)),
+    ('brand', ('ro.product.brand',)),
+    ('manufacturer', ('ro.product.manufacturer',)),
+    ('device', ('ro.product.device',)),
+    ('os_version', ('ro.build.version.release',)),
+    ('api_level', ('ro.build.version.sdk',)),
+    ('abi', ('ro.product.cpu.abi',)),
+    ('soc', ('ro.soc.model', 'ro.board.platform', 'ro.hardware')),
+    ('fingerprint', ('ro.build.fingerprint',)),
+)
+
+_PROP_NAMES = dict(PROFILE_PROPS)
+_PROP_RE = re.compile(r'^\[([^\]]+)\]: \[(.*)\]$')
+
+
+class DeviceProfile:
+    """一台设备的静态信息：系统属性、CPU核心数、簇划分和各核心的频率范围，连接时读取一次后按序列号缓存"""
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.fetched_at = None
+        self.properties = {}
+        self.cpu_cores = 0
+        # [{'core', 'min_freq', 'max_freq', 'cluster'}]，频率单位MHz
+        self.cores = []
+        # [{'cores', 'min_freq', 'max_freq'}]，按第一个核心编号排序
+        self.clusters = []
+
+    def prop(self, field):
+        """按PROFILE_PROPS中的候选属性取第一个非空值"""
+        for name in _PROP_NAMES.get(field, ()):
+            if self.properties.get(name):
+                return self.properties[name]
+        return None
+
+    def core_indexes(self):
+        """核心编号列表；读不到簇信息时按核心数推算"""
+        if self.cores:
+            return [core['core'] for core in self.cores]
+        return list(range(self.cpu_cores))
+
+    def device_info(self):
+        """与原get_device_info相同的字段（型号为品牌+型号）"""
+        model = ' '.join(value for value in (self.prop('brand'), self.prop('model')) if value)
+        return {
+            'model': model or '未知',
+            'os_version': self.prop('os_version') or '未知',
+            'api_level': self.prop('api_level') or '未知'
+        }
+
+    def to_dict(self):
+        result = {field: self.prop(field) for field, _ in PROFILE_PROPS}
+        result.update({
+            'serial': self.serial,
+            'fetched_at': self.fetched_at,
+            'cpu_cores': self.cpu_cores,
+            'cores': [dict(core) for core in self.cores],
+            'clusters': [dict(cluster) for cluster in self.clusters]
+        })
+        return result
+
+
+def build_profile_command():
+    """一次往返读取全部系统属性、CPU核心数和每个核心的频率范围、所在的簇"""
+    return (
+        f'getprop; '
+        f'echo "{PROFILE_MARK}possible $(cat {probe.CPU_POSSIBLE_PATH} 2>/dev/null)"; '
+        f'for d in {CPU_DIR}/cpu[0-9]*; do '
+        f'echo "{PROFILE_MARK}core ${{d##*/cpu}}|$(cat $d/cpufreq/cpuinfo_min_freq 2>/dev/null)|'
+        f'$(cat $d/cpufreq/cpuinfo_max_freq 2>/dev/null)|$(cat $d/cpufreq/related_cpus 2>/dev/null)"; '
+        f'done'
+    )
+
+
+def parse_getprop(output):
+    """解析getprop的 "[名称]: [值]" 输出为字典"""
+    properties = {}
+    for line in output.split('\n'):
+        match = _PROP_RE.match(line.strip())
+        if match:
+            properties[match.group(1)] = match.group(2)
+    return properties
+
+
+def _khz_to_mhz(value):
+    value = value.strip()
+    return int(value) // 1000 if value.isdigit() else None
+
+
+def parse_profile(output, serial):
+    """解析build_profile_command的输出，返回DeviceProfile"""
+    profile = DeviceProfile(serial)
+    profile.fetched_at = time.time()
+    profile.properties = parse_getprop(output)
+
+    related = {}
+    for line in output.split('\n'):
+        if not line.startswith(PROFILE_MARK):
+            continue
+        kind, _, value = line[len(PROFILE_MARK):].partition(' ')
+        if kind == 'possible':
+            profile.cpu_cores = probe.parse_cpu_possible(value.strip())
+        elif kind == 'core':
+            fields = value.split('|')
+            if len(fields) != 4 or not fields[0].isdigit():
+                continue
+            core = int(fields[0])
+            profile.cores.append({'core': core, 'min_freq': _khz_to_mhz(fields[1]),
+                                  'max_freq': _khz_to_mhz(fields[2]), 'cluster': None})
+            # related_cpus为同一调频策略（簇）中的核心；读不到时按最高频率分组
+            related[core] = fields[3].strip() or f'max:{fields[2].strip()}'
+    profile.cores.sort(key=lambda core: core['core'])
+    if not profile.cpu_cores:
+        profile.cpu_cores = len(profile.cores)
+
+    groups = {}
+    for core in profile.cores:
+        groups.setdefault(related[core['core']], []).append(core)
+    for index, members in enumerate(sorted(groups.values(), key=lambda members: members[0]['core'])):
+        for core in members:
+            core['cluster'] = index
+        profile.clusters.append({
+            'cores': [core['core'] for core in members],
+            'min_freq': min((core['min_freq'] for core in members if core['min_freq']), default=None),
+            'max_freq': max((core['max_freq'] for core in members if core['max_freq']), default=None)
+        })
+    return profile
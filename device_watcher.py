@@ -0,0 +1,145 @@
+import time
+import threading
+import subprocess
+
+# track-devices进程退出后的重启等待时间（秒），逐次翻倍直到上限
+RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 10.0
+
+
+def parse_device_list(payload):
+    """解析track-devices的一帧数据，返回 {序列号: 状态}"""
+    devices = {}
+    for line in payload.split('\n'):
+        if '\t' in line:
+            serial, state = line.split('\t', 1)
+            devices[serial.strip()] = state.strip()
+    return devices
+
+
+# 设备在线状态跟踪
+class DeviceWatcher:
+    """通过一个常驻的 `adb track-devices` 进程跟踪设备的连接和断开
+
+    adb server在设备列表变化时主动推送，每帧为4位十六进制长度加设备列表。
+    设备状态保存在内存表中，监控循环查询在线状态不需要任何进程或往返；
+    状态变化时回调监听器 listener(serial, old_state, new_state)。
+    """
+
+    def __init__(self, adb_path):
+        # adb_path为返回adb可执行文件路径的函数
+        self.adb_path = adb_path
+        self._devices = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._running = False
+        self._proc = None
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._running = False
+        proc, self._proc = self._proc, None
+        if proc:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    def wait_ready(self, timeout=None):
+        """等待收到第一份设备列表"""
+        return self._ready.wait(timeout)
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def devices(self):
+        """返回 {序列号: 状态} 的副本"""
+        with self._lock:
+            return dict(self._devices)
+
+    def online_devices(self):
+        with self._lock:
+            return [serial for serial, state in self._devices.items() if state == 'device']
+
+    def is_online(self, serial):
+        with self._lock:
+            return self._devices.get(serial) == 'device'
+
+    def _run(self):
+        delay = RESTART_DELAY
+        while self._running:
+            started = time.monotonic()
+            try:
+                self._track()
+            except Exception as e:
+                print(f"设备跟踪异常: {str(e)}")
+            if not self._running:
+                break
+            # 进程退出时不清空设备表，重启后的第一帧会给出完整列表
+            if time.monotonic() - started > MAX_RESTART_DELAY:
+                delay = RESTART_DELAY
+            print(f"adb track-devices 已退出，{delay}秒后重启")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    def _track(self):
+        self._proc = subprocess.Popen(
+            [self.adb_path(), 'track-devices'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0
+        )
+        stream = self._proc.stdout
+        while self._running:
+            header = self._read_exact(stream, 4)
+            if header is None:
+                break
+            length = int(header, 16)
+            payload = self._read_exact(stream, length) if length else b''
+            if payload is None:
+                break
+            self._update(parse_device_list(payload.decode('utf-8', 'replace')))
+        proc, self._proc = self._proc, None
+        if proc:
+            try:
+                proc.kill()
+                proc.wait(timeout=1)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _read_exact(stream, size):
+        data = b''
+        while len(data) < size:
+            chunk = stream.read(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _update(self, devices):
+        with self._lock:
+            previous = self._devices
+            self._devices = devices
+        self._ready.set()
+        for serial in set(previous) | set(devices):
+            old_state = previous.get(serial)
+            new_state = devices.get(serial)
+            if old_state == new_state:
+                continue
+            for listener in self._listeners:
+                try:
+                    listener(serial, old_state, new_state)
+                except Exception as e:
+                    print(f"设备状态回调失败: {str(e)}")
@@ -0,0 +1,121 @@
+import io
+import csv
+import json
+import time
+import zlib
+import zipfile
+from contextlib import closing
+
+import storage
+
+# 支持的导出格式及对应的文件扩展名和MIME类型
+FORMATS = {
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+}
+# 每积累多少字节输出一次，避免逐行产生过多的小块
+CHUNK_SIZE = 64 * 1024
+
+
+def format_time(timestamp):
+    """本地时间字符串（精确到毫秒），便于在表格软件中查看"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) + f'.{int(timestamp * 1000) % 1000:03d}'
+
+
+def iter_csv(db, columns, start=None, end=None):
+    """逐块生成CSV文本，带BOM以便Excel正确识别UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    buffer.write('\ufeff')
+    writer.writerow(['time', 'timestamp'] + list(columns))
+    for row in storage.iter_rows(db, columns, start, end):
+        writer.writerow([format_time(row[0])] + ['' if value is None else value for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(db, columns, start=None, end=None):
+    """逐块生成NDJSON，每行一个样本，与实时推送的数据结构相同"""
+    names = ['timestamp'] + list(columns)
+    lines = []
+    size = 0
+    for row in storage.iter_rows(db, columns, start, end):
+        line = json.dumps(storage.unflatten_sample(dict(zip(names, row))), ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    yield ''.join(lines)
+
+
+def iter_session(session_id, fmt='csv', start=None, end=None, metrics=None, directory=storage.RECORDINGS_DIR):
+    """生成一个会话录制的导出内容（文本块），读完后关闭数据库"""
+    with closing(storage.open_recording(session_id, directory)) as db:
+        columns = storage.select_columns(storage.recording_columns(db), metrics)
+        rows = iter_csv if fmt == 'csv' else iter_ndjson
+        for chunk in rows(db, columns, start, end):
+            yield chunk
+
+
+def encode(chunks):
+    for chunk in chunks:
+        if chunk:
+            yield chunk.encode('utf-8')
+
+
+def gzip_stream(chunks):
+    """把字节块流式压缩为gzip格式"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """只写、不可定位的缓冲区，zipfile写入后由生成器取走已写的数据"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(session_ids, fmt='csv', start=None, end=None, metrics=None, directory=storage.RECORDINGS_DIR):
+    """把多个会话的导出流式打包为zip，每个会话一个文件，另附会话元数据"""
+    buffer = _StreamBuffer()
+    extension = FORMATS[fmt][0]
+    manifest = []
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for session_id in session_ids:
+            with closing(storage.open_recording(session_id, directory)) as db:
+                manifest.append(storage.recording_meta(db))
+            with archive.open(f'{session_id}.{extension}', 'w') as entry:
+                for chunk in encode(iter_session(session_id, fmt, start, end, metrics, directory)):
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+        archive.writestr('sessions.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+    yield buffer.drain()
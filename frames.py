@@ -0,0 +1,337 @@
+import re
+import time
+import threading
+from collections import deque
+
+# SurfaceFlinger中尚未完成（fence未触发）的帧时间戳
+PENDING_FENCE = 9223372036854775807
+# 默认刷新周期（纳秒），60Hz
+DEFAULT_REFRESH_PERIOD = 16666666
+# SurfaceFlinger只保留最近127帧，120Hz下约1秒，因此轮询间隔要小于这个时长
+POLL_INTERVAL = 0.5
+# 重新解析焦点窗口和图层的间隔（秒）
+FOCUS_INTERVAL = 2.0
+# 图层连续多少次轮询没有新帧后尝试下一个候选图层
+IDLE_POLLS_BEFORE_SWITCH = 4
+# 计算帧耗时分位数所用的最近帧数
+STATS_FRAMES = 600
+# 电影帧耗时（毫秒），用于PerfDog式卡顿判定
+MOVIE_FRAME_MS = 1000.0 / 24
+
+LAYERS_MARK = '@@layers'
+
+_FOCUS_RE = re.compile(r'mCurrentFocus=Window\{\S+ \S+ ([^/\s}]+)/')
+_FOCUSED_APP_RE = re.compile(r'mFocusedApp=.*?\s([\w.]+)/')
+
+
+def parse_focused_package(window_dump):
+    """从dumpsys window输出中解析前台应用包名"""
+    match = _FOCUS_RE.search(window_dump) or _FOCUSED_APP_RE.search(window_dump)
+    return match.group(1) if match else None
+
+
+def pick_layers(layer_list, package):
+    """按优先级返回与前台应用相关的图层名
+
+    游戏等应用通常渲染到SurfaceView，优先使用；其次是Activity窗口本身。
+    """
+    layers = [line.strip() for line in layer_list.split('\n') if package and package in line]
+    surface_views = [layer for layer in layers if layer.startswith('SurfaceView')]
+    windows = [layer for layer in layers if '/' in layer and layer not in surface_views
+               and 'Background' not in layer]
+    return surface_views + windows
+
+
+def quote_layer(layer):
+    """图层名中可能包含空格和括号，需要作为单个shell参数传递"""
+    return "'" + layer.replace("'", "'\\''") + "'"
+
+
+def parse_latency(text):
+    """解析 dumpsys SurfaceFlinger --latency 输出
+
+    第一行为刷新周期，其后每行为 desired-present / actual-present / frame-ready
+    三个纳秒时间戳，返回 (刷新周期, 实际上屏时间戳列表)。
+    """
+    lines = text.strip().split('\n')
+    if not lines or not lines[0].strip().isdigit():
+        return None, []
+    refresh_period = int(lines[0].strip()) or DEFAULT_REFRESH_PERIOD
+    timestamps = []
+    for line in lines[1:]:
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        try:
+            present = int(parts[1])
+        except ValueError:
+            continue
+        if 0 < present < PENDING_FENCE:
+            timestamps.append(present)
+    timestamps.sort()
+    return refresh_period, timestamps
+
+
+def parse_framestats(text):
+    """解析 dumpsys gfxinfo <包名> framestats 的PROFILEDATA段，返回帧完成时间戳列表"""
+    timestamps = []
+    columns = None
+    in_profile = False
+    for line in text.split('\n'):
+        line = line.strip()
+        if line == '---PROFILEDATA---':
+            in_profile = not in_profile
+            columns = None
+            continue
+        if not in_profile or not line:
+            continue
+        fields = line.rstrip(',').split(',')
+        if columns is None:
+            columns = {name: index for index, name in enumerate(fields)}
+            continue
+        try:
+            # Flags非0的帧（如首帧、窗口大小变化）不计入
+            if int(fields[columns.get('Flags', 0)]) != 0:
+                continue
+            completed = int(fields[columns['FrameCompleted']])
+        except (KeyError, IndexError, ValueError):
+            continue
+        if completed > 0:
+            timestamps.append(completed)
+    timestamps.sort()
+    return timestamps
+
+
+class FrameStats:
+    """根据帧时间戳增量计算FPS、帧耗时分位数和卡顿次数
+
+    多次轮询返回的缓冲区互相重叠，只接收比上次最新帧更晚的时间戳。
+    卡顿采用PerfDog的定义：帧耗时大于前三帧平均耗时的2倍，
+    且大于两个电影帧（Jank）或三个电影帧（BigJank）。
+    """
+
+    def __init__(self, window=1.0, history=STATS_FRAMES):
+        self.window_ns = int(window * 1e9)
+        self.refresh_period = DEFAULT_REFRESH_PERIOD
+        self.total_frames = 0
+        self.jank_count = 0
+        self.big_jank_count = 0
+        self._last_ts = 0
+        self._frames = deque()
+        self._frame_times = deque(maxlen=history)
+        self._recent = deque(maxlen=3)
+        # 主机单调时钟与设备帧时间戳的最小差值，用于估算设备当前时间
+        self._clock_offset = None
+        # 最近一次轮询时的设备时间，此前的帧都已收到
+        self._polled_until = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """切换图层后时间序列不再连续，丢弃去重和卡顿判定的状态"""
+        with self._lock:
+            self._last_ts = 0
+            self._frames.clear()
+            self._recent.clear()
+            self._clock_offset = None
+            self._polled_until = 0
+
+    def add_frames(self, timestamps, refresh_period=None, host_ns=None):
+        """加入一次轮询得到的帧时间戳（纳秒，升序），返回新增帧数"""
+        host_ns = host_ns if host_ns is not None else int(time.monotonic() * 1e9)
+        with self._lock:
+            if refresh_period:
+                self.refresh_period = refresh_period
+            added = 0
+            for ts in timestamps:
+                if ts <= self._last_ts:
+                    continue
+                if self._last_ts:
+                    self._add_frame_time((ts - self._last_ts) / 1e6)
+                self._last_ts = ts
+                self._frames.append(ts)
+                added += 1
+            self.total_frames += added
+            if added:
+                offset = host_ns - self._last_ts
+                if self._clock_offset is None or offset < self._clock_offset:
+                    self._clock_offset = offset
+            # 没有新帧时窗口同样向前推进，画面静止后FPS会降为0
+            if self._clock_offset is not None:
+                self._polled_until = max(self._last_ts, host_ns - self._clock_offset)
+            return added
+
+    def _add_frame_time(self, frame_ms):
+        if len(self._recent) == 3:
+            threshold = 2 * sum(self._recent) / 3
+            if frame_ms > threshold and frame_ms > 2 * MOVIE_FRAME_MS:
+                self.jank_count += 1
+                if frame_ms > 3 * MOVIE_FRAME_MS:
+                    self.big_jank_count += 1
+        self._frame_times.append(frame_ms)
+        self._recent.append(frame_ms)
+
+    def snapshot(self):
+        """返回截至最近一次轮询的统计结果，不做任何设备访问"""
+        with self._lock:
+            end = self._polled_until
+            while self._frames and self._frames[0] <= end - self.window_ns:
+                self._frames.popleft()
+            fps = round(len(self._frames) * 1e9 / self.window_ns, 1) if self._last_ts else None
+            frame_times = sorted(self._frame_times)
+
+        def percentile(p):
+            if not frame_times:
+                return None
+            return round(frame_times[min(len(frame_times) - 1, int(len(frame_times) * p))], 2)
+
+        return {
+            'fps': fps,
+            'frame_time': {
+                'p50': percentile(0.5),
+                'p90': percentile(0.9),
+                'p99': percentile(0.99)
+            },
+            'jank': self.jank_count,
+            'big_jank': self.big_jank_count,
+            'frames': self.total_frames,
+            'refresh_rate': round(1e9 / self.refresh_period, 1) if self.refresh_period else None
+        }
+
+
+# 后台帧采集器
+class FrameCollector:
+    """在独立的shell通道上持续轮询前台图层的帧时间戳
+
+    监控循环只调用latest()读取已计算好的结果，不会因为FPS采集而阻塞或休眠。
+    """
+
+    def __init__(self, shell, method='surfaceflinger', poll_interval=POLL_INTERVAL):
+        # shell为可调用对象: shell(command, timeout) -> 输出文本
+        self.shell = shell
+        # method为'agent'时只解析焦点，帧数据由设备端代理通过add_latency送入
+        self.method = method
+        self.poll_interval = poll_interval
+        self.stats = FrameStats()
+        self.package = None
+        self.layer = None
+        self.error = None
+        self.polled_at = None
+        # 图层切换时的回调 on_layer(layer)，代理模式下用于通知设备端读取新图层
+        self.on_layer = None
+        self._candidates = []
+        self._idle_polls = 0
+        self._focus_checked = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def collect_once(self):
+        """同步执行一次焦点解析和帧轮询"""
+        self._resolve_focus()
+        self._poll()
+        self.polled_at = time.time()
+
+    def latest(self):
+        """返回最近一次计算的帧统计"""
+        result = self.stats.snapshot()
+        result['package'] = self.package
+        result['layer'] = self.layer
+        result['method'] = self.method
+        result['sampled_at'] = self.polled_at
+        if result['fps'] is None:
+            result['error'] = self.error
+        return result
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while self._running:
+            try:
+                if time.monotonic() - self._focus_checked >= FOCUS_INTERVAL:
+                    self._resolve_focus()
+                self._poll()
+                self.polled_at = time.time()
+                self.error = None
+            except Exception as e:
+                if not self._running:
+                    break  # 已停止，shell通道被关闭导致的错误不再记录
+                self.error = str(e)
+                print(f"帧数据采集失败: {str(e)}")
+            next_poll += self.poll_interval
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                # 轮询本身超过了间隔，直接从当前时间重新计时
+                next_poll = time.monotonic()
+                delay = 0
+            time.sleep(delay)
+
+    def _resolve_focus(self):
+        """一次往返获取焦点窗口和图层列表"""
+        self._focus_checked = time.monotonic()
+        output = self.shell(f'dumpsys window | grep -E "mCurrentFocus|mFocusedApp"; '
+                            f'echo {LAYERS_MARK}; dumpsys SurfaceFlinger --list', 5)
+        self.apply_focus(output)
+
+    def apply_focus(self, output):
+        """根据焦点窗口和图层列表的输出选择前台图层"""
+        window_dump, _, layer_list = output.partition(LAYERS_MARK)
+        package = parse_focused_package(window_dump)
+        if package != self.package:
+            self.package = package
+            self._candidates = pick_layers(layer_list, package)
+            self._switch_layer(self._candidates[0] if self._candidates else None)
+            if package is None:
+                self.error = '未找到前台应用'
+        elif self.layer is None or self.layer not in layer_list:
+            self._candidates = pick_layers(layer_list, package)
+            self._switch_layer(self._candidates[0] if self._candidates else None)
+
+    def _switch_layer(self, layer):
+        if layer != self.layer:
+            self.layer = layer
+            self.stats.reset()
+            if self.on_layer:
+                self.on_layer(layer)
+        self._idle_polls = 0
+
+    def _poll(self):
+        if self.method == 'gfxinfo':
+            if not self.package:
+                return
+            output = self.shell(f'dumpsys gfxinfo {self.package} framestats', 5)
+            self.stats.add_frames(parse_framestats(output))
+            return
+
+        if self.method == 'agent' or not self.layer:
+            return
+        self.add_latency(self.shell(f'dumpsys SurfaceFlinger --latency {quote_layer(self.layer)}', 2))
+
+    def feed(self, command, output, host_ns=None):
+        """按命令类型解析一条已抓取的输出，不访问设备（回放抓包时使用）"""
+        if LAYERS_MARK in command:
+            self.apply_focus(output)
+        elif '--latency ' in command:
+            self.add_latency(output, host_ns)
+        elif 'framestats' in command:
+            self.stats.add_frames(parse_framestats(output), host_ns=host_ns)
+
+    def add_latency(self, output, host_ns=None):
+        """加入一次 SurfaceFlinger --latency 的输出，host_ns为读取时的主机时间（默认为当前时间）"""
+        refresh_period, timestamps = parse_latency(output)
+        if self.stats.add_frames(timestamps, refresh_period, host_ns):
+            self._idle_polls = 0
+            return
+        # 当前图层长时间没有新帧，可能选错了图层（如BLAST下的窗口层），换下一个候选
+        self._idle_polls += 1
+        if self._idle_polls >= IDLE_POLLS_BEFORE_SWITCH and len(self._candidates) > 1:
+            index = self._candidates.index(self.layer) if self.layer in self._candidates else -1
+            self._switch_layer(self._candidates[(index + 1) % len(self._candidates)])
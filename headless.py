@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""无界面采集：不启动网页服务，直接运行与网页相同的采集器，把样本写入文件或标准输出
+
+适合在CI中使用，可同时采集多台设备（一个进程内每台设备一个会话），结束时输出统计摘要：
+
+    python headless.py --serial <序列号> --duration 60 --interval 0.5 --format csv -o perf.csv
+    python headless.py --all --duration 300 --metrics fps,cpu_load -o 'out/{serial}.ndjson'
+    python headless.py --duration 30 --summary summary.json > samples.ndjson
+    python headless.py -d 120 --power-rate 50 --mark launch=0-15 --mark battle=30-90 -o /dev/null
+
+数据写入标准输出（-o - 或不指定），摘要和日志写入标准错误；
+所有设备都采集到样本时返回0，有设备没有样本时返回1，没有可用设备时返回2。
+Flask/Socket.IO不会被导入，摘要使用的NumPy在结束时才导入。
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+
+import alerts
+import metrics as collector_metrics
+import storage
+from adb_tools import ADBTools
+from session import DeviceSession, MODES, parse_interval
+
+FORMATS = ('ndjson', 'csv')
+# 样本中可选择的指标，timestamp和serial总是输出
+METRICS = ('fps', 'frame_time', 'jank', 'big_jank', 'cpu_freq', 'cpu_load', 'gpu_freq', 'gpu_load',
+           'current', 'power', 'app', 'quality')
+
+
+class SampleWriter:
+    """把一台或多台设备的样本写入同一个输出（多线程安全）
+
+    NDJSON每行一个样本；CSV的列在开始时按所有设备的核心确定（每个核心一列），与导出文件的列名相同。
+    """
+
+    def __init__(self, stream, fmt, metrics, cores=(), close=False):
+        self.stream = stream
+        self.fmt = fmt
+        self.metrics = metrics
+        self.close_stream = close
+        self.rows = 0
+        self._columns = csv_columns(cores, metrics) if fmt == 'csv' else None
+        self._header = False
+        self._csv = csv.writer(stream, lineterminator='\n') if fmt == 'csv' else None
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            if self.fmt == 'csv':
+                self._write_csv(data)
+            else:
+                sample = {'serial': data['serial'], 'timestamp': data['timestamp']}
+                sample.update((metric, data.get(metric)) for metric in self.metrics)
+                self.stream.write(json.dumps(sample, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self.rows += 1
+            # 逐行刷新，管道另一端可以实时读取
+            self.stream.flush()
+
+    def _write_csv(self, data):
+        row = storage.flatten_sample(data)
+        for metric, flag in (data.get('quality') or {}).items():
+            row[f'quality_{metric}'] = flag
+        if not self._header:
+            self._header = True
+            self._csv.writerow(['serial', 'timestamp'] + self._columns)
+        self._csv.writerow([data['serial'], data['timestamp']] +
+                           ['' if row.get(column) is None else row[column] for column in self._columns])
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+
+
+def csv_columns(cores, metrics):
+    """CSV的数据列：第一个样本可能还没有CPU读数，所以按设备信息中的核心编号生成"""
+    template = {'cpu_freq': {}, 'cpu_load': {}}
+    for core in cores:
+        template['cpu_freq'][f'core_{core}'] = template['cpu_load'][f'core_{core}'] = None
+    columns = list(storage.flatten_sample(template))
+    columns += [f'quality_{metric}' for metric in collector_metrics.QUALITY_METRICS]
+    return storage.select_columns(columns, metrics)
+
+
+def open_output(path, serial, fmt, metrics, cores, writers):
+    """输出路径中的 {serial} 替换为设备序列号，相同路径共用一个writer"""
+    if not path or path == '-':
+        key = '-'
+    else:
+        key = path.replace('{serial}', serial.replace(':', '_'))
+    writer = writers.get(key)
+    if writer is None:
+        if key == '-':
+            writer = SampleWriter(sys.stdout, fmt, metrics, cores)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(key)), exist_ok=True)
+            writer = SampleWriter(io.open(key, 'w', encoding='utf-8', newline=''), fmt, metrics, cores,
+                                  close=True)
+        writers[key] = writer
+    return writer
+
+
+def resolve_serials(args):
+    online = ADBTools.get_devices()
+    if args.all:
+        return online
+    if args.serial:
+        for serial in args.serial:
+            if serial not in online:
+                log(f"设备 {serial} 不在线")
+        return [serial for serial in dict.fromkeys(args.serial) if serial in online]
+    return online[:1]
+
+
+def summarize(session, directory):
+    """会话的统计摘要；NumPy不可用时只给出样本数"""
+    stats = session.stats()
+    summary = {
+        'serial': session.serial,
+        'session_id': session.session_id,
+        'samples': stats['samples'],
+        'publish_skipped': stats['publish_skipped'],
+        'reconnects': stats['reconnects'],
+        'mode': stats['mode'],
+        'alerts_fired': stats['alerts'],
+        'power_meter': stats['power'],
+        'marks': session.power_meter.marks() if session.power_meter else [],
+        'alerts': session.alerts.recent() if session.alerts else []
+    }
+    try:
+        import analysis
+    except ImportError as e:
+        log(f"无法导入NumPy，摘要只包含样本数: {str(e)}")
+        return summary
+    try:
+        result = analysis.analyze(session.session_id, directory=directory)
+    except Exception as e:
+        log(f"[{session.serial}] 统计失败: {str(e)}")
+        return summary
+
+    def pick(stats, *keys):
+        return {key: stats.get(key) for key in keys} if stats else None
+
+    summary.update({
+        'duration': result['duration'],
+        'fps': pick(result['fps'], 'time_weighted_mean', 'p1', 'p5', 'p50', 'stability'),
+        'jank': result['jank'],
+        'big_jank': result['big_jank'],
+        'cpu_load': pick(result['cpu_load']['average'], 'time_weighted_mean', 'p95', 'max'),
+        'cpu_freq': pick(result['cpu_freq']['average'], 'time_weighted_mean', 'max'),
+        'gpu_load': pick(result['gpu_load'], 'time_weighted_mean', 'p95', 'max'),
+        'gpu_freq': pick(result['gpu_freq'], 'time_weighted_mean', 'max'),
+        'power': pick(result['power'], 'time_weighted_mean', 'p95', 'max'),
+        'app_cpu': pick(result['app_cpu'], 'time_weighted_mean', 'p95', 'max'),
+        'app_rss': pick(result['app_rss'], 'time_weighted_mean', 'max'),
+        'energy': result['energy'],
+        'power_trace': result['power_trace']
+    })
+    return summary
+
+
+def print_summary(summaries):
+    for summary in summaries:
+        log(f"[{summary['serial']}] 样本 {summary['samples']}  跳过 {summary['publish_skipped']}  "
+            f"重连 {summary['reconnects']}  告警 {summary['alerts_fired']}  会话 {summary['session_id']}")
+        for metric in ('fps', 'cpu_load', 'gpu_load', 'power', 'app_cpu', 'app_rss'):
+            if summary.get(metric):
+                values = '  '.join(f'{key} {value}' for key, value in summary[metric].items())
+                log(f"  {metric:<9} {values}")
+        if summary.get('jank'):
+            log(f"  jank      {summary['jank']['total']} 次 ({summary['jank']['per_10min']} 次/10分钟)")
+        if summary.get('energy'):
+            log(f"  energy    {summary['energy'].get('energy_mwh')} mWh  {summary['energy'].get('charge_mah')} mAh")
+        if summary.get('power_meter'):
+            power = summary['power_meter']
+            log(f"  meter     {power['energy_mwh']} mWh  平均 {power['avg_power_mw']} mW  "
+                f"峰值 {power['peak_power_mw']} mW  ({power['samples']} 个读数)")
+        for mark in summary.get('marks', []):
+            log(f"  [{mark['name']}] {mark['duration']} 秒  {mark['energy_mwh']} mWh  "
+                f"平均 {mark['avg_power_mw']} mW  峰值 {mark['peak_power_mw']} mW")
+
+
+def make_publish(writer):
+    """样本写入输出，告警的触发和解除写入标准错误"""
+    def publish(serial, event, data):
+        if event == 'performance_data':
+            writer.write(data)
+        elif event == 'power_mark' and data['state'] == 'done':
+            log(f"[{serial}] 标记 {data['name']}: {data['energy_mwh']} mWh  平均 {data['avg_power_mw']} mW")
+        elif event == 'alert':
+            state = '触发' if data['state'] == 'firing' else '解除'
+            log(f"[{serial}] 告警{state} {data['rule']}: {data['message']} "
+                f"({data['metric']} {data['stat']} {data['value']} / {data['threshold']})")
+    return publish
+
+
+def parse_mark(text):
+    """--mark 名称=开始-结束（相对采集开始的秒数）"""
+    name, _, span = text.partition('=')
+    start, _, end = span.partition('-')
+    try:
+        start, end = float(start), float(end)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'标记格式应为 名称=开始秒数-结束秒数: {text}')
+    if not name.strip() or end <= start:
+        raise argparse.ArgumentTypeError(f'标记格式应为 名称=开始秒数-结束秒数: {text}')
+    return name.strip(), start, end
+
+
+def schedule_marks(sessions, marks, stop_event):
+    """按相对时间开始/结束各设备的能耗标记区间"""
+    events = sorted([(start, 'start', name) for name, start, _ in marks] +
+                    [(end, 'stop', name) for name, _, end in marks])
+
+    def run():
+        started = time.monotonic()
+        for offset, action, name in events:
+            if stop_event.wait(max(0.0, offset - (time.monotonic() - started))):
+                return
+            for session in sessions:
+                try:
+                    if action == 'start':
+                        session.start_mark(name)
+                    else:
+                        session.stop_mark(name)
+                except ValueError as e:
+                    log(f"[{session.serial}] 标记 {name} 失败: {str(e)}")
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='无界面性能采集')
+    parser.add_argument('-s', '--serial', action='append', help='设备序列号，可重复指定多台设备')
+    parser.add_argument('--all', action='store_true', help='采集所有在线设备')
+    parser.add_argument('-d', '--duration', type=float, default=60.0, help='采集时长（秒），0为直到中断')
+    parser.add_argument('-i', '--interval', type=float, default=1.0, help='推送周期（秒）')
+    parser.add_argument('--mode', choices=MODES, default='poll', help='采集方式')
+    parser.add_argument('-p', '--package', help='采样进程/线程CPU和内存的应用包名，默认为前台应用')
+    parser.add_argument('--rate', type=int, help='agent模式的采样频率（次/秒）')
+    parser.add_argument('--power-rate', type=int, help='电流/电压的读取频率（次/秒，1~50）')
+    parser.add_argument('--mark', action='append', type=parse_mark, default=[],
+                        help='能耗标记区间，名称=开始-结束（相对采集开始的秒数），可重复指定')
+    parser.add_argument('-m', '--metrics', help=f"逗号分隔的指标，默认全部：{','.join(METRICS)}")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='ndjson', help='输出格式')
+    parser.add_argument('-o', '--output', default='-', help="输出文件，'-'为标准输出，可包含 {serial}")
+    parser.add_argument('--summary', help="把摘要以JSON写入文件（'-'为标准错误）")
+    parser.add_argument('--recordings', default=storage.RECORDINGS_DIR, help='录制目录')
+    parser.add_argument('--no-record', action='store_true', help='不保留录制文件（摘要仍会计算）')
+    parser.add_argument('--capture', action='store_true', help='同时抓取ADB原始输出（可回放）')
+    parser.add_argument('--alert-rules', default=alerts.RULES_PATH, help='告警规则文件（JSON），不存在时使用默认规则')
+    args = parser.parse_args(argv)
+
+    metrics = [metric.strip() for metric in (args.metrics or '').split(',') if metric.strip()] or list(METRICS)
+    unknown = [metric for metric in metrics if metric not in METRICS]
+    if unknown:
+        parser.error(f"未知的指标: {', '.join(unknown)}")
+    try:
+        parse_interval(args.interval)
+    except ValueError as e:
+        parser.error(str(e))
+
+    serials = resolve_serials(args)
+    if not serials:
+        log('没有可用的设备')
+        return 2
+
+    cores = []
+    if args.format == 'csv':
+        cores = sorted({core for serial in serials for core in ADBTools.get_profile(serial).core_indexes()})
+    directory = tempfile.mkdtemp(prefix='headless_') if args.no_record else args.recordings
+    rule_set = alerts.RuleSet(alerts.load_rules(args.alert_rules))
+    writers = {}
+    sessions = []
+    for serial in serials:
+        writer = open_output(args.output, serial, args.format, metrics, cores, writers)
+        sessions.append(DeviceSession(serial, make_publish(writer), directory=directory, rule_set=rule_set))
+
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    started = time.monotonic()
+    try:
+        for session in sessions:
+            session.start(args.interval, args.mode, args.rate, capture_raw=args.capture, package=args.package,
+                          power_rate=args.power_rate)
+            log(f"[{session.serial}] 开始采集，会话 {session.session_id}")
+        if args.mark:
+            schedule_marks(sessions, args.mark, stop_event)
+        stop_event.wait(args.duration if args.duration > 0 else None)
+    finally:
+        for session in sessions:
+            session.stop()
+        for session in sessions:
+            session.join(10)
+        for writer in writers.values():
+            writer.close()
+        ADBTools.close_shells()
+
+    summaries = [summarize(session, directory) for session in sessions]
+    if args.no_record:
+        shutil.rmtree(directory, ignore_errors=True)
+    log(f"采集结束，用时 {time.monotonic() - started:.1f} 秒")
+    print_summary(summaries)
+    if args.summary:
+        text = json.dumps(summaries, ensure_ascii=False, indent=2)
+        if args.summary == '-':
+            log(text)
+        else:
+            with open(args.summary, 'w', encoding='utf-8') as f:
+                f.write(text)
+    return 0 if all(summary['samples'] for summary in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 同时运行的后台任务数
+MAX_PARALLEL = 8
+# 保留的已结束任务数，超过后丢弃最早结束的
+MAX_FINISHED = 200
+# 任务状态：pending（排队）-> running -> done | failed | cancelled
+ACTIVE_STATES = ('pending', 'running')
+
+
+class JobCancelled(Exception):
+    """任务已被取消，由Job.check()在步骤之间抛出"""
+
+
+class Job:
+    """一个后台任务：进度、结果和取消请求
+
+    任务函数 func(job) 在步骤之间调用 job.progress() 报告进度、job.check() 响应取消；
+    返回值为任务结果，抛出ValueError表示失败（消息返回给调用方），其他异常同样记为失败。
+    """
+
+    def __init__(self, manager, kind, key):
+        self.manager = manager
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.state = 'pending'
+        self.step = 0
+        self.total = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def progress(self, step, total=None, message=None):
+        self.step = step
+        if total is not None:
+            self.total = total
+        self.message = message
+        self.manager._notify(self)
+
+    def check(self):
+        """已请求取消时抛出JobCancelled"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，超时返回False"""
+        return self._done.wait(timeout)
+
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'state': self.state,
+            'progress': {'step': self.step, 'total': self.total, 'message': self.message},
+            'cancel_requested': self._cancel.is_set(),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+# 后台任务
+class JobManager:
+    """在后台线程中运行耗时的设备操作（连接、读取设备信息、断开等），请求处理立即返回任务ID
+
+    同一 (kind, key) 已有未结束的任务时直接返回该任务，重复的请求不会再次执行；
+    submit的cancels指定同一key下需要先取消的其他任务类型（如断开时取消正在进行的连接）。
+    任务状态变化时回调 listener(info)。
+    """
+
+    def __init__(self, max_parallel=MAX_PARALLEL):
+        self._jobs = OrderedDict()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def submit(self, kind, key, func, cancels=()):
+        """提交任务，返回 (任务, 是否新建)"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active() and job.key == key and job.kind in cancels:
+                    job._cancel.set()
+            existing = next((job for job in self._jobs.values()
+                             if job.active() and job.kind == kind and job.key == key and not job.cancelled()),
+                            None)
+            if existing:
+                return existing, False
+            job = Job(self, kind, key)
+            self._jobs[job.id] = job
+            self._prune()
+        self._notify(job)
+        self._executor.submit(self._run, job, func)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, active_only=False):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs if job.active() or not active_only]
+
+    def cancel(self, job_id):
+        """请求取消任务：排队中的任务直接取消，运行中的任务在下一个步骤之间结束；任务不存在或已结束时返回None"""
+        job = self.get(job_id)
+        if job is None or not job.active():
+            return None
+        job._cancel.set()
+        with self._lock:
+            pending = job.state == 'pending'
+            if pending:
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+        if pending:
+            job._done.set()
+        self._notify(job)
+        return job
+
+    def _run(self, job, func):
+        with self._lock:
+            if job.state != 'pending':
+                return
+            job.state = 'running'
+            job.started_at = time.time()
+        self._notify(job)
+        try:
+            job.check()
+            result = func(job)
+            state, error = 'done', None
+        except JobCancelled:
+            result, state, error = None, 'cancelled', None
+        except ValueError as e:
+            result, state, error = None, 'failed', str(e)
+        except Exception as e:
+            print(f"后台任务 {job.kind}({job.key}) 失败: {str(e)}")
+            result, state, error = None, 'failed', str(e)
+        with self._lock:
+            job.result = result
+            job.error = error
+            job.state = state
+            job.finished_at = time.time()
+        job._done.set()
+        self._notify(job)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self._jobs[job_id]
+
+    def _notify(self, job):
+        info = job.to_dict()
+        for listener in self._listeners:
+            try:
+                listener(info)
+            except Exception as e:
+                print(f"任务状态回调失败: {str(e)}")
@@ -0,0 +1,276 @@
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# 耗时直方图的桶上限（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 样本质量标记：ok为真实读数，estimated为占位/估算值，stale为读数过旧（见session.STALE_AGE），missing为没有数据
+QUALITY_FLAGS = ('ok', 'estimated', 'stale', 'missing')
+QUALITY_METRICS = ('fps', 'cpu_freq', 'cpu_load', 'gpu_freq', 'gpu_load', 'current', 'power')
+
+# 指标说明，输出Prometheus文本时作为HELP行
+HELP = {
+    'collector_duration_seconds': '采集方法耗时',
+    'collector_calls_total': '采集方法调用次数',
+    'collector_errors_total': '采集方法中失败（返回码非0或通道断开）的ADB命令',
+    'collector_exceptions_total': '采集方法抛出的异常',
+    'collector_timeouts_total': '采集方法中超时的ADB命令',
+    'collector_fallbacks_total': '采集方法返回默认值/估算值的次数',
+    'collector_fallback': '采集方法最近一次调用是否使用了默认值（0/1）',
+    'adb_command_duration_seconds': '常驻shell通道上单条命令的耗时',
+    'monitor_tick_duration_seconds': '监控循环每次合并、推送和录制的耗时',
+    'monitor_tick_lag_seconds': '监控循环超过截止时间的延迟',
+    'monitor_tick_overruns_total': '监控循环错过截止时间的次数',
+    'monitor_samples_total': '监控循环推送的样本数',
+    'sample_quality_total': '按指标和质量标记统计的样本数',
+    'alerts_total': '按规则统计的告警触发和解除次数',
+    'telemetry_queue_lag_seconds': '样本在遥测队列中等待发送的时间',
+    'telemetry_dropped_total': '客户端落后时被丢弃的样本数',
+    'socketio_emits_total': 'Socket.IO推送次数',
+    'socketio_emit_bytes_total': 'Socket.IO推送的数据量（JSON编码后的近似字节数）',
+    'agent_records_total': '采样代理收到的记录数',
+    'agent_restarts_total': '采样代理重启次数',
+    'telemetry_clients': '已订阅的网页客户端数',
+    'telemetry_queued_samples': '各客户端队列中等待发送的样本总数',
+    'telemetry_inflight_frames': '已发送但尚未确认的帧数',
+    'monitor_sessions': '按状态统计的监控会话数',
+}
+
+_local = threading.local()
+
+
+class Histogram:
+    """累积直方图，与Prometheus的histogram类型一致"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def quantile(self, q):
+        """按桶估算分位数（取所在桶的上限）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95)
+        }
+
+
+# 指标注册表
+class Registry:
+    """进程内的计数器、瞬时值和直方图，键为 (指标名, 排序后的标签)"""
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """输出Prometheus文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.sum, h.buckets))
+                                for key, h in self._histograms.items())
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f'# HELP {name} {HELP[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), value in gauges:
+            header(name, 'gauge')
+            lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), (counts, count, total, buckets) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """供调试面板使用的JSON结构：{指标名: [{labels, value}]}"""
+        result = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                result.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), value in self._gauges.items():
+                result.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in self._histograms.items():
+                result.setdefault(name, []).append({'labels': dict(labels), **histogram.to_dict()})
+        return result
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+REGISTRY = Registry()
+
+
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+# 采集方法的自动计量
+def current_collector():
+    """当前线程正在执行的采集方法名（ADB命令的错误和超时计入该方法）"""
+    return getattr(_local, 'collector', None)
+
+
+@contextmanager
+def collecting(name):
+    """计量一次采集：耗时、调用次数、未捕获的异常，以及期间是否使用了默认值"""
+    previous = getattr(_local, 'collector', None)
+    previous_fallback = getattr(_local, 'fallback', False)
+    _local.collector = name
+    _local.fallback = False
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('collector_exceptions_total', collector=name)
+        raise
+    finally:
+        observe('collector_duration_seconds', time.perf_counter() - started, collector=name)
+        inc('collector_calls_total', collector=name)
+        set_gauge('collector_fallback', 1 if _local.fallback else 0, collector=name)
+        _local.collector = previous
+        _local.fallback = previous_fallback
+
+
+def collector(name):
+    """装饰器形式的collecting"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with collecting(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def fallback(metric):
+    """记录当前采集方法返回了默认值/估算值而不是真实读数"""
+    _local.fallback = True
+    inc('collector_fallbacks_total', collector=current_collector() or 'unknown', metric=metric)
+
+
+def command_failed(channel, timeout=False):
+    """常驻shell上的命令失败或超时，计入当前采集方法（没有时按通道名）"""
+    name = current_collector() or f'shell:{channel}'
+    inc('collector_timeouts_total' if timeout else 'collector_errors_total', collector=name)
+
+
+def payload_size(data):
+    """推送数据的近似字节数：JSON编码长度，二进制部分按原始长度计算"""
+    binary = []
+
+    def default(value):
+        if isinstance(value, (bytes, bytearray)):
+            binary.append(len(value))
+            return None
+        return str(value)
+
+    text = json.dumps(data, default=default, ensure_ascii=False, separators=(',', ':'))
+    return len(text.encode('utf-8')) + sum(binary)
+
+
+def record_emit(event, data):
+    inc('socketio_emits_total', event=event)
+    inc('socketio_emit_bytes_total', payload_size(data), event=event)
+
+
+def encode_quality(quality):
+    """把 {指标: 标记} 编码为整数，每个指标占2位（用于紧凑遥测格式）"""
+    value = 0
+    for index, metric in enumerate(QUALITY_METRICS):
+        value |= QUALITY_FLAGS.index(quality.get(metric, 'missing')) << (index * 2)
+    return value
+
+
+def decode_quality(value):
+    value = int(value or 0)
+    return {metric: QUALITY_FLAGS[(value >> (index * 2)) & 3] for index, metric in enumerate(QUALITY_METRICS)}
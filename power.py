@@ -0,0 +1,306 @@
+import time
+import threading
+
+import snapshot
+
+POWER_MARK = '@@pw '
+END_MARK = '@@end'
+UPTIME_PATH = '/proc/uptime'
+
+# 电流/电压的默认读取频率（次/秒）和允许范围，频率越高越能捕捉短时的功耗尖峰
+DEFAULT_RATE = 20
+MIN_RATE = 1
+MAX_RATE = 50
+# 每次ADB往返在设备上连续读取的时长（秒），推送周期更短时与推送周期相同（不小于MIN_BATCH）
+MAX_BATCH = 1.0
+MIN_BATCH = 0.25
+# 相邻读数的间隔超过该时长（秒，设备离线、采集暂停）时不跨越空档积分
+MAX_GAP = 2.0
+
+
+def build_sample_command(current_path, voltage_path, count, interval):
+    """在设备上连续读取count次开机时长、current_now和voltage_now，一次往返返回全部读数
+
+    只使用shell内建的read读取节点；读数之间用sleep间隔（需要支持小数秒的toybox sleep）。
+    """
+    read_voltage = f'read -r v < {voltage_path}; ' if voltage_path else 'v=; '
+    return (f'i=0; while [ $i -lt {count} ]; do '
+            f'read -r u _ < {UPTIME_PATH}; read -r c < {current_path}; {read_voltage}'
+            f'echo "{POWER_MARK}$u $c $v"; i=$((i + 1)); '
+            f'[ $i -lt {count} ] && sleep {interval:.3f}; done; echo {END_MARK}')
+
+
+def parse_samples(output, received_at, calibration=None):
+    """解析build_sample_command的输出，返回按时间排序的 [(时间, 电流mA, 电压V)]
+
+    时间由设备开机时长换算：最后一个读数对应收到输出的时间received_at，
+    与主机时钟同步的误差不影响积分（只用到读数之间的间隔）。
+    """
+    raw = []
+    for line in output.split('\n'):
+        if not line.startswith(POWER_MARK):
+            continue
+        parts = line[len(POWER_MARK):].split()
+        if len(parts) < 2:
+            continue
+        try:
+            uptime = float(parts[0])
+        except ValueError:
+            continue
+        current = snapshot.parse_int(parts[1])
+        voltage = snapshot.parse_int(parts[2]) if len(parts) > 2 else None
+        if current is not None:
+            raw.append((uptime, current, voltage))
+    if not raw:
+        return []
+    last_uptime = raw[-1][0]
+    readings = []
+    for uptime, current, voltage in raw:
+        current, voltage = snapshot.battery_reading(current, voltage, calibration)
+        readings.append((received_at - (last_uptime - uptime), current, voltage))
+    return readings
+
+
+def batch_duration(interval):
+    return max(MIN_BATCH, min(MAX_BATCH, interval))
+
+
+def summarize_batch(readings):
+    """一批读数的平均电流、电压、功率和峰值功率，作为推送样本中的current/power"""
+    powers = [current * voltage for _, current, voltage in readings if voltage]
+    voltages = [voltage for _, _, voltage in readings if voltage]
+    return {
+        'current': sum(current for _, current, _ in readings) / len(readings),
+        'voltage': sum(voltages) / len(voltages) if voltages else None,
+        'power': sum(powers) / len(powers) if powers else None,
+        'peak_power': max(powers) if powers else None,
+        'count': len(readings)
+    }
+
+
+def _round(value, digits=3):
+    return None if value is None else round(value, digits)
+
+
+# 能耗积分
+class PowerMeter:
+    """对高频读数按时间做梯形积分，得到会话以及用户标记区间的能耗（mWh）、电量（mAh）和平均功率
+
+    放电为正、充电为负（见snapshot.battery_calibration），空档超过MAX_GAP的部分不计入。
+    标记区间以时间为边界，从边界之后的第一个读数开始/结束计算，误差不超过一个读数间隔。
+    """
+
+    def __init__(self):
+        self.energy = 0.0     # mWh
+        self.charge = 0.0     # mAh
+        self.duration = 0.0   # 已积分的时长（秒）
+        self.samples = 0
+        self.gaps = 0
+        self.peak_power = None
+        self._last = None     # (时间, 电流, 功率)
+        self._marks = []
+        self._lock = threading.Lock()
+
+    def add(self, readings):
+        """加入一批按时间排序的 [(时间, 电流mA, 电压V)]"""
+        with self._lock:
+            for timestamp, current, voltage in readings:
+                power = current * voltage if voltage else None
+                last = self._last
+                if last is not None:
+                    elapsed = timestamp - last[0]
+                    if elapsed <= 0:
+                        continue  # 与上一批重叠的读数
+                    if elapsed <= MAX_GAP:
+                        self.charge += (last[1] + current) / 2 * elapsed / 3600
+                        if power is not None and last[2] is not None:
+                            self.energy += (last[2] + power) / 2 * elapsed / 3600
+                        self.duration += elapsed
+                    else:
+                        self.gaps += 1
+                self._last = (timestamp, current, power)
+                self.samples += 1
+                if power is not None and (self.peak_power is None or power > self.peak_power):
+                    self.peak_power = power
+                self._update_marks(timestamp, power)
+
+    def _totals(self):
+        return {'energy': self.energy, 'charge': self.charge, 'duration': self.duration, 'samples': self.samples}
+
+    def _update_marks(self, timestamp, power):
+        for mark in self._marks:
+            if mark['start'] is None and timestamp >= mark['started_at']:
+                mark['start'] = self._totals()
+            if mark['start'] is not None and mark['end'] is None:
+                if mark['stopped_at'] is not None and timestamp >= mark['stopped_at']:
+                    mark['end'] = self._totals()
+                elif power is not None and (mark['peak_power'] is None or power > mark['peak_power']):
+                    mark['peak_power'] = power
+
+    # 标记区间
+    def start_mark(self, name, timestamp=None):
+        """开始一个标记区间（如一个测试场景），同名区间正在进行时抛出ValueError"""
+        with self._lock:
+            if any(mark['name'] == name and mark['stopped_at'] is None for mark in self._marks):
+                raise ValueError(f'标记 {name} 已开始')
+            mark = {'name': name, 'started_at': timestamp or time.time(), 'stopped_at': None,
+                    'start': None, 'end': None, 'peak_power': None}
+            self._marks.append(mark)
+            return self._describe(mark)
+
+    def stop_mark(self, name, timestamp=None):
+        """结束标记区间，没有正在进行的同名区间时抛出ValueError"""
+        with self._lock:
+            mark = next((mark for mark in self._marks if mark['name'] == name and mark['stopped_at'] is None),
+                        None)
+            if mark is None:
+                raise ValueError(f'标记 {name} 未开始')
+            mark['stopped_at'] = max(timestamp or time.time(), mark['started_at'])
+            return self._describe(mark)
+
+    def close(self, timestamp=None):
+        """会话结束：结束仍在进行的标记，结束边界之后没有读数的区间以最后的累计值为准，返回这些区间"""
+        with self._lock:
+            closed = []
+            for mark in self._marks:
+                if mark['end'] is not None:
+                    continue
+                if mark['stopped_at'] is None:
+                    mark['stopped_at'] = max(timestamp or time.time(), mark['started_at'])
+                if mark['start'] is not None:
+                    mark['end'] = self._totals()
+                closed.append(self._describe(mark))
+            return closed
+
+    def pop_finished(self):
+        """取出上次调用之后结束的区间（用于记入录制）"""
+        with self._lock:
+            finished = [mark for mark in self._marks if mark['end'] is not None and not mark.get('reported')]
+            for mark in finished:
+                mark['reported'] = True
+            return [self._describe(mark) for mark in finished]
+
+    def marks(self):
+        with self._lock:
+            return [self._describe(mark) for mark in self._marks]
+
+    def _describe(self, mark):
+        start = mark['start']
+        end = mark['end'] or (self._totals() if start else None)
+        if mark['stopped_at'] is None:
+            state = 'running'
+        else:
+            state = 'done' if mark['end'] else 'closing'  # 结束边界之后的读数尚未到达
+        result = {'name': mark['name'], 'state': state, 'started_at': mark['started_at'],
+                  'stopped_at': mark['stopped_at']}
+        result.update(self._interval(start, end, mark['peak_power']))
+        return result
+
+    def _interval(self, start, end, peak_power):
+        if start is None:
+            return {'duration': 0, 'energy_mwh': None, 'charge_mah': None, 'avg_power_mw': None,
+                    'avg_current_ma': None, 'peak_power_mw': None, 'samples': 0}
+        duration = end['duration'] - start['duration']
+        energy = end['energy'] - start['energy']
+        charge = end['charge'] - start['charge']
+        return {
+            'duration': _round(duration),
+            'energy_mwh': _round(energy, 4),
+            'charge_mah': _round(charge, 4),
+            'avg_power_mw': _round(energy * 3600 / duration, 2) if duration > 0 else None,
+            'avg_current_ma': _round(charge * 3600 / duration, 2) if duration > 0 else None,
+            'peak_power_mw': _round(peak_power, 2),
+            'samples': end['samples'] - start['samples']
+        }
+
+    def summary(self):
+        """会话的累计能耗、平均功率、峰值功率和空档次数"""
+        with self._lock:
+            result = self._interval({'energy': 0.0, 'charge': 0.0, 'duration': 0.0, 'samples': 0},
+                                    self._totals(), self.peak_power)
+            result['gaps'] = self.gaps
+            result['last'] = {'timestamp': self._last[0], 'current_ma': _round(self._last[1], 2),
+                              'power_mw': _round(self._last[2], 2)} if self._last else None
+            return result
+
+
+# 高频采集
+class PowerCollector:
+    """在独立线程中连续读取电流/电压批次（批次之间没有等待），送入PowerMeter
+
+    fetch(duration) 返回一批读数，由调用方提供（ADBTools.get_power_samples）；
+    on_readings(readings) 可用于录制原始读数。对外提供与CollectorScheduler相同的 latest/stats/running 接口，
+    latest('power') 为最近一批读数的平均值和峰值。
+    """
+
+    def __init__(self, fetch, meter, interval=MAX_BATCH, on_readings=None):
+        self.fetch = fetch
+        self.meter = meter
+        self.batch = batch_duration(interval)
+        self.on_readings = on_readings
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        self._latest = (None, None)
+        self._running = False
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._stop_event.clear()
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._running = False
+        self._stop_event.set()
+
+    def running(self):
+        return self._running
+
+    def latest(self, name):
+        with self._lock:
+            return self._latest if name == 'power' else (None, None)
+
+    def stats(self):
+        with self._lock:
+            sampled_at = self._latest[1]
+        return {
+            'power': {
+                'batch': self.batch,
+                'sampled_at': sampled_at,
+                'batches': self.batches,
+                'samples': self.meter.samples,
+                'errors': self.errors,
+                'last_error': self.last_error
+            }
+        }
+
+    def _run(self):
+        while self._running:
+            try:
+                readings = self.fetch(self.batch)
+            except Exception as e:
+                if not self._running:
+                    break  # 已停止，shell通道被关闭导致的错误不再记录
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"读取电流/电压失败: {str(e)}")
+                if self._stop_event.wait(self.batch):
+                    break
+                continue
+            if not readings:
+                # 设备没有电池节点：按批次时长等待，避免空转
+                if self._stop_event.wait(self.batch):
+                    break
+                continue
+            self.meter.add(readings)
+            if self.on_readings:
+                self.on_readings(readings)
+            with self._lock:
+                self._latest = (summarize_batch(readings), readings[-1][0])
+                self.batches += 1
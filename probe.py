@@ -0,0 +1,243 @@
+import time
+
+import snapshot
+
+PROBE_MARK = '@@probe '
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+CPU_POSSIBLE_PATH = '/sys/devices/system/cpu/possible'
+
+# CPU频率节点，按优先级排列（cpuinfo_cur_freq在多数设备上需要root）
+CPU_FREQ_CANDIDATES = [
+    ('scaling_cur_freq', '/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq'),
+    ('cpuinfo_cur_freq', '/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_freq'),
+]
+
+# 不同设备GPU频率文件路径可能不同
+GPU_FREQ_CANDIDATES = [
+    '/sys/class/kgsl/kgsl-3d0/gpuclk',
+    '/sys/class/kgsl/kgsl-3d0/devfreq/cur_freq',
+    '/sys/class/kgsl/kgsl-3d0/freq',
+    '/sys/kernel/gpu/gpu_clock',
+    '/sys/class/devfreq/gpufreq/cur_freq',
+    '/sys/class/kgsl/kgsl-3d0/clock',
+    '/sys/kernel/debug/gpu/clock',
+    '/sys/devices/platform/kgsl-3d0/kgsl/kgsl-3d0/gpuclk',
+    '/sys/devices/soc/1c00000.qcom,kgsl-3d0/kgsl/kgsl-3d0/gpuclk',
+    '/sys/devices/platform/gpusysfs/gpu_clock'
+]
+
+GPU_LOAD_CANDIDATES = [
+    '/sys/class/kgsl/kgsl-3d0/gpu_busy_percentage',
+    '/sys/class/kgsl/kgsl-3d0/devfreq/gpu_load',
+    '/sys/kernel/gpu/gpu_busy',
+]
+
+
+class DeviceCapabilities:
+    """一台设备上实际可用的数据源，探测一次后按序列号缓存"""
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.boot_id = None
+        self.probed_at = None
+        self.shell_restarts = 0
+        self.cpu_cores = 0
+        self.cpu_freq_source = None
+        self.gpu_freq_path = None
+        self.gpu_freq_unit = None
+        self.gpu_load_path = None
+        self.battery_path = None
+        # 电池电流/电压的单位和方向，以及高频读取使用的current_now/voltage_now节点
+        self.battery_calibration = None
+        self.current_path = None
+        self.voltage_path = None
+        self.fps_method = None
+        # 各指标的探测说明，不可用的指标在这里给出原因
+        self.sources = {}
+        self.reasons = {}
+        self._snapshot_commands = {}
+
+    def available(self, metric):
+        """指标是否有可用的数据源"""
+        return metric not in self.reasons
+
+    def cpu_freq_glob(self):
+        if not self.cpu_freq_source:
+            return None
+        return f'/sys/devices/system/cpu/cpu[0-9]*/cpufreq/{self.cpu_freq_source}'
+
+    def snapshot_command(self, groups=snapshot.SNAPSHOT_GROUPS):
+        """生成（并缓存）只读取指定分组中探测可用节点的快照命令"""
+        groups = tuple(groups)
+        command = self._snapshot_commands.get(groups)
+        if command is None:
+            command = snapshot.build_snapshot_command(
+                proc_stat=snapshot.PROC_STAT if 'cpu' in groups else None,
+                cpu_freq_glob=self.cpu_freq_glob() if 'cpu' in groups else None,
+                gpu_freq_paths=[self.gpu_freq_path] if self.gpu_freq_path and 'gpu' in groups else [],
+                gpu_load_paths=[self.gpu_load_path] if self.gpu_load_path and 'gpu' in groups else [],
+                power_supply_glob=self.battery_path if 'battery' in groups else None
+            )
+            self._snapshot_commands[groups] = command
+        return command
+
+    def parse_snapshot(self, output, timestamp):
+        """解析snapshot_command的输出，只使用探测确认可用的GPU节点"""
+        return snapshot.parse_snapshot(
+            output, timestamp,
+            gpu_freq_paths=[self.gpu_freq_path] if self.gpu_freq_path else [],
+            gpu_load_paths=[self.gpu_load_path] if self.gpu_load_path else [],
+            gpu_freq_unit=self.gpu_freq_unit,
+            battery_calibration=self.battery_calibration
+        )
+
+    def to_dict(self):
+        return {
+            'serial': self.serial,
+            'boot_id': self.boot_id,
+            'probed_at': self.probed_at,
+            'cpu_cores': self.cpu_cores,
+            'cpu_freq_source': self.cpu_freq_source,
+            'gpu_freq_path': self.gpu_freq_path,
+            'gpu_freq_unit': self.gpu_freq_unit,
+            'gpu_load_path': self.gpu_load_path,
+            'battery_path': self.battery_path,
+            'battery_calibration': self.battery_calibration,
+            'current_path': self.current_path,
+            'voltage_path': self.voltage_path,
+            'fps_method': self.fps_method,
+            'sources': dict(self.sources),
+            'unavailable': dict(self.reasons)
+        }
+
+
+def build_probe_command():
+    """生成一次性探测所有候选节点的设备端命令
+
+    每个候选节点输出一行 "@@probe <状态> <路径>"，状态为 ok/denied/missing，
+    ok时紧跟节点内容，便于判断单位。
+    """
+    paths = [BOOT_ID_PATH, CPU_POSSIBLE_PATH] + [path for _, path in CPU_FREQ_CANDIDATES]
+    paths += GPU_FREQ_CANDIDATES + GPU_LOAD_CANDIDATES + [snapshot.POWER_SUPPLY_GLOB]
+    files = ' '.join(paths)
+    return (
+        f'for f in {files}; do '
+        f'if [ ! -e "$f" ]; then echo "{PROBE_MARK}missing $f"; '
+        f'elif v=$(cat "$f" 2>/dev/null); then echo "{PROBE_MARK}ok $f"; echo "$v"; '
+        f'else echo "{PROBE_MARK}denied $f"; fi; done; '
+        f'echo "{PROBE_MARK}ok surfaceflinger"; dumpsys SurfaceFlinger --latency 2>&1 | head -1; '
+        f'echo "{PROBE_MARK}ok gfxinfo"; dumpsys gfxinfo 2>&1 | head -3; '
+        f'echo "{PROBE_MARK}end"'
+    )
+
+
+def split_probe(output):
+    """把探测输出切分为 {路径: (状态, 内容)}"""
+    results = {}
+    path = None
+    status = None
+    lines = []
+    for line in output.split('\n') + [PROBE_MARK + 'end']:
+        if line.startswith(PROBE_MARK):
+            if path is not None:
+                results[path] = (status, '\n'.join(lines).strip())
+            parts = line[len(PROBE_MARK):].split(' ', 1)
+            status = parts[0]
+            path = parts[1].strip() if len(parts) > 1 else None
+            lines = []
+        elif path is not None:
+            lines.append(line)
+    return results
+
+
+def _describe(results, paths):
+    """汇总候选节点的状态，用于说明指标不可用的原因"""
+    statuses = [results.get(path, ('missing', ''))[0] for path in paths]
+    if 'denied' in statuses:
+        denied = [path for path, status in zip(paths, statuses) if status == 'denied']
+        return f"节点存在但无读取权限（需要root）: {', '.join(denied)}"
+    if 'ok' in statuses:
+        return '节点可读但内容无法解析'
+    return '设备上不存在候选节点'
+
+
+def parse_cpu_possible(text):
+    """/sys/devices/system/cpu/possible 的核心数，格式通常为"0-7"表示8个核心"""
+    try:
+        return int(text.split(',')[-1].split('-')[-1]) + 1
+    except ValueError:
+        return 0
+
+
+def parse_probe(output, serial):
+    """解析探测输出，返回DeviceCapabilities"""
+    results = split_probe(output)
+    caps = DeviceCapabilities(serial)
+    caps.probed_at = time.time()
+    caps.boot_id = results.get(BOOT_ID_PATH, (None, ''))[1] or None
+
+    status, possible = results.get(CPU_POSSIBLE_PATH, ('missing', ''))
+    if status == 'ok' and possible:
+        caps.cpu_cores = parse_cpu_possible(possible)
+
+    for source, path in CPU_FREQ_CANDIDATES:
+        status, value = results.get(path, ('missing', ''))
+        if status == 'ok' and value.isdigit():
+            caps.cpu_freq_source = source
+            caps.sources['cpu_freq'] = path.replace('cpu0', 'cpu*')
+            break
+    else:
+        caps.reasons['cpu_freq'] = _describe(results, [path for _, path in CPU_FREQ_CANDIDATES])
+
+    caps.sources['cpu_load'] = snapshot.PROC_STAT
+
+    for path in GPU_FREQ_CANDIDATES:
+        status, value = results.get(path, ('missing', ''))
+        number = snapshot.parse_int(value) if status == 'ok' else None
+        if number:
+            caps.gpu_freq_path = path
+            caps.gpu_freq_unit = 'Hz' if number > 1000000 else 'kHz' if number > 1000 else 'MHz'
+            caps.sources['gpu_freq'] = path
+            break
+    else:
+        caps.reasons['gpu_freq'] = _describe(results, GPU_FREQ_CANDIDATES)
+
+    for path in GPU_LOAD_CANDIDATES:
+        status, value = results.get(path, ('missing', ''))
+        if status == 'ok' and snapshot.parse_int(value) is not None:
+            caps.gpu_load_path = path
+            caps.sources['gpu_load'] = path
+            break
+    else:
+        caps.reasons['gpu_load'] = _describe(results, GPU_LOAD_CANDIDATES)
+
+    uevents = {path: value for path, (status, value) in results.items()
+               if status == 'ok' and path.startswith('/sys/class/power_supply/')}
+    for path in sorted(uevents):
+        values = snapshot.parse_uevent(uevents[path])
+        if values.get('POWER_SUPPLY_TYPE') == 'Battery' and 'POWER_SUPPLY_CURRENT_NOW' in values:
+            caps.battery_path = path
+            caps.sources['battery'] = path
+            caps.battery_calibration = snapshot.battery_calibration(values)
+            # uevent旁的单个节点，高频读取时不需要解析整个uevent
+            directory = path.rsplit('/', 1)[0]
+            caps.current_path = f'{directory}/current_now'
+            if 'POWER_SUPPLY_VOLTAGE_NOW' in values:
+                caps.voltage_path = f'{directory}/voltage_now'
+            break
+    else:
+        caps.reasons['battery'] = '未找到带CURRENT_NOW的电池power_supply节点'
+
+    # SurfaceFlinger --latency 第一行为刷新周期（纳秒）
+    surfaceflinger = results.get('surfaceflinger', ('missing', ''))[1]
+    gfxinfo = results.get('gfxinfo', ('missing', ''))[1]
+    if surfaceflinger.split('\n')[0].strip().isdigit():
+        caps.fps_method = 'surfaceflinger'
+    elif gfxinfo and 'not found' not in gfxinfo.lower() and 'denial' not in gfxinfo.lower():
+        caps.fps_method = 'gfxinfo'
+    if caps.fps_method:
+        caps.sources['fps'] = caps.fps_method
+    else:
+        caps.reasons['fps'] = 'SurfaceFlinger --latency 与 gfxinfo 均不可用'
+
+    return caps
@@ -0,0 +1,249 @@
+import math
+
+# 汇总分辨率（秒）及对应的表名
+RESOLUTIONS = (1, 10, 60)
+# 参与汇总的指标；cpu_load/cpu_freq取所有核心的平均值
+ROLLUP_METRICS = ('fps', 'cpu_load', 'cpu_freq', 'gpu_load', 'gpu_freq', 'current', 'power')
+STATS = ('min', 'max', 'mean', 'last')
+# 范围查询默认返回的最大点数
+DEFAULT_MAX_POINTS = 2000
+# 选择数据层级时允许的点数倍数，超出部分再做降采样
+LEVEL_OVERSAMPLE = 4
+
+
+def table_name(resolution):
+    return f'rollup_{resolution}s'
+
+
+def rollup_columns():
+    return [f'{metric}_{stat}' for metric in ROLLUP_METRICS for stat in STATS]
+
+
+def create_tables(db):
+    columns = ', '.join(f'{column} REAL' for column in rollup_columns())
+    for resolution in RESOLUTIONS:
+        db.execute(f'CREATE TABLE IF NOT EXISTS {table_name(resolution)} '
+                   f'(timestamp REAL PRIMARY KEY, count INTEGER, {columns})')
+
+
+def metric_value(row, metric):
+    """从展开后的样本行中取指标值，按核心分列的指标取平均值"""
+    if metric in ('cpu_load', 'cpu_freq'):
+        values = [value for column, value in row.items()
+                  if column.startswith(metric + '_') and column[len(metric) + 1:].isdigit() and value is not None]
+        return sum(values) / len(values) if values else None
+    return row.get(metric)
+
+
+class _Bucket:
+    __slots__ = ('start', 'count', 'stats')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        # 指标 -> [min, max, sum, n, last]
+        self.stats = {}
+
+    def add(self, values):
+        self.count += 1
+        for metric, value in values.items():
+            if value is None:
+                continue
+            stat = self.stats.get(metric)
+            if stat is None:
+                self.stats[metric] = [value, value, value, 1, value]
+            else:
+                stat[0] = min(stat[0], value)
+                stat[1] = max(stat[1], value)
+                stat[2] += value
+                stat[3] += 1
+                stat[4] = value
+
+    def row(self):
+        values = [self.start, self.count]
+        for metric in ROLLUP_METRICS:
+            stat = self.stats.get(metric)
+            if stat is None:
+                values += [None] * len(STATS)
+            else:
+                values += [stat[0], stat[1], stat[2] / stat[3], stat[4]]
+        return values
+
+
+# 增量汇总
+class Rollup:
+    """样本到达时增量更新各分辨率的min/max/mean/last
+
+    每个分辨率只保留当前未结束的一个时间桶，桶结束后交给调用方写入磁盘，
+    因此内存占用与录制时长无关。
+    """
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = resolutions
+        self._buckets = {}
+
+    def add(self, row):
+        """加入一个展开后的样本行，返回已结束的桶 [(分辨率, 行值列表)]"""
+        timestamp = row['timestamp']
+        values = {metric: metric_value(row, metric) for metric in ROLLUP_METRICS}
+        finished = []
+        for resolution in self.resolutions:
+            start = math.floor(timestamp / resolution) * resolution
+            bucket = self._buckets.get(resolution)
+            if bucket is not None and bucket.start != start:
+                finished.append((resolution, bucket.row()))
+                bucket = None
+            if bucket is None:
+                bucket = self._buckets[resolution] = _Bucket(start)
+            bucket.add(values)
+        return finished
+
+    def drain(self):
+        """结束所有未完成的桶（停止录制时调用）"""
+        finished = [(resolution, bucket.row()) for resolution, bucket in sorted(self._buckets.items())]
+        self._buckets = {}
+        return finished
+
+
+def write_buckets(db, buckets):
+    placeholders = ', '.join('?' for _ in range(len(rollup_columns()) + 2))
+    for resolution, values in buckets:
+        db.execute(f'INSERT OR REPLACE INTO {table_name(resolution)} VALUES ({placeholders})', values)
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets降采样，保留曲线形状，返回不超过threshold个点"""
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        next_bucket = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+        # 当前桶中与前一个选中点、下一桶平均点构成最大三角形的点
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best = start
+        best_area = -1
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax(points, threshold):
+    """按时间等分为threshold/2个桶，每桶保留最小值和最大值，不会丢失尖峰"""
+    if threshold >= len(points) or threshold < 2:
+        return list(points)
+    buckets = threshold // 2
+    start_time = points[0][0]
+    span = (points[-1][0] - start_time) or 1
+    sampled = []
+    current = None
+    low = high = None
+    for point in points:
+        index = min(buckets - 1, int((point[0] - start_time) / span * buckets))
+        if index != current:
+            if current is not None:
+                sampled += sorted({low, high})
+            current = index
+            low = high = point
+        else:
+            if point[1] < low[1]:
+                low = point
+            if point[1] > high[1]:
+                high = point
+    sampled += sorted({low, high})
+    return sampled
+
+
+def _time_range(db, start, end):
+    first, last = db.execute('SELECT MIN(timestamp), MAX(timestamp) FROM samples').fetchone()
+    start = first if start is None else start
+    end = last if end is None else end
+    return start, end
+
+
+def _rollup_tables(db):
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [resolution for resolution in RESOLUTIONS if table_name(resolution) in tables]
+
+
+def _raw_series(db, metric, start, end):
+    columns = [row[1] for row in db.execute('PRAGMA table_info(samples)')]
+    if metric in ('cpu_load', 'cpu_freq'):
+        selected = [column for column in columns
+                    if column.startswith(metric + '_') and column[len(metric) + 1:].isdigit()]
+    else:
+        selected = [metric] if metric in columns else []
+    if not selected:
+        return []
+    cursor = db.execute(f"SELECT timestamp, {', '.join(selected)} FROM samples "
+                        f"WHERE timestamp >= ? AND timestamp <= ? ORDER BY timestamp", (start, end))
+    points = []
+    for row in cursor:
+        values = [value for value in row[1:] if value is not None]
+        if values:
+            points.append((row[0], sum(values) / len(values)))
+    return points
+
+
+def query_range(db, metric, start=None, end=None, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """返回时间范围内某个指标的降采样序列，点数不超过max_points
+
+    优先使用满足点数要求的最细数据层级（原始样本或1s/10s/60s汇总），
+    点数仍然过多时再用LTTB或min/max降采样。
+    """
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f'不支持的指标: {metric}')
+    start, end = _time_range(db, start, end)
+    result = {'metric': metric, 'start': start, 'end': end, 'resolution': 'raw', 'points': []}
+    if start is None or end is None:
+        return result
+
+    raw_count = db.execute('SELECT COUNT(*) FROM samples WHERE timestamp >= ? AND timestamp <= ?',
+                           (start, end)).fetchone()[0]
+    level = None
+    if raw_count > max_points * LEVEL_OVERSAMPLE:
+        for resolution in _rollup_tables(db):
+            level = resolution
+            if (end - start) / resolution <= max_points * LEVEL_OVERSAMPLE:
+                break
+
+    if level is None:
+        points = _raw_series(db, metric, start, end)
+    else:
+        result['resolution'] = f'{level}s'
+        table = table_name(level)
+        # 时间桶以起点为时间戳，包含start所在的桶
+        since = math.floor(start / level) * level
+        if method == 'minmax':
+            # min/max降采样需要每个桶的极值，而不只是平均值
+            points = []
+            for row in db.execute(
+                    f'SELECT timestamp, {metric}_min, {metric}_max FROM {table} '
+                    f'WHERE timestamp >= ? AND timestamp <= ? AND {metric}_min IS NOT NULL ORDER BY timestamp',
+                    (since, end)):
+                points.append((row[0], row[1]))
+                if row[2] != row[1]:
+                    points.append((row[0] + level / 2, row[2]))
+        else:
+            points = db.execute(
+                f'SELECT timestamp, {metric}_mean FROM {table} '
+                f'WHERE timestamp >= ? AND timestamp <= ? AND {metric}_mean IS NOT NULL ORDER BY timestamp',
+                (since, end)).fetchall()
+
+    downsample = minmax if method == 'minmax' else lttb
+    result['points'] = [[round(t, 3), round(v, 2)] for t, v in downsample(points, max_points)]
+    return result
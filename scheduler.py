@@ -0,0 +1,116 @@
+import time
+import threading
+
+
+class CollectorTask:
+    """一个按固定周期运行的采集任务及其运行统计"""
+
+    def __init__(self, name, func, interval=None):
+        self.name = name
+        self.func = func
+        # interval为None表示只运行一次（例如设备属性）
+        self.interval = interval
+        self.value = None
+        self.sampled_at = None
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_duration = None
+
+    def to_dict(self):
+        return {
+            'interval': self.interval,
+            'sampled_at': self.sampled_at,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'last_duration': round(self.last_duration, 4) if self.last_duration is not None else None
+        }
+
+
+# 采集任务调度器
+class CollectorScheduler:
+    """每个采集任务在独立的（绿色）线程中按自己的周期运行
+
+    使用截止时间计时：下一次运行时间 = 上一次截止时间 + 周期，与本次耗时无关；
+    耗时超过周期时跳过错过的截止时间并计入skipped，而不是连续补跑。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._running = False
+
+    def add(self, name, func, interval=None):
+        """注册采集任务，需在start之前调用；周期必须为正数，否则抛出ValueError"""
+        if interval is not None and not (0 < interval < float('inf')):
+            raise ValueError(f'采集任务 {name} 的周期无效: {interval}')
+        self._tasks[name] = CollectorTask(name, func, interval)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._stop_event.clear()
+        for task in self._tasks.values():
+            thread = threading.Thread(target=self._run_task, args=(task,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        self._stop_event.set()
+        self._threads = []
+
+    def running(self):
+        return self._running
+
+    def latest(self, name):
+        """返回任务最近一次的结果和实际采样时间 (value, sampled_at)"""
+        task = self._tasks.get(name)
+        if task is None:
+            return None, None
+        with self._lock:
+            return task.value, task.sampled_at
+
+    def stats(self):
+        with self._lock:
+            return {name: task.to_dict() for name, task in self._tasks.items()}
+
+    def _run_task(self, task):
+        deadline = time.monotonic()
+        while self._running:
+            sampled_at = time.time()
+            started = time.monotonic()
+            try:
+                value = task.func()
+                with self._lock:
+                    task.value = value
+                    task.sampled_at = sampled_at
+                    task.last_error = None
+            except Exception as e:
+                if not self._running:
+                    break  # 已停止，shell通道被关闭导致的错误不再记录
+                with self._lock:
+                    task.errors += 1
+                    task.last_error = str(e)
+                print(f"采集任务 {task.name} 失败: {str(e)}")
+            task.runs += 1
+            task.last_duration = time.monotonic() - started
+
+            if task.interval is None:
+                break
+            deadline += task.interval
+            now = time.monotonic()
+            if now > deadline:
+                # 本次耗时超过了周期，记录错过的次数并对齐到下一个截止时间
+                missed = int((now - deadline) // task.interval) + 1
+                task.skipped += missed
+                deadline += missed * task.interval
+            if self._stop_event.wait(deadline - now):
+                break
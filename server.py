@@ -2,12 +2,25 @@ import os
 import re
 import json
 import time
-import subprocess
 import threading
 import eventlet
 eventlet.monkey_patch()
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import alerts
+import export
+import rollup
+import analysis
+import capture
+import metrics
+import jobs
+import storage
+import supervisor
+from adb_tools import ADBTools, normalize_address
+from session import SessionManager, parse_interval
+from telemetry import TelemetryHub, WIRE_VERSION
+from device_watcher import DeviceWatcher
+from wireless import WirelessManager
 
 # 初始化Flask和Socket.IO
 app = Flask(__name__)
@@ -15,507 +28,159 @@ app.config['SECRET_KEY'] = 'performance_monitor_secret'
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', logger=True, engineio_logger=True)
 
 # 全局变量
+# connected_device为网页当前选中的设备，各设备的监控状态由会话管理器保存
 connected_device = None
-monitoring = False
-monitor_thread = None
-
-# ADB命令工具类
-class ADBTools:
-    @staticmethod
-    def get_adb_path():
-        """获取ADB可执行文件的路径"""
-        # 首先检查内置ADB路径
-        adb_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'adb', 'adb.exe')
-        if os.path.exists(adb_path):
-            return adb_path
-        # 如果内置ADB不存在，返回系统ADB命令
-        return 'adb'
-
-    @staticmethod
-    def check_adb():
-        """检查ADB是否可用"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 检查ADB版本和设备连接状态
-            version_output = subprocess.check_output([adb_path, 'version'], universal_newlines=True)
-            devices_output = subprocess.check_output([adb_path, 'devices'], universal_newlines=True)
-            
-            # 验证是否有设备连接
-            if 'List of devices attached' in devices_output and len(devices_output.strip().split('\n')) > 1:
-                return True
-            return False
-        except Exception as e:
-            print(f"ADB检查失败: {str(e)}")
-            return False
 
-    @staticmethod
-    def get_device_info():
-        """获取设备信息（型号、系统版本、安卓版本）"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 获取设备型号
-            model_result = subprocess.check_output(
-                [adb_path, 'shell', 'getprop', 'ro.product.model'],
-                universal_newlines=True
-            )
-            model = model_result.strip()
-            
-            # 获取设备品牌
-            brand_result = subprocess.check_output(
-                [adb_path, 'shell', 'getprop', 'ro.product.brand'],
-                universal_newlines=True
-            )
-            brand = brand_result.strip()
-            
-            # 组合完整型号
-            full_model = f"{brand} {model}"
-            
-            # 获取系统版本
-            os_version_result = subprocess.check_output(
-                [adb_path, 'shell', 'getprop', 'ro.build.version.release'],
-                universal_newlines=True
-            )
-            os_version = os_version_result.strip()
-            
-            # 获取安卓API级别
-            api_level_result = subprocess.check_output(
-                [adb_path, 'shell', 'getprop', 'ro.build.version.sdk'],
-                universal_newlines=True
-            )
-            api_level = api_level_result.strip()
-            
-            return {
-                'model': full_model,
-                'os_version': os_version,
-                'api_level': api_level
-            }
-        except Exception as e:
-            print(f"获取设备信息失败: {str(e)}")
-            return {'model': '未知', 'os_version': '未知', 'api_level': '未知'}
-    
-    @staticmethod
-    def get_devices():
-        """获取已连接的设备列表"""
-        devices = []
-        try:
-            adb_path = ADBTools.get_adb_path()
-            result = subprocess.check_output([adb_path, 'devices'], universal_newlines=True)
-            lines = result.strip().split('\n')[1:]
-            for line in lines:
-                if line.strip() and '\t' in line:
-                    device_id, status = line.split('\t')
-                    if status == 'device':
-                        devices.append(device_id)
-            return devices
-        except:
-            return []
-    
-    @staticmethod
-    def connect_wireless(ip):
-        """无线连接设备"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 先尝试断开所有连接
-            subprocess.call([adb_path, 'disconnect'])
-            # 连接到指定IP
-            result = subprocess.check_output([adb_path, 'connect', f"{ip}:5555"], universal_newlines=True)
-            if 'connected' in result.lower():
-                return True, result
-            return False, result
-        except Exception as e:
-            return False, str(e)
-    
-    @staticmethod
-    def get_fps():
-        """获取当前FPS"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 使用多种方法尝试获取FPS
-            
-            # 方法1: 使用SurfaceFlinger
-            try:
-                # 先清除历史数据
-                subprocess.check_output(
-                    [adb_path, 'shell', 'dumpsys', 'SurfaceFlinger', '--latency-clear'],
-                    universal_newlines=True
-                )
-                time.sleep(0.5)  # 等待收集数据
-                
-                # 获取当前活动窗口（Windows兼容方式）
-                window_cmd = subprocess.check_output(
-                    [adb_path, 'shell', 'dumpsys', 'window'],
-                    universal_newlines=True
-                ).strip()
-                
-                # 手动查找mCurrentFocus
-                current_focus = ""
-                for line in window_cmd.split('\n'):
-                    if 'mCurrentFocus' in line:
-                        current_focus = line.strip()
-                        break
-                
-                # 尝试多种可能的窗口名称
-                window_names = ['SurfaceView']
-                
-                # 添加当前活动窗口
-                if '/' in window_cmd:
-                    current_window = window_cmd.split('/')[0].split(' ')[-1]
-                    window_names.append(current_window)
-                
-                # 添加常见系统窗口
-                window_names.extend(['com.android.systemui', 'com.android.launcher3', 'StatusBar'])
-                
-                for window_name in window_names:
-                    try:
-                        result = subprocess.check_output(
-                            [adb_path, 'shell', 'dumpsys', 'SurfaceFlinger', '--latency', window_name],
-                            universal_newlines=True, stderr=subprocess.STDOUT, timeout=1
-                        )
-                        lines = result.strip().split('\n')
-                        if len(lines) > 1 and not 'not found' in result.lower():
-                            # 计算帧率
-                            frame_count = len(lines) - 1
-                            if frame_count > 0 and frame_count < 120:  # 合理的FPS范围
-                                print(f"成功从窗口 {window_name} 获取FPS: {frame_count}")
-                                return frame_count
-                    except Exception as e:
-                        print(f"尝试从 {window_name} 获取FPS失败: {str(e)}")
-                        continue
-            except Exception as e:
-                print(f"SurfaceFlinger方法获取FPS失败: {str(e)}")
-            
-            # 方法2: 使用gfxinfo
-            try:
-                # 获取前台应用包名（Windows兼容方式）
-                foreground_app = subprocess.check_output(
-                    [adb_path, 'shell', 'dumpsys', 'window'],
-                    universal_newlines=True
-                )
-                package_name = None
-                # 手动查找mCurrentFocus
-                for line in foreground_app.split('\n'):
-                    if 'mCurrentFocus' in line:
-                        if '/' in line:
-                            package_name = line.split('/')[0].split(' ')[-1]
-                        break
-                
-                if package_name:
-                    # 重置gfxinfo统计
-                    subprocess.check_output(
-                        [adb_path, 'shell', 'dumpsys', 'gfxinfo', package_name, 'reset'],
-                        universal_newlines=True
-                    )
-                    time.sleep(0.5)  # 等待收集数据
-                    
-                    # 获取gfxinfo统计
-                    gfx_result = subprocess.check_output(
-                        [adb_path, 'shell', 'dumpsys', 'gfxinfo', package_name],
-                        universal_newlines=True
-                    )
-                    
-                    # 解析总帧数和卡顿帧数
-                    if 'Total frames rendered' in gfx_result:
-                        total_frames_line = next((line for line in gfx_result.split('\n') if 'Total frames rendered' in line), None)
-                        if total_frames_line:
-                            total_frames = int(total_frames_line.split(':')[1].strip())
-                            if 0 < total_frames < 120:  # 合理的FPS范围
-                                return total_frames
-            except Exception as e:
-                print(f"使用gfxinfo获取FPS失败: {str(e)}")
-            
-            # 方法3: 使用固定值作为备选
-            # 如果所有方法都失败，返回一个合理的估计值
-            return 60  # 大多数设备的标准刷新率
-        except Exception as e:
-            print(f"获取FPS失败: {str(e)}")
-            return 60  # 返回默认值而不是0，避免图表显示异常
-    
-    @staticmethod
-    def get_cpu_freq():
-        """获取每个CPU核心的频率 (MHz)"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 获取CPU核心数
-            core_count = 0
-            try:
-                result = subprocess.check_output(
-                    [adb_path, 'shell', 'cat', '/sys/devices/system/cpu/possible'],
-                    universal_newlines=True
-                )
-                if result.strip():
-                    # 格式通常为"0-7"表示8个核心
-                    cores = result.strip().split('-')
-                    core_count = int(cores[-1]) + 1
-            except:
-                core_count = 8  # 默认假设8核
-
-            # 获取每个核心的频率
-            core_freqs = {}
-            for i in range(core_count):
-                try:
-                    # 尝试读取每个核心的频率
-                    paths = [
-                        f'/sys/devices/system/cpu/cpu{i}/cpufreq/scaling_cur_freq',
-                        f'/sys/devices/system/cpu/cpu{i}/cpufreq/cpuinfo_cur_freq'
-                    ]
-                    
-                    for path in paths:
-                        try:
-                            result = subprocess.check_output(
-                                [adb_path, 'shell', 'cat', path],
-                                universal_newlines=True, stderr=subprocess.DEVNULL
-                            )
-                            if result.strip() and result.strip().isdigit():
-                                core_freqs[f'core_{i}'] = int(result.strip()) // 1000
-                                break
-                        except:
-                            continue
-                    
-                    if f'core_{i}' not in core_freqs:
-                        core_freqs[f'core_{i}'] = 1500  # 默认值
-                except:
-                    core_freqs[f'core_{i}'] = 1500  # 默认值
-            
-            return core_freqs
-        except Exception as e:
-            print(f"获取CPU频率失败: {str(e)}")
-            return {'core_0': 1500}  # 至少返回一个核心的默认值
+def socket_emit(event, data, **kwargs):
+    """Socket.IO推送，同时计入推送次数和数据量"""
+    metrics.record_emit(event, data)
+    socketio.emit(event, data, **kwargs)
 
-    _prev_cpu_stats = {}
+def emit_to_client(event, data, sid, callback):
+    socket_emit(event, data, to=sid, callback=callback)
 
-    @staticmethod
-    def get_cpu_load():
-        """获取每个CPU核心的负载 (%)"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 获取每个核心的负载
-            result = subprocess.check_output(
-                [adb_path, 'shell', 'cat', '/proc/stat'],
-                universal_newlines=True
-            )
-            
-            current_stats = {}
-            core_loads = {}
-            
-            for line in result.split('\n'):
-                if line.startswith('cpu'):
-                    parts = line.split()
-                    if len(parts) >= 8:
-                        cpu_num = parts[0]
-                        if cpu_num == 'cpu':
-                            continue  # 跳过总体CPU统计
-                        
-                        # 收集当前CPU时间
-                        user = int(parts[1])
-                        nice = int(parts[2])
-                        system = int(parts[3])
-                        idle = int(parts[4])
-                        iowait = int(parts[5])
-                        irq = int(parts[6])
-                        softirq = int(parts[7])
-                        steal = int(parts[8]) if len(parts) > 8 else 0
-                        
-                        core_num = int(cpu_num.replace('cpu', ''))
-                        current_stats[f'core_{core_num}'] = {
-                            'total': user + nice + system + idle + iowait + irq + softirq + steal,
-                            'idle': idle + iowait
-                        }
-                        
-                        # 计算CPU使用率
-                        if f'core_{core_num}' in ADBTools._prev_cpu_stats:
-                            prev = ADBTools._prev_cpu_stats[f'core_{core_num}']
-                            total_delta = current_stats[f'core_{core_num}']['total'] - prev['total']
-                            idle_delta = current_stats[f'core_{core_num}']['idle'] - prev['idle']
-                            
-                            if total_delta > 0:
-                                load = int(100.0 * (total_delta - idle_delta) / total_delta)
-                                core_loads[f'core_{core_num}'] = min(100, max(0, load))
-                            else:
-                                core_loads[f'core_{core_num}'] = 0
-                        else:
-                            core_loads[f'core_{core_num}'] = 0
-            
-            # 更新历史数据
-            ADBTools._prev_cpu_stats = current_stats
-            
-            return core_loads if core_loads else {'core_0': 0}
-        except Exception as e:
-            print(f"获取CPU负载失败: {str(e)}")
-            return {'core_0': 0}  # 至少返回一个核心的默认值
+# 性能数据按客户端排队推送，慢的网页不会拖慢其他网页
+telemetry = TelemetryHub(emit_to_client)
 
-    @staticmethod
-    def get_gpu_load():
-        """获取GPU负载 (%)，优先使用无需root权限的方法"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            paths = [
-                '/sys/class/kgsl/kgsl-3d0/gpu_busy_percentage',
-                '/sys/class/kgsl/kgsl-3d0/devfreq/gpu_load'
-            ]
-            
-            # 首先尝试不使用root权限读取
-            for path in paths:
-                try:
-                    result = subprocess.check_output(
-                        [adb_path, 'shell', f'cat {path}'],
-                        universal_newlines=True,
-                        stderr=subprocess.PIPE
-                    )
-                    if result.strip() and not 'Permission denied' in result:
-                        return int(result.strip())
-                except Exception as e:
-                    continue
-            
-            # 如果无法访问，返回估算值
-            print("无法访问GPU负载数据（设备未root），将返回估算值")
-            return 30  # 返回一个合理的估计值
-        except Exception as e:
-            print(f"获取GPU负载失败: {str(e)}")
-            return 0
+def publish(serial, event, data):
+    """推送会话数据：性能数据交给遥测队列，其他事件推送到该设备的Socket.IO房间"""
+    if event == 'performance_data':
+        telemetry.publish(serial, data)
+    else:
+        socket_emit(event, data, to=serial)
 
-    @staticmethod
-    def get_gpu_freq():
-        """获取GPU频率 (MHz)，优先使用无需root权限的方法"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            # 不同设备GPU频率文件路径可能不同，这里尝试更多可能的路径
-            paths = [
-                '/sys/class/kgsl/kgsl-3d0/gpuclk',
-                '/sys/class/kgsl/kgsl-3d0/devfreq/cur_freq',
-                '/sys/class/kgsl/kgsl-3d0/freq',
-                '/sys/kernel/gpu/gpu_clock',
-                '/sys/class/devfreq/gpufreq/cur_freq',
-                '/sys/class/kgsl/kgsl-3d0/clock',
-                '/sys/kernel/debug/gpu/clock',
-                '/sys/devices/platform/kgsl-3d0/kgsl/kgsl-3d0/gpuclk',
-                '/sys/devices/soc/1c00000.qcom,kgsl-3d0/kgsl/kgsl-3d0/gpuclk',
-                '/sys/devices/platform/gpusysfs/gpu_clock'
-            ]
-            
-            # 首先尝试不使用root权限读取
-            for path in paths:
-                try:
-                    result = subprocess.check_output(
-                        [adb_path, 'shell', f'cat {path}'],
-                        universal_newlines=True,
-                        stderr=subprocess.PIPE
-                    )
-                    if result.strip() and not 'Permission denied' in result:
-                        # 尝试转换为整数并计算MHz
-                        value = int(result.strip())
-                        # 根据数值大小判断单位并转换
-                        if value > 1000000:  # Hz
-                            return value // 1000000
-                        elif value > 1000:  # kHz
-                            return value // 1000
-                        else:  # 已经是MHz
-                            return value
-                except Exception as e:
-                    continue
-            
-            # 如果无法访问文件系统，尝试从dumpsys获取GPU信息
-            try:
-                result = subprocess.check_output(
-                    [adb_path, 'shell', 'dumpsys', 'gfxinfo'],
-                    universal_newlines=True
-                )
-                # 解析dumpsys输出以获取GPU相关信息
-                if 'GPU' in result:
-                    return 500  # 返回一个典型的GPU频率值
-            except Exception as e:
-                print(f"从dumpsys获取GPU信息失败: {str(e)}")
-            
-            print("无法访问GPU频率数据，将返回估算值")
-            return 400  # 返回一个合理的默认值
-        except Exception as e:
-            print(f"获取GPU频率失败: {str(e)}")
-            return 400  # 返回默认值而不是0，避免图表显示异常
-    
-    @staticmethod
-    def get_battery_info():
-        """获取电池信息（电流和功率）"""
-        try:
-            adb_path = ADBTools.get_adb_path()
-            result = subprocess.check_output(
-                [adb_path, 'shell', 'dumpsys', 'battery'],
-                universal_newlines=True
-            )
-            
-            # 解析电流 (mA)
-            current = 0
-            voltage = 0
-            for line in result.split('\n'):
-                if 'current now' in line.lower():
-                    try:
-                        current = abs(int(line.split(':')[1].strip()) / 1000)  # 转换为mA
-                    except:
-                        pass
-                elif 'voltage' in line.lower():
-                    try:
-                        voltage = int(line.split(':')[1].strip()) / 1000  # 转换为V
-                    except:
-                        pass
-            
-            # 计算功率 (mW)
-            power = current * voltage
-            
-            return {
-                'current': current,  # mA
-                'power': power       # mW
-            }
-        except:
-            return {'current': 0, 'power': 0}
-
-# 监控线程函数
-def monitor_performance(interval=1.0):
-    global monitoring, connected_device
-    while monitoring:
-        try:
-            # 检查设备是否仍然连接
-            if not connected_device:
-                print("设备连接已断开，停止监控")
-                monitoring = False
-                break
-
-            # 验证ADB连接状态
-            if not ADBTools.check_adb():
-                print("ADB连接异常，等待2秒后重试")
-                time.sleep(2)
-                continue
-
-            # 收集所有性能数据
-            try:
-                fps = ADBTools.get_fps()
-                cpu_freq = ADBTools.get_cpu_freq()
-                gpu_freq = ADBTools.get_gpu_freq()
-                cpu_load = ADBTools.get_cpu_load()
-                gpu_load = ADBTools.get_gpu_load()
-                battery_info = ADBTools.get_battery_info()
-
-                # 构建数据包
-                data = {
-                    'timestamp': time.time(),
-                    'fps': fps,
-                    'cpu_freq': {k: round(v, 2) for k, v in cpu_freq.items()},
-                    'gpu_freq': gpu_freq,
-                    'cpu_load': cpu_load,
-                    'gpu_load': gpu_load,
-                    'current': round(battery_info['current'], 2),
-                    'power': round(battery_info['power'], 2)
-                }
-
-                # 发送数据到前端
-                socketio.emit('performance_data', data)
-            except Exception as e:
-                print(f"性能数据采集错误: {str(e)}")
-                time.sleep(1)
-                continue
-
-            # 根据设置的时间间隔更新
-            time.sleep(interval)
-        except Exception as e:
-            print(f"监控线程异常: {str(e)}")
-            time.sleep(2)
+# 告警规则从 alert_rules.json 读取，所有会话共用，修改后即时生效
+alert_rules = alerts.RuleSet(alerts.load_rules())
+# 环境变量MONITOR_WORKERS大于0时，采集分散到该数量的工作进程中运行（适合同时监控大量设备），
+# 网页进程只负责请求处理和推送；默认在本进程中采集
+MONITOR_WORKERS = int(os.environ.get('MONITOR_WORKERS') or 0)
+if MONITOR_WORKERS > 0:
+    sessions = supervisor.Supervisor(publish, alert_rules, MONITOR_WORKERS)
+else:
+    sessions = SessionManager(publish, alert_rules)
+
+# 正在回放的抓包，键为抓包ID
+replays = {}
+
+# 设备在线状态由常驻的 adb track-devices 推送，监控循环中不再检查ADB
+watcher = DeviceWatcher(ADBTools.get_adb_path)
+
+def on_device_changed(serial, old_state, new_state):
+    """设备连接/断开时暂停或恢复会话，并通知所有网页客户端"""
+    session = sessions.get(serial)
+    if new_state == 'device':
+        if session:
+            session.resume()
+    elif old_state == 'device':
+        if session:
+            session.pause()
+        # 设备已离线，常驻shell和探测结果都不再可用
+        ADBTools.close_shells(serial)
+    print(f"设备 {serial} 状态变化: {old_state} -> {new_state}")
+    socket_emit('device_event', {
+        'serial': serial,
+        'old_state': old_state,
+        'state': new_state,
+        'online': new_state == 'device',
+        'monitoring': bool(session and session.monitoring),
+        'timestamp': time.time()
+    })
+
+watcher.add_listener(on_device_changed)
+
+def online_devices():
+    """在线设备列表，设备跟踪器就绪时直接读内存表"""
+    if watcher.ready():
+        return watcher.online_devices()
+    return ADBTools.get_devices()
+
+# 无线设备池：并行连接、保活，断开后按退避间隔重连（会话由on_device_changed暂停/恢复）
+wireless = WirelessManager(lambda serial: serial in online_devices())
+watcher.add_listener(wireless.on_device_changed)
+
+def on_wireless_changed(address, state, info):
+    socket_emit('wireless_event', info)
+
+wireless.add_listener(on_wireless_changed)
+
+# 连接、读取设备信息、断开等耗时操作在后台任务中运行，请求立即返回任务ID，
+# 进度和结果通过Socket.IO的job_event推送，不阻塞其他请求和各设备的实时推送
+job_manager = jobs.JobManager()
+job_manager.add_listener(lambda info: socket_emit('job_event', info))
+# wait=1时等待任务结束的最长时间（秒）
+JOB_WAIT_TIMEOUT = 60.0
+# 断开设备时等待监控线程结束的时间（秒）
+SESSION_STOP_WAIT = 5.0
+
+def job_response(job, created):
+    """后台任务的响应：默认立即返回任务信息；请求带wait=1时等待任务结束，按任务结果返回（兼容原来的同步接口）"""
+    if request.args.get('wait') == '1':
+        if not job.wait(JOB_WAIT_TIMEOUT):
+            return jsonify({'success': False, 'message': '任务超时', 'job': job.to_dict()})
+        if job.state == 'done':
+            return jsonify(job.result)
+        return jsonify({'success': False, 'message': job.error or '任务已取消', 'job': job.to_dict()})
+    return jsonify({'success': True, 'job': job.to_dict(), 'deduplicated': not created})
+
+def request_serial():
+    """请求中指定的设备序列号，未指定时使用当前选中的设备"""
+    return request.args.get('serial') or connected_device
+
+def probe_capabilities(serial):
+    """连接时重新探测设备数据源，失败时返回None（开始监控时会再次探测）"""
+    try:
+        return ADBTools.probe_device(serial).to_dict()
+    except Exception as e:
+        print(f"探测设备数据源失败: {str(e)}")
+        return None
+
+def device_profile(serial):
+    """设备静态信息（系统属性、CPU拓扑），读取失败时返回None"""
+    try:
+        return ADBTools.get_profile(serial).to_dict()
+    except Exception as e:
+        print(f"读取设备信息失败: {str(e)}")
+        return None
+
+def resolve_recording(session_id):
+    """把设备序列号或会话ID解析为录制ID，正在录制的会话先写入缓冲的样本"""
+    session = sessions.get(session_id) or sessions.find(session_id)
+    recording = session.flush_recording() if session else None
+    return recording or session_id
+
+def export_options():
+    """导出参数：format=csv|ndjson，start/end为Unix时间戳（秒），metrics为逗号分隔的指标名"""
+    fmt = request.args.get('format', 'csv')
+    metrics = [metric for metric in request.args.get('metrics', '').split(',') if metric]
+    return fmt, request.args.get('start', type=float), request.args.get('end', type=float), metrics or None
+
+# Socket.IO事件：客户端按设备加入房间，只接收该设备的数据
+@socketio.on('join_session')
+def on_join_session(data):
+    data = data or {}
+    serial = data.get('serial')
+    if serial:
+        join_room(serial)
+        # protocol为紧凑格式版本，未指定时按旧格式推送字典
+        telemetry.subscribe(request.sid, serial, compact=data.get('protocol') == WIRE_VERSION,
+                            binary=bool(data.get('binary')))
+        # 回放该设备最近的样本，刷新或重连的网页不会丢失已采集的数据
+        session = sessions.get(serial)
+        if session and session.session_id:
+            history = {'serial': serial, 'session_id': session.session_id, 'samples': session.history()}
+            metrics.record_emit('history', history)
+            emit('history', history)
+
+@socketio.on('leave_session')
+def on_leave_session(data):
+    serial = (data or {}).get('serial')
+    if serial:
+        leave_room(serial)
+        telemetry.unsubscribe(request.sid, serial)
+
+@socketio.on('disconnect')
+def on_disconnect():
+    telemetry.unsubscribe(request.sid)
 
 # 路由
 @app.route('/')
@@ -524,100 +189,523 @@ def index():
 
 @app.route('/api/check_adb', methods=['GET'])
 def check_adb():
-    return jsonify({'available': ADBTools.check_adb()})
+    """检查ADB是否可用（后台任务，结果为 {"available": true|false}）"""
+    job, created = job_manager.submit('check_adb', '', lambda job: {'available': ADBTools.check_adb()})
+    return job_response(job, created)
 
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
-    return jsonify({'devices': ADBTools.get_devices()})
+    return jsonify({'devices': online_devices(), 'states': watcher.devices()})
 
 @app.route('/api/device_info', methods=['GET'])
 def get_device_info_api():
-    """获取设备信息API"""
-    if not connected_device:
+    """获取设备信息API（读取一次后缓存），refresh=1时重新读取"""
+    serial = request_serial()
+    if not serial:
         return jsonify({'success': False, 'message': '未连接设备'})
     
-    device_info = ADBTools.get_device_info()
-    return jsonify({
-        'success': True,
-        'device_info': device_info
-    })
+    refresh = request.args.get('refresh') == '1'
+    profile = ADBTools.cached_profile(serial)
+    if profile and not refresh:
+        return jsonify({'success': True, 'device_info': profile.device_info(), 'profile': profile.to_dict()})
+
+    def read_device_info(job):
+        if refresh:
+            ADBTools.invalidate_device(serial)
+        device_info = ADBTools.get_device_info(serial)
+        return {'success': True, 'device_info': device_info, 'profile': device_profile(serial)}
+
+    job, created = job_manager.submit('device_info', serial, read_device_info)
+    return job_response(job, created)
+
+@app.route('/api/capabilities', methods=['GET'])
+def get_capabilities_api():
+    """获取设备数据源探测结果API（已缓存时直接返回），refresh=1时在后台任务中重新探测"""
+    serial = request_serial()
+    if not serial:
+        return jsonify({'success': False, 'message': '未连接设备'})
+
+    refresh = request.args.get('refresh') == '1'
+    if ADBTools.cached_capabilities(serial) and not refresh:
+        try:
+            caps = ADBTools.get_capabilities(serial)
+        except Exception as e:
+            return jsonify({'success': False, 'message': f"探测设备失败: {str(e)}"})
+        return jsonify({'success': True, 'capabilities': caps.to_dict()})
+
+    def probe(job):
+        try:
+            caps = ADBTools.get_capabilities(serial, refresh=refresh)
+        except Exception as e:
+            raise ValueError(f"探测设备失败: {str(e)}")
+        return {'success': True, 'capabilities': caps.to_dict()}
+
+    job, created = job_manager.submit('probe', serial, probe)
+    return job_response(job, created)
+
+@app.route('/api/monitor_stats', methods=['GET'])
+def get_monitor_stats():
+    """获取各采集任务的周期、耗时、错误数和跳过的周期数"""
+    session = sessions.get(request_serial())
+    if not session:
+        return jsonify({'success': False, 'message': '监控未运行'})
+    return jsonify({'success': True, **session.stats()})
+
+@app.route('/api/app_stats', methods=['GET'])
+def get_app_stats():
+    """目标应用最近一次的进程和线程CPU占用、常驻内存（紧凑推送格式中只有总计）"""
+    session = sessions.get(request_serial())
+    if not session:
+        return jsonify({'success': False, 'message': '监控未运行'})
+    return jsonify({'success': True, **session.app_stats()})
+
+@app.route('/api/telemetry_stats', methods=['GET'])
+def get_telemetry_stats():
+    """各网页客户端的推送队列长度、在途帧数和丢弃的样本数"""
+    return jsonify({'success': True, 'clients': telemetry.stats()})
+
+def update_state_gauges():
+    """把会话和推送队列的当前状态写入瞬时指标"""
+    clients = telemetry.stats()
+    metrics.set_gauge('telemetry_clients', len(clients))
+    metrics.set_gauge('telemetry_queued_samples', sum(client['queued'] for client in clients))
+    metrics.set_gauge('telemetry_inflight_frames', sum(client['inflight'] for client in clients))
+    states = {'monitoring': 0, 'paused': 0, 'stopped': 0}
+    for session in sessions.list():
+        state = 'stopped' if not session['monitoring'] else 'paused' if session['paused'] else 'monitoring'
+        states[state] += 1
+    for state, count in states.items():
+        metrics.set_gauge('monitor_sessions', count, state=state)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """采集自身的计量数据（Prometheus文本格式）"""
+    update_state_gauges()
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/metrics/debug', methods=['GET'])
+def get_debug_metrics():
+    """调试面板使用的计量数据（JSON），附带各会话和推送队列的状态"""
+    update_state_gauges()
+    return jsonify({'success': True, 'metrics': metrics.REGISTRY.snapshot(),
+                    'sessions': sessions.list(), 'telemetry': telemetry.stats()})
+
+@app.route('/api/workers', methods=['GET'])
+def list_workers():
+    """采集工作进程的状态（MONITOR_WORKERS未设置时为空）"""
+    workers = sessions.workers() if MONITOR_WORKERS > 0 else []
+    return jsonify({'success': True, 'workers': workers})
+
+@app.route('/api/sessions', methods=['GET'])
+def list_sessions():
+    """列出所有设备的监控会话，connected为网页当前选中的设备"""
+    return jsonify({'success': True, 'connected': connected_device, 'sessions': sessions.list()})
+
+@app.route('/api/sessions/<serial>/start', methods=['POST'])
+def start_session(serial):
+    """开始指定设备的监控，数据推送到以序列号命名的Socket.IO房间"""
+    if serial not in online_devices():
+        return jsonify({'success': False, 'message': f"设备未连接: {serial}"})
+
+    data = request.get_json(silent=True) or {}
+    try:
+        interval = parse_interval(data.get('interval', 1.0))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    if sessions.start(serial, interval, data.get('mode', 'poll'), data.get('rate'), bool(data.get('capture')),
+                      data.get('package'), data.get('power_rate')):
+        return jsonify({'success': True, 'message': '监控已启动'})
+    return jsonify({'success': False, 'message': '监控已在运行中'})
+
+@app.route('/api/sessions/<serial>/stop', methods=['POST'])
+def stop_session(serial):
+    """停止指定设备的监控"""
+    if sessions.stop(serial):
+        return jsonify({'success': True, 'message': '监控已停止'})
+    return jsonify({'success': False, 'message': '监控未运行'})
+
+@app.route('/api/sessions/<serial>/history', methods=['GET'])
+def get_session_history(serial):
+    """设备最近的样本（内存环形缓冲区），limit限制返回数量"""
+    session = sessions.get(serial)
+    if not session:
+        return jsonify({'success': False, 'message': '会话不存在'})
+    limit = request.args.get('limit', type=int)
+    return jsonify({'success': True, 'session_id': session.session_id, 'samples': session.history(limit)})
+
+@app.route('/api/recordings', methods=['GET'])
+def list_recordings():
+    """列出所有已录制的会话"""
+    return jsonify({'success': True, 'recordings': storage.list_recordings()})
+
+@app.route('/api/captures', methods=['GET'])
+def list_captures():
+    """列出所有原始输出抓包（开始监控时capture=true）及正在进行的回放"""
+    return jsonify({'success': True, 'captures': capture.list_captures(),
+                    'replays': [runner.stats() for runner in replays.values()]})
+
+@app.route('/api/captures/<capture_id>/reprocess', methods=['POST'])
+def reprocess_capture(capture_id):
+    """用当前的解析器重新处理抓包，结果写入一个新的录制（可导出、查询）"""
+    try:
+        result = capture.reprocess(capture_id, rule_set=alert_rules)
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, **result})
+
+@app.route('/api/captures/<capture_id>/replay', methods=['POST'])
+def start_replay(capture_id):
+    """按原始节奏回放抓包并推送给网页：serial为推送使用的设备名，speed为倍速，loop为循环播放"""
+    data = request.get_json(silent=True) or {}
+    runner = replays.get(capture_id)
+    if runner and runner.running:
+        return jsonify({'success': False, 'message': '回放已在运行中'})
+    try:
+        runner = capture.ReplayRunner(capture_id, publish, serial=data.get('serial'),
+                                      speed=float(data.get('speed', 1.0)), loop=bool(data.get('loop')))
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)})
+    replays[capture_id] = runner
+    runner.start()
+    return jsonify({'success': True, **runner.stats()})
+
+@app.route('/api/captures/<capture_id>/replay/stop', methods=['POST'])
+def stop_replay(capture_id):
+    runner = replays.pop(capture_id, None)
+    if not runner:
+        return jsonify({'success': False, 'message': '回放未运行'})
+    runner.stop()
+    return jsonify({'success': True, **runner.stats()})
+
+@app.route('/api/sessions/<session_id>/export', methods=['GET'])
+def export_session(session_id):
+    """流式导出一个会话的录制数据，gzip=1时压缩；session_id也可以是设备序列号"""
+    fmt, start, end, metrics = export_options()
+    if fmt not in export.FORMATS:
+        return jsonify({'success': False, 'message': f"不支持的导出格式: {fmt}"})
+    session_id = resolve_recording(session_id)
+    try:
+        storage.open_recording(session_id).close()
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+    extension, mimetype = export.FORMATS[fmt]
+    filename = f'{session_id}.{extension}'
+    chunks = export.encode(export.iter_session(session_id, fmt, start, end, metrics))
+    if request.args.get('gzip') == '1':
+        chunks = export.gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/sessions/<session_id>/range', methods=['GET'])
+def query_session_range(session_id):
+    """降采样的范围查询：metric指标名，start/end时间范围，points最大点数，method为lttb或minmax"""
+    metric = request.args.get('metric', 'fps')
+    if metric not in rollup.ROLLUP_METRICS:
+        return jsonify({'success': False, 'message': f"不支持的指标: {metric}"})
+    try:
+        db = storage.open_recording(resolve_recording(session_id))
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    try:
+        series = rollup.query_range(
+            db, metric,
+            start=request.args.get('start', type=float),
+            end=request.args.get('end', type=float),
+            max_points=max(10, request.args.get('points', rollup.DEFAULT_MAX_POINTS, type=int)),
+            method=request.args.get('method', 'lttb')
+        )
+    finally:
+        db.close()
+    return jsonify({'success': True, **series})
+
+@app.route('/api/sessions/<session_id>/analysis', methods=['GET'])
+def analyze_session(session_id):
+    """录制会话的统计：帧率稳定度、卡顿率、各核心负载分位数和直方图、频率驻留、能耗，start/end为时间范围"""
+    try:
+        summary = analysis.analyze(resolve_recording(session_id),
+                                   start=request.args.get('start', type=float),
+                                   end=request.args.get('end', type=float))
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, 'analysis': summary})
+
+@app.route('/api/analysis', methods=['GET'])
+def analyze_sessions():
+    """多个会话的统计：sessions为逗号分隔的会话ID，combine=1时合并为一个时间序列（如拷机），
+    否则以第一个会话为基准并列对比"""
+    session_ids = [resolve_recording(item) for item in request.args.get('sessions', '').split(',') if item]
+    if not session_ids:
+        return jsonify({'success': False, 'message': '请指定会话'})
+    try:
+        if request.args.get('combine') == '1':
+            return jsonify({'success': True, 'analysis': analysis.analyze_sessions(session_ids)})
+        return jsonify({'success': True, **analysis.compare(session_ids)})
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/export', methods=['GET'])
+def export_sessions():
+    """把多个会话（sessions为逗号分隔的会话ID，缺省为全部）流式打包为一个zip"""
+    fmt, start, end, metrics = export_options()
+    if fmt not in export.FORMATS:
+        return jsonify({'success': False, 'message': f"不支持的导出格式: {fmt}"})
+    requested = [item for item in request.args.get('sessions', '').split(',') if item]
+    if requested:
+        session_ids = [resolve_recording(item) for item in requested]
+    else:
+        session_ids = [meta['session_id'] for meta in storage.list_recordings()]
+    for session_id in session_ids:
+        try:
+            storage.open_recording(session_id).close()
+        except FileNotFoundError as e:
+            return jsonify({'success': False, 'message': str(e)})
+
+    filename = f"sessions_{time.strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(stream_with_context(export.zip_stream(session_ids, fmt, start, end, metrics)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/alerts/rules', methods=['GET'])
+def get_alert_rules():
+    return jsonify({'success': True, 'version': alert_rules.version, 'rules': alert_rules.rules})
+
+@app.route('/api/alerts/rules', methods=['PUT'])
+def update_alert_rules():
+    """替换全部告警规则并保存到 alert_rules.json，正在运行的会话在下一个样本时生效"""
+    data = request.get_json(silent=True)
+    rules = data.get('rules') if isinstance(data, dict) else data
+    try:
+        rules = alert_rules.update(rules)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    try:
+        alerts.save_rules(rules)
+    except OSError as e:
+        return jsonify({'success': False, 'message': f"保存告警规则失败: {str(e)}"})
+    return jsonify({'success': True, 'version': alert_rules.version, 'rules': rules})
+
+@app.route('/api/sessions/<serial>/live_stats', methods=['GET'])
+def get_live_stats(serial):
+    """设备的实时滑动窗口统计（EWMA、最值、分位数、低于目标帧率的样本数）和正在触发的告警"""
+    session = sessions.get(serial)
+    stats = session.live_stats() if session else None
+    if not stats:
+        return jsonify({'success': False, 'message': '会话不存在'})
+    return jsonify({'success': True, **stats})
+
+@app.route('/api/sessions/<session_id>/alerts', methods=['GET'])
+def get_session_alerts(session_id):
+    """录制中的告警事件（触发和解除），session_id也可以是设备序列号"""
+    try:
+        db = storage.open_recording(resolve_recording(session_id))
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    try:
+        events = storage.read_events(db, 'alert')
+    finally:
+        db.close()
+    return jsonify({'success': True, 'alerts': events})
+
+@app.route('/api/sessions/<serial>/power', methods=['GET'])
+def get_session_power(serial):
+    """会话的高频电流/电压积分结果：累计能耗、电量、平均和峰值功率，以及各标记区间"""
+    session = sessions.get(serial)
+    stats = session.power_stats() if session else None
+    if not stats:
+        return jsonify({'success': False, 'message': '会话不存在'})
+    return jsonify({'success': True, **stats})
+
+@app.route('/api/sessions/<serial>/marks', methods=['POST'])
+def mark_session(serial):
+    """开始或结束一个能耗标记区间：{"name": "场景名", "action": "start"|"stop"}"""
+    session = sessions.get(serial)
+    if not session:
+        return jsonify({'success': False, 'message': '会话不存在'})
+    data = request.get_json(silent=True) or {}
+    name = str(data.get('name') or '').strip()
+    if not name:
+        return jsonify({'success': False, 'message': '请指定标记名称'})
+    try:
+        if data.get('action', 'start') == 'stop':
+            mark = session.stop_mark(name)
+        else:
+            mark = session.start_mark(name)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, 'mark': mark})
+
+@app.route('/api/sessions/<serial>/stats', methods=['GET'])
+def get_session_stats(serial):
+    session = sessions.get(serial)
+    if not session:
+        return jsonify({'success': False, 'message': '会话不存在'})
+    return jsonify({'success': True, **session.stats()})
 
 @app.route('/api/connect', methods=['POST'])
 def connect_device():
-    global connected_device
-    data = request.json
-    
-    if 'wireless' in data and data['wireless']:
-        # 无线连接
-        if 'ip' not in data or not data['ip']:
+    """连接设备（后台任务）：wireless为true时连接ip（可带端口），否则连接serial指定的有线设备（默认第一个）"""
+    data = request.get_json(silent=True) or {}
+    if data.get('wireless'):
+        if not data.get('ip'):
             return jsonify({'success': False, 'message': '请提供设备IP地址'})
-        
-        success, message = ADBTools.connect_wireless(data['ip'])
-        if success:
-            connected_device = f"{data['ip']}:5555"
-            # 获取设备信息
-            device_info = ADBTools.get_device_info()
-            return jsonify({'success': True, 'message': message, 'device_info': device_info})
-        else:
-            return jsonify({'success': False, 'message': f"连接失败: {message}"})
+        key = normalize_address(data['ip'])
     else:
-        # 有线连接
-        devices = ADBTools.get_devices()
+        key = data.get('serial') or ''
+    job, created = job_manager.submit('connect', key, lambda job: run_connect(job, data), cancels=('disconnect',))
+    return job_response(job, created)
+
+def run_connect(job, data):
+    """连接并读取设备信息和数据源，各步骤之间可以取消；完成后成为网页当前选中的设备"""
+    global connected_device
+    wireless_address = None
+    job.progress(0, 3, '连接设备')
+    if data.get('wireless'):
+        # ip可带端口（ip:port），连接加入无线设备池，断开后自动重连；不影响其他已连接的设备
+        known = wireless.get(data['ip']) is not None
+        result = wireless.connect(data['ip'])
+        if not result['success']:
+            raise ValueError(f"连接失败: {result['message']}")
+        serial, message = result['address'], result['message']
+        wireless_address = None if known else serial
+    else:
+        devices = online_devices()
         if not devices:
-            return jsonify({'success': False, 'message': '未找到已连接的设备'})
-        
-        connected_device = devices[0]  # 使用第一个设备
-        # 获取设备信息
-        device_info = ADBTools.get_device_info()
-        return jsonify({'success': True, 'message': f"已连接到设备: {connected_device}", 'device_info': device_info})
+            raise ValueError('未找到已连接的设备')
+        # 可指定序列号，否则使用第一个设备
+        serial = data.get('serial') if data.get('serial') in devices else devices[0]
+        message = f"已连接到设备: {serial}"
+    try:
+        job.check()
+        job.progress(1, 3, '读取设备信息')
+        # 重新连接后缓存的设备信息和探测结果不再可信，各读取一次
+        ADBTools.invalidate_device(serial)
+        device_info = ADBTools.get_device_info(serial)
+        job.check()
+        job.progress(2, 3, '探测数据源')
+        capabilities = probe_capabilities(serial)
+        job.check()
+    except jobs.JobCancelled:
+        # 取消时撤销本次新加入设备池的无线连接
+        if wireless_address:
+            wireless.disconnect(wireless_address)
+        raise
+    connected_device = serial
+    return {'success': True, 'message': message, 'serial': serial, 'device_info': device_info,
+            'profile': device_profile(serial), 'capabilities': capabilities}
+
+@app.route('/api/wireless', methods=['GET'])
+def list_wireless():
+    """无线设备池中各地址的连接状态"""
+    return jsonify({'success': True, 'targets': wireless.targets()})
+
+@app.route('/api/wireless/connect', methods=['POST'])
+def connect_wireless_bulk():
+    """并行连接多个地址：addresses为 ip 或 ip:port 列表，timeout为每个地址的超时（秒），
+    keep为false时只连接一次，不加入设备池"""
+    data = request.get_json(silent=True) or {}
+    addresses = data.get('addresses') or []
+    if isinstance(addresses, str):
+        addresses = addresses.replace('\n', ',').split(',')
+    addresses = sorted({normalize_address(address) for address in addresses if address.strip()})
+    if not addresses:
+        return jsonify({'success': False, 'message': '请提供设备地址'})
+
+    def connect_many(job):
+        job.progress(0, len(addresses), '并行连接')
+        results = wireless.connect_many(addresses, timeout=float(data.get('timeout', 10)),
+                                        keep=data.get('keep', True) is not False)
+        return {'success': any(result['success'] for result in results), 'results': results}
+
+    job, created = job_manager.submit('wireless_connect', ','.join(addresses), connect_many)
+    return job_response(job, created)
+
+@app.route('/api/wireless/disconnect', methods=['POST'])
+def disconnect_wireless_bulk():
+    """断开多个地址并移出设备池"""
+    data = request.get_json(silent=True) or {}
+    addresses = data.get('addresses') or []
+    if isinstance(addresses, str):
+        addresses = addresses.replace('\n', ',').split(',')
+    for address in addresses:
+        if address.strip():
+            sessions.remove(normalize_address(address))
+            wireless.disconnect(address)
+    return jsonify({'success': True, 'targets': wireless.targets()})
 
 @app.route('/api/start_monitoring', methods=['POST'])
 def start_monitoring():
-    global monitoring, monitor_thread, connected_device
-    
     if not connected_device:
         return jsonify({'success': False, 'message': '未连接设备'})
     
     # 获取时间间隔参数
-    data = request.json
-    interval = float(data.get('interval', 1.0))
+    data = request.get_json(silent=True) or {}
+    try:
+        interval = parse_interval(data.get('interval', 1.0))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
     
-    if not monitoring:
-        monitoring = True
-        monitor_thread = threading.Thread(target=monitor_performance, args=(interval,))
-        monitor_thread.daemon = True
-        monitor_thread.start()
+    if sessions.start(connected_device, interval, data.get('mode', 'poll'), data.get('rate'),
+                      bool(data.get('capture')), data.get('package'), data.get('power_rate')):
         return jsonify({'success': True, 'message': '监控已启动'})
     else:
         return jsonify({'success': False, 'message': '监控已在运行中'})
 
 @app.route('/api/stop_monitoring', methods=['POST'])
 def stop_monitoring():
-    global monitoring
-    
-    if monitoring:
-        monitoring = False
+    if connected_device and sessions.stop(connected_device):
         return jsonify({'success': True, 'message': '监控已停止'})
     else:
         return jsonify({'success': False, 'message': '监控未运行'})
 
 @app.route('/api/disconnect', methods=['POST'])
 def disconnect_device():
-    global connected_device, monitoring
-    
-    # 先停止监控
-    if monitoring:
-        monitoring = False
-        time.sleep(1)  # 等待监控线程结束
-    
-    # 断开连接
-    try:
-        adb_path = ADBTools.get_adb_path()
-        subprocess.call([adb_path, 'disconnect'])
-        connected_device = None
+    """断开当前设备（后台任务）：先停止该设备的监控，正在进行的连接任务被取消"""
+    serial = connected_device
+    if not serial:
         return jsonify({'success': True, 'message': '设备已断开连接'})
-    except Exception as e:
-        return jsonify({'success': False, 'message': f"断开连接失败: {str(e)}"})
+    job, created = job_manager.submit('disconnect', serial, lambda job: run_disconnect(job, serial),
+                                      cancels=('connect',))
+    return job_response(job, created)
+
+def run_disconnect(job, serial):
+    global connected_device
+    job.progress(0, 2, '停止监控')
+    session = sessions.remove(serial)
+    if session:
+        session.join(SESSION_STOP_WAIT)  # 等待监控线程结束
+    job.progress(1, 2, '断开连接')
+    # 只断开该设备，不影响其他设备
+    if ':' in serial:
+        # 同时移出无线设备池，不再自动重连
+        wireless.disconnect(serial)
+    else:
+        ADBTools.close_shells(serial)
+    if connected_device == serial:
+        connected_device = None
+    return {'success': True, 'message': '设备已断开连接'}
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """后台任务列表，active=1时只返回未结束的任务"""
+    return jsonify({'success': True, 'jobs': job_manager.list(request.args.get('active') == '1')})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'})
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务：排队中的任务立即取消，运行中的任务在当前步骤完成后结束"""
+    job = job_manager.cancel(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在或已结束'})
+    return jsonify({'success': True, 'job': job.to_dict()})
 
 if __name__ == '__main__':
     # 创建templates目录（如果不存在）
@@ -628,5 +716,9 @@ if __name__ == '__main__':
     if not os.path.exists('static'):
         os.makedirs('static')
     
+    # 启动设备跟踪，设备连接/断开会实时推送到会话和网页
+    watcher.start()
+    wireless.start()
+
     print("手机性能监控服务器已启动，请访问 http://localhost:5000")
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
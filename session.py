@@ -0,0 +1,507 @@
+import math
+import time
+import threading
+
+import agent
+import alerts
+import capture
+import metrics
+import power
+import storage
+from adb_tools import ADBTools
+from scheduler import CollectorScheduler
+
+# 采集方式：poll为主机按周期轮询，agent为设备端采样代理持续推送
+MODES = ('poll', 'agent')
+
+# 各类指标的默认采样周期（秒），由调度器并发运行，互不拖慢
+SAMPLE_INTERVALS = {
+    'cpu': 0.25,
+    'gpu': 0.5,
+    'battery': 2.0
+}
+# 推送周期的下限（秒）
+MIN_INTERVAL = 0.05
+# 目标应用进程/线程采样的最短周期（秒），推送周期更长时与推送周期相同
+APP_MIN_INTERVAL = 0.25
+# 读数超过该时长（秒）未更新时标记为stale，大于各分组的默认采样周期
+STALE_AGE = 5.0
+
+
+def parse_interval(value):
+    """校验推送周期：不小于MIN_INTERVAL的有限数值，否则抛出ValueError"""
+    try:
+        interval = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'采集间隔无效: {value}')
+    if not math.isfinite(interval) or interval < MIN_INTERVAL:
+        raise ValueError(f'采集间隔必须是不小于{MIN_INTERVAL}秒的数值: {value}')
+    return interval
+
+
+def create_scheduler(serial, interval):
+    """为设备创建采集调度器，CPU/GPU周期不低于推送频率"""
+    scheduler = CollectorScheduler()
+    for group, group_interval in SAMPLE_INTERVALS.items():
+        if group != 'battery':
+            group_interval = min(group_interval, interval)
+        # 每个分组使用独立的shell通道，慢的读取不会阻塞其他分组
+        scheduler.add(
+            group,
+            lambda g=group: ADBTools.get_snapshot(serial, groups=(g,), channel=g),
+            group_interval
+        )
+    return scheduler
+
+
+def create_app_scheduler(serial, interval, package):
+    """目标应用的进程/线程采样任务，使用独立的shell通道；package()返回当前的目标包名"""
+    scheduler = CollectorScheduler()
+    scheduler.add(
+        'app',
+        lambda: ADBTools.get_app_sample(package(), serial, channel='app'),
+        max(interval, APP_MIN_INTERVAL)
+    )
+    return scheduler
+
+
+def sample_quality(data, estimated=()):
+    """每个指标的质量标记，区分真实读数与估算值、过旧的读数和缺失值"""
+    now = data['timestamp']
+    groups = {'fps': 'fps', 'cpu_freq': 'cpu', 'cpu_load': 'cpu', 'gpu_freq': 'gpu', 'gpu_load': 'gpu',
+              'current': 'battery', 'power': 'battery'}
+    quality = {}
+    for metric in metrics.QUALITY_METRICS:
+        sampled_at = data['sampled_at'].get(groups[metric])
+        if data.get(metric) in (None, {}):
+            quality[metric] = 'missing'
+        elif metric in estimated:
+            quality[metric] = 'estimated'
+        elif sampled_at is None or now - sampled_at > STALE_AGE:
+            quality[metric] = 'stale'
+        else:
+            quality[metric] = 'ok'
+    return quality
+
+
+def build_performance_data(serial, scheduler, frame_info, now=None, app_scheduler=None, power_collector=None):
+    """合并各采集任务的最新结果，每项附带实际采样时间和质量标记
+
+    now为样本时间，默认为当前时间（回放抓包时传入抓取时的时间）；
+    app_scheduler为目标应用的采样任务，默认与scheduler相同；
+    power_collector为高频电流/电压采集，有读数时current/power取最近一批读数的平均值。
+    """
+    cpu, cpu_at = scheduler.latest('cpu')
+    gpu, gpu_at = scheduler.latest('gpu')
+    battery, battery_at = scheduler.latest('battery')
+    app, app_at = (app_scheduler or scheduler).latest('app')
+    batch, batch_at = power_collector.latest('power') if power_collector else (None, None)
+    # 不可用的指标发送None，原因可通过 /api/capabilities 查看
+    if batch:
+        battery_info, battery_at = batch, batch_at
+    else:
+        battery_info = (battery.battery if battery else None) or {'current': None, 'power': None}
+    data = {
+        'serial': serial,
+        'timestamp': now or time.time(),
+        'fps': frame_info.get('fps'),
+        'frame_time': frame_info.get('frame_time'),
+        'jank': frame_info.get('jank'),
+        'big_jank': frame_info.get('big_jank'),
+        'cpu_freq': {f'core_{i}': v for i, v in sorted(cpu.cpu_freq.items())} if cpu else {},
+        'gpu_freq': gpu.gpu_freq if gpu else None,
+        'cpu_load': {f'core_{i}': v for i, v in sorted(cpu.cpu_load.items())} if cpu else {},
+        'gpu_load': gpu.gpu_load if gpu else None,
+        'current': round(battery_info['current'], 2) if battery_info['current'] is not None else None,
+        'power': round(battery_info['power'], 2) if battery_info['power'] is not None else None,
+        'app': app.to_dict() if app else None,
+        'sampled_at': {
+            'fps': frame_info.get('sampled_at'),
+            'cpu': cpu_at,
+            'gpu': gpu_at,
+            'battery': battery_at,
+            'app': app_at
+        }
+    }
+    data['quality'] = sample_quality(data, cpu.estimated if cpu else ())
+    return data
+
+
+# 单设备监控会话
+class DeviceSession:
+    """一台设备的监控会话，持有该设备的帧采集器、调度器和增量状态
+
+    publish(serial, event, data) 由调用方提供（Web服务中为按房间推送的Socket.IO），
+    会话之间互不共享状态，一台设备的慢命令不会影响其他设备。
+    """
+
+    def __init__(self, serial, publish, directory=storage.RECORDINGS_DIR, rule_set=None):
+        self.serial = serial
+        self.publish = publish
+        # 告警规则（所有会话共用），每次开始监控时创建新的统计和告警引擎
+        self.rule_set = rule_set or alerts.RuleSet()
+        self.alerts = None
+        # 录制文件目录（压测等场景使用临时目录）
+        self.directory = directory
+        self.interval = 1.0
+        self.mode = 'poll'
+        self.rate = agent.DEFAULT_RATE
+        self.monitoring = False
+        # 设备离线时暂停采集，重新上线后恢复，会话本身保持
+        self.paused = False
+        # 暂停后采集器需要重启：设备可能在两次循环之间断开又恢复，采集器仍停留在断开前的状态
+        self.reconnects = 0
+        self._interrupted = False
+        self.started_at = None
+        self.samples = 0
+        self.publish_skipped = 0
+        self.last_data = None
+        # 当前（或最近一次）会话的录制，停止后仍保留最近样本供回放
+        self.session_id = None
+        self.recorder = None
+        # 原始输出抓包（可选），用于修正解析器后重新计算指标
+        self.capture = None
+        self.frame_collector = None
+        self.scheduler = None
+        # 目标应用：未指定包名时跟随前台应用（帧采集器解析的焦点窗口）
+        self.package = None
+        self.app_scheduler = None
+        # 高频电流/电压采集和能耗积分（含用户标记的区间），每次开始监控时重新计算
+        self.power_rate = power.DEFAULT_RATE
+        self.power_meter = None
+        self.power_collector = None
+        self._thread = None
+        self._wake = threading.Event()
+
+    def start(self, interval=1.0, mode='poll', rate=None, capture_raw=False, package=None, power_rate=None):
+        """开始监控，已在运行时返回False
+
+        mode为'agent'时使用设备端采样代理，rate为代理的采样频率（次/秒）；
+        capture_raw为True时同时抓取所有ADB命令的原始输出；
+        package为要采样进程/线程的应用包名，默认为前台应用；
+        power_rate为电流/电压的读取频率（次/秒）。interval无效时抛出ValueError。
+        """
+        if self.monitoring:
+            return False
+        self.interval = parse_interval(interval)
+        self.package = package or None
+        self.power_rate = max(power.MIN_RATE, min(power.MAX_RATE, int(power_rate or power.DEFAULT_RATE)))
+        self.power_meter = power.PowerMeter()
+        self.alerts = alerts.AlertEngine(self.serial, self.rule_set)
+        self.mode = mode if mode in MODES else 'poll'
+        self.rate = rate or agent.DEFAULT_RATE
+        self.session_id = storage.new_session_id(self.serial, self.directory)
+        self.recorder = storage.SessionRecorder(
+            self.session_id, self.serial,
+            meta={'interval': self.interval, 'mode': self.mode, 'rate': self.rate, 'package': self.package,
+                  'power_rate': self.power_rate},
+            directory=self.directory
+        )
+        self.capture = None
+        if capture_raw:
+            self.capture = capture.CaptureWriter(
+                capture.capture_path(self.session_id, self.directory), self.serial,
+                meta={'session_id': self.session_id, 'interval': self.interval, 'mode': self.mode, 'rate': self.rate}
+            )
+            ADBTools.set_capture(self.serial, self.capture)
+        self.monitoring = True
+        self.started_at = time.time()
+        self.samples = 0
+        self.publish_skipped = 0
+        self.reconnects = 0
+        self._interrupted = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """停止监控，未运行时返回False"""
+        if not self.monitoring:
+            return False
+        self.monitoring = False
+        self._wake.set()
+        return True
+
+    def join(self, timeout=None):
+        """等待监控线程结束（stop之后调用）"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def pause(self):
+        """设备离线：暂停采集（在监控线程中停止采集器）"""
+        self.paused = True
+        self._interrupted = True
+        self._wake.set()
+
+    def resume(self):
+        """设备重新上线：恢复采集"""
+        self.paused = False
+        self._wake.set()
+
+    def stats(self):
+        return {
+            'serial': self.serial,
+            'session_id': self.session_id,
+            'monitoring': self.monitoring,
+            'paused': self.paused,
+            'reconnects': self.reconnects,
+            'mode': self.mode,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'samples': self.samples,
+            'publish_skipped': self.publish_skipped,
+            'recorded': self.recorder.rows if self.recorder else 0,
+            'captured': self.capture.entries if self.capture else None,
+            'package': self.target_package(),
+            'alerts': self.alerts.fired if self.alerts else 0,
+            'power': self.power_meter.summary() if self.power_meter else None,
+            'tasks': dict(self.scheduler.stats() if self.scheduler else {},
+                          **(self.app_scheduler.stats() if self.app_scheduler else {}),
+                          **(self.power_collector.stats() if self.power_collector else {}))
+        }
+
+    def start_mark(self, name):
+        """开始一个能耗标记区间（如一个测试场景），未在监控时抛出ValueError"""
+        if not self.monitoring:
+            raise ValueError('监控未运行')
+        mark = self.power_meter.start_mark(name)
+        self.publish(self.serial, 'power_mark', dict(mark, serial=self.serial))
+        return mark
+
+    def stop_mark(self, name):
+        """结束能耗标记区间，区间的能耗在结束边界之后的读数到达后确定并记入录制"""
+        if not self.power_meter:
+            raise ValueError('监控未运行')
+        return self.power_meter.stop_mark(name)
+
+    def target_package(self):
+        """当前采样进程/线程的应用包名"""
+        if self.package:
+            return self.package
+        return self.frame_collector.package if self.frame_collector else None
+
+    def app_stats(self):
+        """目标应用最近一次的进程和线程CPU占用、常驻内存"""
+        return {'package': self.target_package(), 'app': (self.last_data or {}).get('app')}
+
+    def live_stats(self):
+        """实时滑动窗口统计、正在触发和最近的告警，未开始过监控时返回None"""
+        if not self.alerts:
+            return None
+        return {'session_id': self.session_id, **self.alerts.snapshot(), 'recent': self.alerts.recent()}
+
+    def power_stats(self):
+        """高频电流/电压的积分结果和各标记区间，未开始过监控时返回None"""
+        if not self.power_meter:
+            return None
+        return {'session_id': self.session_id, 'rate': self.power_rate,
+                'summary': self.power_meter.summary(), 'marks': self.power_meter.marks()}
+
+    def flush_recording(self):
+        """写入缓冲的样本，返回录制ID（未开始过监控时返回None）"""
+        if not self.recorder:
+            return None
+        self.recorder.flush()
+        return self.session_id
+
+    def _collectors_running(self):
+        return self.scheduler is not None and self.scheduler.running()
+
+    def _start_collectors(self):
+        # 不沿用上一次的/proc/stat读数，避免第一帧出现虚假的负载尖峰
+        ADBTools.reset_delta_state(self.serial)
+        if self.capture:
+            # 重新探测，使抓包中包含探测输出，回放时据此解析快照
+            self.capture.event(time.time(), 'reset')
+            ADBTools.get_capabilities(self.serial, refresh=True)
+        if self.mode == 'agent':
+            # 代理提供与调度器相同的接口，启动失败时回退到轮询模式
+            device_agent = agent.DeviceAgent(self.serial, self.rate)
+            try:
+                device_agent.start()
+                self.scheduler = device_agent
+                self.frame_collector = device_agent.frame_collector
+                return
+            except Exception as e:
+                print(f"[{self.serial}] 启动采样代理失败，改用轮询模式: {str(e)}")
+                device_agent.stop()
+                self.mode = 'poll'
+        # 帧数据由后台采集器持续轮询，其他指标由调度器按各自周期采集
+        try:
+            self.frame_collector = ADBTools.create_frame_collector(self.serial)
+            self.frame_collector.start()
+        except Exception as e:
+            print(f"[{self.serial}] 启动帧采集器失败: {str(e)}")
+            self.frame_collector = None
+        self.scheduler = create_scheduler(self.serial, self.interval)
+        self.scheduler.start()
+
+    def _start_app_scheduler(self):
+        self.app_scheduler = create_app_scheduler(self.serial, self.interval, self.target_package)
+        self.app_scheduler.start()
+
+    def _start_power_collector(self):
+        # 使用独立的shell通道，每批读取期间不阻塞其他分组
+        self.power_collector = power.PowerCollector(
+            lambda duration: ADBTools.get_power_samples(self.serial, self.power_rate, duration, channel='power'),
+            self.power_meter, self.interval, on_readings=self.recorder.append_power)
+        self.power_collector.start()
+
+    def _stop_collectors(self):
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.app_scheduler:
+            self.app_scheduler.stop()
+        if self.power_collector:
+            self.power_collector.stop()
+        if self.frame_collector:
+            self.frame_collector.stop()
+            self.frame_collector = None
+
+    def _run(self):
+        """合并推送循环，只读取采集器的最新结果"""
+        deadline = time.monotonic()
+        while self.monitoring:
+            try:
+                # 在线状态由设备跟踪器推送，这里不需要任何ADB往返
+                if self.paused:
+                    if self._collectors_running():
+                        self._stop_collectors()
+                    self._wake.wait(1)
+                    self._wake.clear()
+                    deadline = time.monotonic()
+                    continue
+                if self._interrupted:
+                    # 恢复后重新启动采集器（清除增量状态），录制和历史样本沿用同一会话
+                    self._interrupted = False
+                    self.reconnects += 1
+                    if self._collectors_running():
+                        self._stop_collectors()
+                if not self._collectors_running():
+                    self._start_collectors()
+                    self._start_app_scheduler()
+                    self._start_power_collector()
+
+                started = time.monotonic()
+                frame_info = self.frame_collector.latest() if self.frame_collector else {}
+                data = build_performance_data(self.serial, self.scheduler, frame_info,
+                                              app_scheduler=self.app_scheduler,
+                                              power_collector=self.power_collector)
+                self.last_data = data
+                self.samples += 1
+                self.publish(self.serial, 'performance_data', data)
+                self._record(data)
+                self._check_alerts(data)
+                self._record_marks()
+                if self.capture:
+                    self.capture.tick(data['timestamp'])
+                self._observe(data, time.monotonic() - started)
+
+                # 按截止时间推送，推送周期不受采集耗时影响
+                deadline += self.interval
+                now = time.monotonic()
+                if now > deadline:
+                    metrics.inc('monitor_tick_overruns_total', serial=self.serial)
+                    metrics.observe('monitor_tick_lag_seconds', now - deadline, serial=self.serial)
+                    missed = int((now - deadline) // self.interval) + 1
+                    self.publish_skipped += missed
+                    deadline += missed * self.interval
+                time.sleep(deadline - now)
+            except Exception as e:
+                print(f"[{self.serial}] 监控线程异常: {str(e)}")
+                time.sleep(2)
+                deadline = time.monotonic()
+        self._stop_collectors()
+        self.power_meter.close()
+        self._record_marks()
+        self.recorder.close()
+        if self.capture:
+            ADBTools.set_capture(self.serial, None)
+            self.capture.close()
+
+    def _observe(self, data, duration):
+        metrics.observe('monitor_tick_duration_seconds', duration, serial=self.serial)
+        metrics.inc('monitor_samples_total', serial=self.serial)
+        for metric, flag in data['quality'].items():
+            metrics.inc('sample_quality_total', metric=metric, quality=flag)
+
+    def _record(self, data):
+        # 写入失败（如磁盘已满）不影响实时推送
+        try:
+            self.recorder.append(data)
+        except Exception as e:
+            print(f"[{self.serial}] 录制样本失败: {str(e)}")
+
+    def _check_alerts(self, data):
+        """更新流式统计，告警触发或解除时推送到设备房间并记入录制"""
+        try:
+            events = self.alerts.add(data)
+        except Exception as e:
+            print(f"[{self.serial}] 更新告警统计失败: {str(e)}")
+            return
+        for event in events:
+            metrics.inc('alerts_total', rule=event['rule'], state=event['state'])
+            self.publish(self.serial, 'alert', event)
+            self.recorder.record_event('alert', event['timestamp'], event)
+
+    def _record_marks(self):
+        """已确定能耗的标记区间推送到设备房间并记入录制"""
+        for mark in self.power_meter.pop_finished():
+            self.publish(self.serial, 'power_mark', dict(mark, serial=self.serial))
+            self.recorder.record_event('power_mark', mark['started_at'], mark)
+
+    def history(self, limit=None):
+        """最近的样本，用于网页重连后回放"""
+        return self.recorder.recent(limit) if self.recorder else []
+
+
+# 会话管理器
+class SessionManager:
+    """按设备序列号管理监控会话，每台设备最多一个会话"""
+
+    def __init__(self, publish, rule_set=None):
+        self.publish = publish
+        self.rule_set = rule_set or alerts.RuleSet()
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, serial, create=False):
+        with self._lock:
+            session = self._sessions.get(serial)
+            if session is None and create:
+                session = DeviceSession(serial, self.publish, rule_set=self.rule_set)
+                self._sessions[serial] = session
+            return session
+
+    def start(self, serial, interval=1.0, mode='poll', rate=None, capture_raw=False, package=None, power_rate=None):
+        return self.get(serial, create=True).start(interval, mode, rate, capture_raw, package, power_rate)
+
+    def stop(self, serial):
+        session = self.get(serial)
+        return session.stop() if session else False
+
+    def remove(self, serial):
+        """停止并移除设备的会话（设备断开时调用）"""
+        with self._lock:
+            session = self._sessions.pop(serial, None)
+        if session:
+            session.stop()
+        return session
+
+    def find(self, session_id):
+        """按会话ID查找仍在内存中的会话"""
+        with self._lock:
+            return next((session for session in self._sessions.values()
+                         if session.session_id == session_id), None)
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.stop()
+
+    def list(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.stats() for session in sessions]
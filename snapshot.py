@@ -0,0 +1,215 @@
+import re
+
+# 每个文件内容前输出的分隔行，格式为 "@@file <路径>"
+FILE_MARK = '@@file '
+END_MARK = '@@end'
+
+PROC_STAT = '/proc/stat'
+CPU_FREQ_GLOB = '/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq'
+POWER_SUPPLY_GLOB = '/sys/class/power_supply/*/uevent'
+
+# 快照可按组读取，便于不同指标使用不同的采样周期
+SNAPSHOT_GROUPS = ('cpu', 'gpu', 'battery')
+
+# 默认尝试的GPU节点（与ADBTools.get_gpu_freq/get_gpu_load保持一致）
+GPU_FREQ_PATHS = [
+    '/sys/class/kgsl/kgsl-3d0/gpuclk',
+    '/sys/class/kgsl/kgsl-3d0/devfreq/cur_freq',
+]
+GPU_LOAD_PATHS = [
+    '/sys/class/kgsl/kgsl-3d0/gpu_busy_percentage',
+    '/sys/class/kgsl/kgsl-3d0/devfreq/gpu_load',
+]
+
+# 电流读数的绝对值不小于该值时按µA处理（10mA以下的µA读数和10A以上的mA读数在手机上都不现实）
+MICROAMP_THRESHOLD = 10000
+# 未探测时按内核power_supply文档的单位（µA/µV）并取电流的绝对值
+DEFAULT_CALIBRATION = {'current_unit': 'uA', 'voltage_unit': 'uV', 'sign': None, 'status': None}
+_CURRENT_SCALE = {'uA': 1000.0, 'mA': 1.0}
+_VOLTAGE_SCALE = {'uV': 1000000.0, 'mV': 1000.0, 'V': 1.0}
+
+_CPU_FREQ_RE = re.compile(r'/cpu(\d+)/cpufreq/')
+_LEADING_INT_RE = re.compile(r'-?\d+')
+
+
+class PerfSnapshot:
+    """一次快照读取的解析结果，所有字段来自设备端同一条命令"""
+    __slots__ = ('timestamp', 'cpu_stat', 'cpu_freq', 'cpu_load', 'gpu_freq', 'gpu_load', 'battery', 'estimated')
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.cpu_stat = {}   # 核心编号 -> {'total': jiffies, 'idle': jiffies}
+        self.cpu_freq = {}   # 核心编号 -> MHz
+        self.cpu_load = {}   # 核心编号 -> %（由调用方根据上一次的cpu_stat计算）
+        self.gpu_freq = None  # MHz
+        self.gpu_load = None  # %
+        self.battery = None   # {'current': mA, 'voltage': V, 'power': mW}
+        self.estimated = set()  # 不是真实读数的指标（如没有上一次/proc/stat时的CPU负载）
+
+
+def build_snapshot_command(cpu_freq_glob=CPU_FREQ_GLOB, gpu_freq_paths=GPU_FREQ_PATHS,
+                           gpu_load_paths=GPU_LOAD_PATHS, power_supply_glob=POWER_SUPPLY_GLOB,
+                           proc_stat=PROC_STAT):
+    """生成一次性读取所有计数器的设备端命令
+
+    每个文件前输出 "@@file <路径>" 分隔行，读取失败的文件内容为空，
+    最后输出 "@@end" 保证命令以成功返回码结束。
+    """
+    paths = [proc_stat, cpu_freq_glob] + list(gpu_freq_paths or []) + list(gpu_load_paths or []) + [power_supply_glob]
+    files = ' '.join(path for path in paths if path)
+    return f'for f in {files}; do echo "{FILE_MARK}$f"; cat "$f" 2>/dev/null; done; echo {END_MARK}'
+
+
+def split_files(output):
+    """把快照输出切分为 {路径: 内容}"""
+    files = {}
+    path = None
+    lines = []
+    for line in output.split('\n'):
+        if line.startswith(FILE_MARK) or line == END_MARK:
+            if path is not None:
+                files[path] = '\n'.join(lines).strip()
+            path = line[len(FILE_MARK):].strip() if line != END_MARK else None
+            lines = []
+        elif path is not None:
+            lines.append(line)
+    if path is not None:
+        files[path] = '\n'.join(lines).strip()
+    return files
+
+
+def parse_proc_stat(text):
+    """解析/proc/stat中每个核心的累计时间，返回 {核心编号: {'total', 'idle'}}"""
+    stats = {}
+    for line in text.split('\n'):
+        if not line.startswith('cpu'):
+            continue
+        parts = line.split()
+        if len(parts) < 8 or parts[0] == 'cpu':
+            continue  # 跳过总体CPU统计
+        try:
+            values = [int(value) for value in parts[1:9]]
+            core_num = int(parts[0][3:])
+        except ValueError:
+            continue
+        user, nice, system, idle, iowait, irq, softirq = values[:7]
+        steal = values[7] if len(values) > 7 else 0
+        stats[core_num] = {
+            'total': user + nice + system + idle + iowait + irq + softirq + steal,
+            'idle': idle + iowait
+        }
+    return stats
+
+
+def parse_int(text):
+    """取内容中的第一个整数（兼容 "45 %" 这类带单位的节点）"""
+    match = _LEADING_INT_RE.search(text or '')
+    return int(match.group()) if match else None
+
+
+def gpu_freq_to_mhz(value, unit=None):
+    """把GPU频率转换为MHz，未给出单位时根据数值大小判断"""
+    if unit:
+        return value // {'Hz': 1000000, 'kHz': 1000, 'MHz': 1}[unit]
+    if value > 1000000:  # Hz
+        return value // 1000000
+    elif value > 1000:  # kHz
+        return value // 1000
+    return value  # 已经是MHz
+
+
+def parse_uevent(text):
+    """解析power_supply的uevent文件为字典"""
+    values = {}
+    for line in text.split('\n'):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            values[key.strip()] = value.strip()
+    return values
+
+
+def parse_battery(files, calibration=None):
+    """从power_supply的uevent中取电池电流/电压，返回mA、V、mW"""
+    supplies = [parse_uevent(text) for path, text in sorted(files.items())
+                if path.startswith('/sys/class/power_supply/') and path.endswith('/uevent') and text]
+    battery = next((s for s in supplies if s.get('POWER_SUPPLY_TYPE') == 'Battery'), None)
+    if battery is None:
+        battery = next((s for s in supplies if s.get('POWER_SUPPLY_NAME') == 'battery'), None)
+    if battery is None:
+        return None
+    return battery_from_uevent(battery, calibration)
+
+
+def battery_calibration(values):
+    """根据一次uevent读数判断CURRENT_NOW/VOLTAGE_NOW的单位和电流方向（各厂商不一致）
+
+    电压在3~5V之间，按数量级区分µV/mV/V；电流绝对值不小于MICROAMP_THRESHOLD时为µA，否则为mA。
+    放电（Discharging）或充电（Charging）时根据读数的符号确定方向，之后放电电流为正、充电为负；
+    状态不明（充满、未充电）时无法判断，使用绝对值。
+    """
+    current = parse_int(values.get('POWER_SUPPLY_CURRENT_NOW'))
+    voltage = parse_int(values.get('POWER_SUPPLY_VOLTAGE_NOW'))
+    status = values.get('POWER_SUPPLY_STATUS')
+    if current is None:
+        return None
+    voltage = abs(voltage or 0)
+    calibration = {
+        'current_unit': 'uA' if abs(current) >= MICROAMP_THRESHOLD else 'mA',
+        'voltage_unit': 'uV' if voltage > 100000 else 'mV' if voltage > 100 else 'V',
+        'sign': None,
+        'status': status
+    }
+    if current and status == 'Discharging':
+        calibration['sign'] = 1 if current > 0 else -1
+    elif current and status == 'Charging':
+        calibration['sign'] = -1 if current > 0 else 1
+    return calibration
+
+
+def battery_reading(current, voltage, calibration=None):
+    """把原始的电流/电压读数换算为mA和V，calibration为None时按内核约定的µA/µV取绝对值"""
+    calibration = calibration or DEFAULT_CALIBRATION
+    if current is not None:
+        current = current / _CURRENT_SCALE[calibration['current_unit']]
+        current = current * calibration['sign'] if calibration['sign'] else abs(current)
+    if voltage is not None:
+        voltage = voltage / _VOLTAGE_SCALE[calibration['voltage_unit']]
+    return current, voltage
+
+
+def battery_from_uevent(values, calibration=None):
+    """由uevent中的CURRENT_NOW/VOLTAGE_NOW计算mA、V、mW，充电时电流和功率为负"""
+    current_raw = parse_int(values.get('POWER_SUPPLY_CURRENT_NOW'))
+    voltage_raw = parse_int(values.get('POWER_SUPPLY_VOLTAGE_NOW'))
+    if current_raw is None and voltage_raw is None:
+        return None
+    current, voltage = battery_reading(current_raw or 0, voltage_raw or 0, calibration)
+    return {'current': current, 'voltage': voltage, 'power': current * voltage}
+
+
+def parse_snapshot(output, timestamp, gpu_freq_paths=GPU_FREQ_PATHS, gpu_load_paths=GPU_LOAD_PATHS,
+                   gpu_freq_unit=None, battery_calibration=None):
+    """单次遍历解析快照输出，返回PerfSnapshot"""
+    files = split_files(output)
+    sample = PerfSnapshot(timestamp)
+    sample.cpu_stat = parse_proc_stat(files.get(PROC_STAT, ''))
+
+    for path, text in files.items():
+        match = _CPU_FREQ_RE.search(path)
+        if match and text.isdigit():
+            sample.cpu_freq[int(match.group(1))] = int(text) // 1000
+
+    for path in gpu_freq_paths:
+        value = parse_int(files.get(path))
+        if value is not None:
+            sample.gpu_freq = gpu_freq_to_mhz(value, gpu_freq_unit)
+            break
+
+    for path in gpu_load_paths:
+        value = parse_int(files.get(path))
+        if value is not None:
+            sample.gpu_load = value
+            break
+
+    sample.battery = parse_battery(files, battery_calibration)
+    return sample
@@ -4,7 +4,70 @@ let performanceChart;
 let chartType = 'fps';
 let isConnected = false;
 let isMonitoring = false;
-let performanceData = [];
+let liveBuffer;
+// 最近收到的样本，下一帧绘制时更新指标显示
+let latestSample = null;
+let capabilities = null;
+let currentSerial = null;
+
+// 紧凑遥测格式的版本及字段说明（订阅时由服务器发送）
+const TELEMETRY_VERSION = 3;
+let telemetrySchema = null;
+
+// 网页中保留的最大样本数（与服务器端环形缓冲区一致），完整数据由服务器录制
+const MAX_DATA_POINTS = 1200;
+
+// 图表类型对应的取值方法，环形缓冲区为每种类型保存一列
+const CHART_VALUES = {
+    fps: data => data.fps,
+    cpu: data => averageOf(data.cpu_load),
+    gpu: data => data.gpu_load,
+    power: data => data.power
+};
+
+// 获取目标应用进程/线程明细的间隔（毫秒）
+const APP_DETAIL_INTERVAL = 2000;
+
+// 获取会话能耗和标记区间的间隔（毫秒）
+const POWER_INTERVAL = 2000;
+let powerTimer = null;
+
+// 告警列表中保留的最近事件数
+const MAX_ALERTS = 20;
+// 正在触发的告警（规则|指标）
+let activeAlerts = new Set();
+
+// 各指标对应的显示元素，用于标注不可用原因
+const METRIC_ELEMENTS = {
+    fps: 'fpsValue',
+    cpu_freq: 'cpuFreqValue',
+    gpu_freq: 'gpuFreqValue',
+    gpu_load: 'gpuLoadValue',
+    battery: 'currentValue'
+};
+
+// 带质量标记的指标及其显示元素，估算值或过旧的读数以灰色显示
+const QUALITY_ELEMENTS = {
+    fps: 'fpsValue',
+    cpu_freq: 'cpuFreqValue',
+    cpu_load: 'cpuLoadValue',
+    gpu_freq: 'gpuFreqValue',
+    gpu_load: 'gpuLoadValue',
+    current: 'currentValue'
+};
+
+// 调试面板展开时的刷新定时器
+let debugTimer = null;
+
+// 后台任务（连接、读取设备信息、断开等）：接口立即返回任务，进度和结果由 job_event 推送
+// Socket.IO断开时按该间隔（毫秒）查询任务状态
+const JOB_POLL_INTERVAL = 1000;
+// 先于接口响应到达的任务结果最多保留的条数
+const MAX_FINISHED_JOBS = 50;
+const jobWaiters = {};
+const finishedJobs = {};
+// 正在进行的连接任务，可取消
+let connectJobId = null;
 
 // 初始化页面
 document.addEventListener('DOMContentLoaded', function() {
@@ -19,12 +82,42 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // 初始化事件监听器
     initEventListeners();
+
+    // 恢复刷新前的设备和监控状态
+    restoreSession();
 });
 
+// 刷新页面后恢复服务器端已连接的设备，加入房间后服务器会回放最近的数据
+function restoreSession() {
+    fetch('/api/sessions')
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success || !data.connected) {
+                return;
+            }
+            isConnected = true;
+            currentSerial = data.connected;
+            if (socket.connected) {
+                joinSession(currentSerial);
+            }
+            updateConnectionStatus(true, `已连接到设备: ${currentSerial}`);
+            const session = data.sessions.find(item => item.serial === currentSerial);
+            isMonitoring = Boolean(session && session.monitoring);
+            updateMonitoringStatus(isMonitoring);
+            document.getElementById('connectBtn').disabled = true;
+            document.getElementById('disconnectBtn').disabled = false;
+            document.getElementById('startMonitoringBtn').disabled = isMonitoring;
+            document.getElementById('stopMonitoringBtn').disabled = !isMonitoring;
+            document.getElementById('exportBtn').disabled = false;
+        })
+        .catch(error => {
+            console.error('恢复会话状态错误:', error);
+        });
+}
+
 // 检查ADB是否可用
 function checkADB() {
-    fetch('/api/check_adb')
-        .then(response => response.json())
+    runJob('/api/check_adb')
         .then(data => {
             if (!data.available) {
                 alert('警告: ADB工具不可用，请确保已安装ADB并添加到系统环境变量中。');
@@ -51,6 +144,12 @@ function initSocketIO() {
     // 添加连接事件处理
     socket.on('connect', function() {
         console.log('Socket.IO连接成功，ID:', socket.id);
+        // 重连后重新加入当前设备的房间
+        if (currentSerial) {
+            joinSession(currentSerial);
+        }
+        // 断开期间可能错过了任务事件，查询一次仍在等待的任务
+        Object.keys(jobWaiters).forEach(pollJob);
     });
     
     socket.on('connect_error', function(error) {
@@ -62,16 +161,350 @@ function initSocketIO() {
         console.log('Socket.IO连接断开:', reason);
     });
     
-    // 监听性能数据
-    socket.on('performance_data', function(data) {
-        console.log('收到性能数据:', data);
-        updateMetrics(data);
-        updateChart(data);
-        performanceData.push(data);
-        document.getElementById('dataPointCount').textContent = performanceData.length;
+    socket.on('telemetry_schema', function(schema) {
+        telemetrySchema = schema;
+    });
+
+    // 紧凑格式的性能数据：一帧包含一个或多个样本，处理完成后确认，服务器据此控制发送速度
+    socket.on('telemetry', function(frame, ack) {
+        if (frame.v === TELEMETRY_VERSION && telemetrySchema) {
+            decodeTelemetry(frame).forEach(handleSample);
+        }
+        if (ack) {
+            ack();
+        }
+    });
+
+    // 旧格式的性能数据（每条一个字典）
+    socket.on('performance_data', handleSample);
+
+    // 加入房间时服务器回放该设备最近的样本
+    socket.on('history', function(history) {
+        if (history.serial !== currentSerial || !history.samples.length) {
+            return;
+        }
+        liveBuffer.clear();
+        history.samples.slice(-MAX_DATA_POINTS).forEach(data => liveBuffer.push(data));
+        latestSample = history.samples[history.samples.length - 1];
+        scheduleRender();
+    });
+
+    // 后台任务的进度和结果
+    socket.on('job_event', handleJobEvent);
+
+    // 服务器端告警规则的触发和解除
+    socket.on('alert', function(event) {
+        if (event.serial === currentSerial) {
+            showAlerts([event], true);
+        }
+    });
+
+    // 能耗标记区间的开始和结束
+    socket.on('power_mark', function(mark) {
+        if (mark.serial === currentSerial) {
+            loadPower();
+        }
+    });
+
+    // 设备连接/断开事件（由服务器端的设备跟踪器推送）
+    socket.on('device_event', function(event) {
+        console.log('设备状态变化:', event);
+        if (!currentSerial || event.serial !== currentSerial) {
+            return;
+        }
+        const statusElement = document.getElementById('connectionStatus');
+        if (event.online) {
+            statusElement.innerHTML = `<span class="status-indicator status-connected"></span> 已连接`;
+            if (event.monitoring) {
+                updateMonitoringStatus(true);
+            }
+        } else {
+            statusElement.innerHTML = `<span class="status-indicator status-disconnected"></span> 设备离线（${event.state || '已断开'}）`;
+            if (event.monitoring) {
+                document.getElementById('monitoringStatus').innerHTML =
+                    `<span class="status-indicator status-disconnected"></span> 已暂停（等待设备重新连接）`;
+            }
+        }
+    });
+}
+
+// 订阅设备数据，使用紧凑的二进制格式
+function joinSession(serial) {
+    // 图表只显示该设备的样本，服务器随后推送的 history 会重新填充
+    liveBuffer.clear();
+    scheduleRender();
+    socket.emit('join_session', { serial: serial, protocol: TELEMETRY_VERSION, binary: true });
+    loadAlerts(serial);
+}
+
+// 加入房间时获取会话最近的告警，之后由 alert 事件追加
+function loadAlerts(serial) {
+    fetch(`/api/sessions/${encodeURIComponent(serial)}/live_stats`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success && serial === currentSerial) {
+                activeAlerts = new Set(data.active.map(alert => `${alert.rule}|${alert.metric}`));
+                showAlerts(data.recent, false);
+            }
+        });
+}
+
+// 会话的累计能耗和各标记区间，监控期间定期刷新
+function loadPower() {
+    if (!currentSerial) {
+        return;
+    }
+    fetch(`/api/sessions/${encodeURIComponent(currentSerial)}/power`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                showPower(data.summary, data.marks);
+            }
+        });
+}
+
+function showPower(summary, marks) {
+    document.getElementById('energyValue').textContent = formatMetric(summary.energy_mwh);
+    document.getElementById('avgPowerValue').textContent = formatMetric(summary.avg_power_mw);
+    document.getElementById('peakPowerValue').textContent = formatMetric(summary.peak_power_mw);
+    const list = document.getElementById('markList');
+    list.innerHTML = '';
+    marks.forEach(mark => {
+        const item = document.createElement('li');
+        item.className = mark.state === 'done' ? '' : 'text-primary';
+        item.textContent = `${mark.name}${mark.state === 'done' ? '' : '（进行中）'}：${mark.duration} 秒 · ` +
+            `${formatMetric(mark.energy_mwh)} mWh · 平均 ${formatMetric(mark.avg_power_mw)} mW · ` +
+            `峰值 ${formatMetric(mark.peak_power_mw)} mW`;
+        list.appendChild(item);
+    });
+}
+
+function setPowerPolling(enabled) {
+    clearInterval(powerTimer);
+    powerTimer = enabled ? setInterval(loadPower, POWER_INTERVAL) : null;
+    document.getElementById('startMarkBtn').disabled = !enabled;
+    document.getElementById('stopMarkBtn').disabled = !enabled;
+    loadPower();
+}
+
+// 开始或结束能耗标记区间
+function sendMark(action) {
+    const name = document.getElementById('markInput').value.trim();
+    if (!name) {
+        alert('请输入标记名称');
+        return;
+    }
+    fetch(`/api/sessions/${encodeURIComponent(currentSerial)}/marks`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ name: name, action: action })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            loadPower();
+        } else {
+            alert('标记失败: ' + data.message);
+        }
+    });
+}
+
+function showAlerts(events, append) {
+    const list = document.getElementById('alertList');
+    if (!append) {
+        list.innerHTML = '';
+    }
+    events.forEach(event => {
+        const item = document.createElement('li');
+        const time = new Date(event.timestamp * 1000).toLocaleTimeString();
+        const firing = event.state === 'firing';
+        if (append) {
+            activeAlerts[firing ? 'add' : 'delete'](`${event.rule}|${event.metric}`);
+        }
+        item.className = firing ? (event.severity === 'critical' ? 'text-danger' : 'text-warning') : 'text-muted';
+        item.textContent = `${time} ${firing ? '触发' : '解除'} ${event.message}（${event.metric} ` +
+            `${event.stat} ${event.value} / ${event.threshold}，持续 ${event.duration} 秒）`;
+        list.insertBefore(item, list.firstChild);
+    });
+    while (list.children.length > MAX_ALERTS) {
+        list.removeChild(list.lastChild);
+    }
+    document.getElementById('alertCount').textContent = activeAlerts.size;
+}
+
+// 解码紧凑格式的帧，还原为与旧格式相同结构的样本
+function decodeTelemetry(frame) {
+    const fields = telemetrySchema.fields;
+    const rows = frame.d instanceof ArrayBuffer ? unpackRows(frame.d, fields.length) : frame.d;
+    return rows.map(row => {
+        const data = { serial: frame.s, frame_time: {}, cpu_freq: {}, cpu_load: {}, app: null };
+        fields.forEach((field, i) => {
+            if (field.startsWith('frame_time_')) {
+                data.frame_time[field.slice('frame_time_'.length)] = row[i];
+            } else if (field.startsWith('app_')) {
+                // 紧凑格式只有应用的总计
+                if (row[i] !== null) {
+                    data.app = data.app || {};
+                    data.app[field.slice('app_'.length)] = row[i];
+                }
+            } else if (field === 'quality') {
+                data.quality = decodeQuality(row[i]);
+            } else {
+                data[field] = row[i];
+            }
+        });
+        row[fields.length].forEach((value, core) => {
+            if (value !== null) data.cpu_freq[`core_${core}`] = value;
+        });
+        row[fields.length + 1].forEach((value, core) => {
+            if (value !== null) data.cpu_load[`core_${core}`] = value;
+        });
+        return data;
     });
 }
 
+// 质量标记：每个指标占2位，依次对应schema中的quality.metrics
+function decodeQuality(value) {
+    if (value === null || value === undefined || !telemetrySchema.quality) {
+        return null;
+    }
+    const quality = {};
+    telemetrySchema.quality.metrics.forEach((metric, i) => {
+        quality[metric] = telemetrySchema.quality.flags[Math.floor(value / Math.pow(4, i)) % 4];
+    });
+    return quality;
+}
+
+// 二进制帧: 版本(u8) 样本数(u16) 核心数(u16)，
+// 每个样本为 timestamp(f64) + 其余标量(f32) + 各核心频率、负载(f32)，NaN表示缺失
+function unpackRows(buffer, fieldCount) {
+    const view = new DataView(buffer);
+    const count = view.getUint16(1, true);
+    const cores = view.getUint16(3, true);
+    const rows = [];
+    let offset = 5;
+    const readFloat = () => {
+        const value = view.getFloat32(offset, true);
+        offset += 4;
+        return Number.isNaN(value) ? null : Math.round(value * 100) / 100;
+    };
+    for (let n = 0; n < count; n++) {
+        const row = [view.getFloat64(offset, true)];
+        offset += 8;
+        for (let i = 1; i < fieldCount; i++) {
+            row.push(readFloat());
+        }
+        const freqs = [];
+        const loads = [];
+        for (let i = 0; i < cores; i++) freqs.push(readFloat());
+        for (let i = 0; i < cores; i++) loads.push(readFloat());
+        row.push(freqs, loads);
+        rows.push(row);
+    }
+    return rows;
+}
+
+// 处理一个样本：写入环形缓冲区，指标和图表在下一帧统一更新
+function handleSample(data) {
+    liveBuffer.push(data);
+    latestSample = data;
+    scheduleRender();
+}
+
+// 固定容量的环形缓冲区：时间戳和各图表类型的取值存放在类型化数组中，
+// 写满后覆盖最旧的样本，内存不随采集时长增长；切换图表类型时直接读取对应的列
+class SampleRing {
+    constructor(capacity, columns) {
+        this.capacity = capacity;
+        this.columns = columns;
+        this.timestamps = new Float64Array(capacity);
+        this.values = {};
+        Object.keys(columns).forEach(name => {
+            this.values[name] = new Float32Array(capacity);
+        });
+        this.clear();
+    }
+
+    clear() {
+        this.start = 0;
+        this.length = 0;
+    }
+
+    push(data) {
+        const index = (this.start + this.length) % this.capacity;
+        if (this.length < this.capacity) {
+            this.length++;
+        } else {
+            this.start = (this.start + 1) % this.capacity;
+        }
+        this.timestamps[index] = data.timestamp;
+        Object.entries(this.columns).forEach(([name, read]) => {
+            const value = read(data);
+            this.values[name][index] = value === null || value === undefined ? NaN : value;
+        });
+    }
+
+    // 按时间顺序把一列写入points（复用其中的点对象），跳过不可用的值，返回点数
+    fill(name, points) {
+        const column = this.values[name];
+        let count = 0;
+        for (let i = 0; i < this.length; i++) {
+            const index = (this.start + i) % this.capacity;
+            const value = column[index];
+            if (Number.isNaN(value)) {
+                continue;
+            }
+            const point = points[count] || (points[count] = { x: 0, y: 0 });
+            point.x = this.timestamps[index];
+            point.y = value;
+            count++;
+        }
+        points.length = count;
+        return count;
+    }
+}
+
+// 绘制合并：同一动画帧内收到的多个样本只更新一次指标和图表
+let renderPending = false;
+// 图表的两组点数组交替使用，每帧更换数组引用使Chart.js重新读取数据，而不必分配新数组
+let chartPoints = [[], []];
+let chartPointsFrame = 0;
+
+function scheduleRender() {
+    if (!renderPending) {
+        renderPending = true;
+        requestAnimationFrame(render);
+    }
+}
+
+function render() {
+    renderPending = false;
+    if (latestSample) {
+        updateMetrics(latestSample);
+        latestSample = null;
+    }
+    document.getElementById('dataPointCount').textContent = liveBuffer.length;
+    drawChartFromBuffer();
+}
+
+function drawChartFromBuffer() {
+    chartPointsFrame ^= 1;
+    const points = chartPoints[chartPointsFrame];
+    liveBuffer.fill(chartType, points);
+    setChartPoints(points);
+}
+
+function setChartPoints(points) {
+    performanceChart.data.datasets[0].data = points;
+    performanceChart.update('none');
+}
+
+function formatChartTime(value) {
+    return new Date(value * 1000).toLocaleTimeString();
+}
+
 // 初始化事件监听器
 function initEventListeners() {
     // 连接类型切换
@@ -91,6 +524,9 @@ function initEventListeners() {
     
     // 断开连接按钮
     document.getElementById('disconnectBtn').addEventListener('click', disconnectDevice);
+
+    // 取消连接按钮
+    document.getElementById('cancelConnectBtn').addEventListener('click', cancelConnect);
     
     // 开始监控按钮
     document.getElementById('startMonitoringBtn').addEventListener('click', startMonitoring);
@@ -100,7 +536,20 @@ function initEventListeners() {
     
     // 导出数据按钮
     document.getElementById('exportBtn').addEventListener('click', exportData);
+
+    // 能耗标记按钮
+    document.getElementById('startMarkBtn').addEventListener('click', () => sendMark('start'));
+    document.getElementById('stopMarkBtn').addEventListener('click', () => sendMark('stop'));
     
+    // 调试面板展开时每2秒刷新采集计量数据
+    document.getElementById('debugPanel').addEventListener('toggle', function() {
+        clearInterval(debugTimer);
+        if (this.open) {
+            loadDebugMetrics();
+            debugTimer = setInterval(loadDebugMetrics, 2000);
+        }
+    });
+
     // 图表类型切换按钮
     document.querySelectorAll('.btn-group button').forEach(button => {
         button.addEventListener('click', function() {
@@ -123,27 +572,55 @@ function initEventListeners() {
 function initChart() {
     const ctx = document.getElementById('performanceChart').getContext('2d');
     
+    liveBuffer = new SampleRing(MAX_DATA_POINTS, CHART_VALUES);
+    // 数据为按时间排序的 {x: 时间戳, y: 值}，关闭解析和动画、不绘制数据点，
+    // 点数超过图表宽度时由decimation插件按LTTB降采样后绘制
     performanceChart = new Chart(ctx, {
         type: 'line',
         data: {
-            labels: [],
             datasets: [{
                 label: 'FPS',
                 data: [],
                 borderColor: 'rgb(75, 192, 192)',
-                tension: 0.1,
+                borderWidth: 1.5,
+                pointRadius: 0,
+                tension: 0,
                 fill: false
             }]
         },
         options: {
             responsive: true,
             maintainAspectRatio: false,
+            parsing: false,
+            normalized: true,
+            interaction: {
+                mode: 'nearest',
+                axis: 'x',
+                intersect: false
+            },
+            plugins: {
+                decimation: {
+                    enabled: true,
+                    algorithm: 'lttb'
+                },
+                tooltip: {
+                    callbacks: {
+                        title: items => items.length ? formatChartTime(items[0].parsed.x) : ''
+                    }
+                }
+            },
             scales: {
                 x: {
+                    type: 'linear',
                     display: true,
                     title: {
                         display: true,
                         text: '时间'
+                    },
+                    ticks: {
+                        maxRotation: 0,
+                        maxTicksLimit: 8,
+                        callback: formatChartTime
                     }
                 },
                 y: {
@@ -155,19 +632,13 @@ function initChart() {
                     beginAtZero: true
                 }
             },
-            animation: {
-                duration: 0 // 禁用动画以提高性能
-            }
+            animation: false
         }
     });
 }
 
 // 更新图表类型
 function updateChartType() {
-    // 清除现有数据
-    performanceChart.data.datasets[0].data = [];
-    performanceChart.data.labels = [];
-    
     // 设置图表标题和颜色
     switch(chartType) {
         case 'fps':
@@ -192,48 +663,102 @@ function updateChartType() {
             break;
     }
     
-    // 重新填充数据
-    performanceData.forEach(data => {
-        const time = new Date(data.timestamp * 1000).toLocaleTimeString();
-        performanceChart.data.labels.push(time);
-        
-        switch(chartType) {
-            case 'fps':
-                performanceChart.data.datasets[0].data.push(data.fps);
-                break;
-            case 'cpu':
-                const avgCpuLoad = Object.values(data.cpu_load).reduce((a, b) => a + b, 0) / Object.keys(data.cpu_load).length;
-                performanceChart.data.datasets[0].data.push(avgCpuLoad);
-                break;
-            case 'gpu':
-                performanceChart.data.datasets[0].data.push(data.gpu_load);
-                break;
-            case 'power':
-                performanceChart.data.datasets[0].data.push(data.power);
-                break;
+    // 本页面已收到样本时直接读取环形缓冲区中对应的列；
+    // 还没有样本（如监控已结束后刷新页面）时从服务器获取录制的降采样序列
+    if (liveBuffer.length || !currentSerial) {
+        drawChartFromBuffer();
+        return;
+    }
+    loadChartRange();
+}
+
+// 图表类型对应的服务器端指标名
+const CHART_METRICS = {
+    fps: 'fps',
+    cpu: 'cpu_load',
+    gpu: 'gpu_load',
+    power: 'power'
+};
+// 范围查询返回的最大点数
+const CHART_MAX_POINTS = 2000;
+
+// 从服务器获取当前会话整个时间范围的降采样序列
+function loadChartRange() {
+    const metric = CHART_METRICS[chartType];
+    const type = chartType;
+    const serial = currentSerial;
+    fetch(`/api/sessions/${encodeURIComponent(serial)}/range?metric=${metric}&points=${CHART_MAX_POINTS}`)
+        .then(response => response.json())
+        .then(data => {
+            // 请求期间切换了图表类型或设备，或已收到实时样本，丢弃过期的结果
+            if (type !== chartType || serial !== currentSerial || liveBuffer.length) {
+                return;
+            }
+            if (!data.success) {
+                drawChartFromBuffer();
+                return;
+            }
+            setChartPoints(data.points
+                .filter(point => point[1] !== null)
+                .map(point => ({ x: point[0], y: point[1] })));
+        })
+        .catch(error => {
+            console.error('获取图表数据错误:', error);
+            drawChartFromBuffer();
+        });
+}
+
+// 格式化指标值，不可用的指标（null）显示为N/A
+function formatMetric(value, suffix = '') {
+    if (value === null || value === undefined || Number.isNaN(value)) {
+        return 'N/A';
+    }
+    return value + suffix;
+}
+
+// 计算各核心数值的平均值
+function averageOf(values) {
+    const list = Object.values(values || {});
+    return list.length ? list.reduce((a, b) => a + b, 0) / list.length : null;
+}
+
+// 根据探测结果标注不可用的指标
+function applyCapabilities(caps) {
+    capabilities = caps;
+    const unavailable = (caps && caps.unavailable) || {};
+    Object.entries(METRIC_ELEMENTS).forEach(([metric, elementId]) => {
+        const element = document.getElementById(elementId);
+        if (unavailable[metric]) {
+            element.title = '不可用: ' + unavailable[metric];
+            element.textContent = 'N/A';
+        } else {
+            element.title = '';
         }
     });
-    
-    // 更新图表
-    performanceChart.update();
 }
 
 // 更新指标显示
 function updateMetrics(data) {
-    document.getElementById('fpsValue').textContent = data.fps;
-    document.getElementById('cpuFreqValue').textContent = Object.values(data.cpu_freq).reduce((a, b) => a + b, 0) / Object.keys(data.cpu_freq).length;
-    document.getElementById('gpuFreqValue').textContent = data.gpu_freq;
-    document.getElementById('cpuLoadValue').textContent = Object.values(data.cpu_load).reduce((a, b) => a + b, 0) / Object.keys(data.cpu_load).length;
-    document.getElementById('gpuLoadValue').textContent = data.gpu_load;
-    document.getElementById('currentValue').textContent = data.current + ' mA';
-    document.getElementById('powerValue').textContent = data.power;
+    document.getElementById('fpsValue').textContent = formatMetric(data.fps);
+    document.getElementById('jankValue').textContent = formatMetric(data.jank);
+    document.getElementById('fpsValue').title = data.frame_time && data.frame_time.p50 !== null
+        ? `帧耗时 P50 ${data.frame_time.p50}ms / P90 ${data.frame_time.p90}ms / P99 ${data.frame_time.p99}ms`
+        : '';
+    document.getElementById('cpuFreqValue').textContent = formatMetric(averageOf(data.cpu_freq));
+    document.getElementById('gpuFreqValue').textContent = formatMetric(data.gpu_freq);
+    document.getElementById('cpuLoadValue').textContent = formatMetric(averageOf(data.cpu_load));
+    document.getElementById('gpuLoadValue').textContent = formatMetric(data.gpu_load);
+    document.getElementById('currentValue').textContent = formatMetric(data.current, ' mA');
+    document.getElementById('powerValue').textContent = formatMetric(data.power);
+    updateAppMetrics(data.app);
+    applyQuality(data.quality);
 
     // 更新CPU核心状态
     const cpuCoresContainer = document.getElementById('cpuCoresContainer');
     cpuCoresContainer.innerHTML = '';
     
     // 获取所有核心编号并排序
-    const coreNumbers = Object.keys(data.cpu_freq)
+    const coreNumbers = Object.keys(Object.assign({}, data.cpu_load, data.cpu_freq))
         .map(key => parseInt(key.replace('core_', '')))
         .sort((a, b) => a - b);
 
@@ -254,43 +779,52 @@ function updateMetrics(data) {
 
         coreCard.innerHTML = `
             <div style="font-size: 12px; color: #6c757d;">核心 ${coreNum}</div>
-            <div style="font-size: 14px; font-weight: bold;">${coreFreq} MHz</div>
-            <div style="font-size: 14px; font-weight: bold;">${coreLoad}%</div>
+            <div style="font-size: 14px; font-weight: bold;">${formatMetric(coreFreq, ' MHz')}</div>
+            <div style="font-size: 14px; font-weight: bold;">${formatMetric(coreLoad, '%')}</div>
         `;
 
         cpuCoresContainer.appendChild(coreCard);
     });
 }
 
-// 更新图表数据
-function updateChart(data) {
-    // 限制显示的数据点数量，保持最新的100个点
-    if (performanceChart.data.labels.length > 100) {
-        performanceChart.data.labels.shift();
-        performanceChart.data.datasets[0].data.shift();
+// 目标应用的CPU占用（100%为一个核心）和常驻内存；紧凑格式只有总计，进程和线程明细定期单独获取
+let appDetailFetchedAt = 0;
+function updateAppMetrics(app) {
+    document.getElementById('appCpuValue').textContent = formatMetric(app ? app.cpu : null);
+    document.getElementById('appRssValue').textContent = formatMetric(app ? app.rss : null);
+    if (app && app.package) {
+        showAppDetail(app);
+    } else if (app && Date.now() - appDetailFetchedAt > APP_DETAIL_INTERVAL) {
+        appDetailFetchedAt = Date.now();
+        fetch('/api/app_stats')
+            .then(response => response.json())
+            .then(data => showAppDetail(data.app));
+    } else if (!app) {
+        showAppDetail(null);
     }
-    
-    // 添加新数据点
-    const time = new Date(data.timestamp * 1000).toLocaleTimeString();
-    performanceChart.data.labels.push(time);
-    
-    switch(chartType) {
-        case 'fps':
-            performanceChart.data.datasets[0].data.push(data.fps);
-            break;
-        case 'cpu':
-            performanceChart.data.datasets[0].data.push(data.cpu_load);
-            break;
-        case 'gpu':
-            performanceChart.data.datasets[0].data.push(data.gpu_load);
-            break;
-        case 'power':
-            performanceChart.data.datasets[0].data.push(data.power);
-            break;
+}
+
+function showAppDetail(app) {
+    if (!app || !app.package) {
+        document.getElementById('appPackage').textContent = '-';
+        document.getElementById('appThreads').textContent = '';
+        return;
     }
-    
-    // 更新图表显示
-    performanceChart.update();
+    document.getElementById('appPackage').textContent =
+        `${app.package}（${app.processes.length} 个进程 · ${app.threads} 个线程）`;
+    document.getElementById('appThreads').textContent = app.top_threads
+        .map(thread => `${thread.name} ${thread.cpu}%`)
+        .join(' · ');
+}
+
+// 按质量标记区分真实读数与估算值、过旧的读数
+function applyQuality(quality) {
+    Object.entries(QUALITY_ELEMENTS).forEach(([metric, elementId]) => {
+        const element = document.getElementById(elementId);
+        const flag = quality ? quality[metric] : 'ok';
+        element.classList.toggle('quality-estimated', flag === 'estimated');
+        element.classList.toggle('quality-stale', flag === 'stale');
+    });
 }
 
 // 连接设备
@@ -307,34 +841,140 @@ function connectDevice() {
         data.ip = deviceIP;
     }
     
-    // 发送连接请求
-    fetch('/api/connect', {
+    // 发送连接请求，连接在服务器端的后台任务中进行，期间显示进度并可取消
+    setConnecting(true);
+    runJob('/api/connect', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    }, showConnectProgress)
     .then(data => {
+        setConnecting(false);
         if (data.success) {
             isConnected = true;
-            updateConnectionStatus(true, data.message);
+            currentSerial = data.serial;
+            joinSession(currentSerial);
+            updateConnectionStatus(true, data.message, data);
+            applyCapabilities(data.capabilities);
             document.getElementById('connectBtn').disabled = true;
             document.getElementById('disconnectBtn').disabled = false;
             document.getElementById('startMonitoringBtn').disabled = false;
             document.getElementById('stopMonitoringBtn').disabled = true;
             document.getElementById('exportBtn').disabled = false;
         } else {
-            alert('连接失败: ' + data.message);
+            updateConnectionStatus(false);
+            if (!data.cancelled) {
+                alert('连接失败: ' + data.message);
+            }
         }
     })
     .catch(error => {
+        setConnecting(false);
+        updateConnectionStatus(false);
         console.error('连接错误:', error);
         alert('连接请求失败，请检查服务器状态。');
     });
 }
 
+function setConnecting(connecting) {
+    if (!connecting) {
+        connectJobId = null;
+    }
+    document.getElementById('connectBtn').disabled = connecting;
+    document.getElementById('cancelConnectBtn').style.display = connecting ? '' : 'none';
+}
+
+function showConnectProgress(job) {
+    connectJobId = job.id;
+    const progress = job.progress;
+    const step = progress.total ? `（${progress.step + 1}/${progress.total}）` : '';
+    document.getElementById('connectionStatus').innerHTML =
+        `<span class="status-indicator status-disconnected"></span> 连接中：${progress.message || '排队中'}${step}`;
+}
+
+// 取消正在进行的连接，服务器在当前步骤完成后结束任务
+function cancelConnect() {
+    if (connectJobId) {
+        fetch(`/api/jobs/${connectJobId}/cancel`, { method: 'POST' });
+    }
+}
+
+// 请求后台任务接口，任务结束后返回与原来的同步接口相同格式的结果
+function runJob(url, options, onProgress) {
+    return fetch(url, options)
+        .then(response => response.json())
+        .then(data => data.job ? waitForJob(data.job, onProgress) : data);
+}
+
+function waitForJob(job, onProgress) {
+    return new Promise(resolve => {
+        const finished = finishedJobs[job.id] || (isJobActive(job) ? null : job);
+        if (finished) {
+            delete finishedJobs[job.id];
+            resolve(jobResult(finished));
+            return;
+        }
+        const waiter = { onProgress: onProgress, resolve: job => resolve(jobResult(job)) };
+        // Socket.IO连接正常时由 job_event 推送，只在断开期间查询
+        waiter.timer = setInterval(() => {
+            if (!socket || !socket.connected) {
+                pollJob(job.id);
+            }
+        }, JOB_POLL_INTERVAL);
+        jobWaiters[job.id] = waiter;
+        if (onProgress) {
+            onProgress(job);
+        }
+    });
+}
+
+function pollJob(jobId) {
+    fetch(`/api/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success && jobWaiters[jobId]) {
+                handleJobEvent(data.job);
+            }
+        })
+        .catch(() => {});
+}
+
+function handleJobEvent(job) {
+    const waiter = jobWaiters[job.id];
+    if (isJobActive(job)) {
+        if (waiter && waiter.onProgress) {
+            waiter.onProgress(job);
+        }
+        return;
+    }
+    if (!waiter) {
+        // 任务可能在接口响应之前结束（或由其他网页发起），暂存结果
+        finishedJobs[job.id] = job;
+        const ids = Object.keys(finishedJobs);
+        if (ids.length > MAX_FINISHED_JOBS) {
+            delete finishedJobs[ids[0]];
+        }
+        return;
+    }
+    delete jobWaiters[job.id];
+    clearInterval(waiter.timer);
+    waiter.resolve(job);
+}
+
+function isJobActive(job) {
+    return job.state === 'pending' || job.state === 'running';
+}
+
+function jobResult(job) {
+    if (job.state === 'done') {
+        return job.result;
+    }
+    const cancelled = job.state === 'cancelled';
+    return { success: false, cancelled: cancelled, message: cancelled ? '已取消' : job.error };
+}
+
 // 断开设备连接
 function disconnectDevice() {
     // 如果正在监控，先停止监控
@@ -342,14 +982,19 @@ function disconnectDevice() {
         stopMonitoring();
     }
     
-    // 发送断开连接请求
-    fetch('/api/disconnect', {
+    // 发送断开连接请求（服务器端的后台任务）
+    runJob('/api/disconnect', {
         method: 'POST'
     })
-    .then(response => response.json())
     .then(data => {
         if (data.success) {
             isConnected = false;
+            if (currentSerial) {
+                socket.emit('leave_session', { serial: currentSerial });
+                currentSerial = null;
+            }
+            liveBuffer.clear();
+            scheduleRender();
             updateConnectionStatus(false, data.message);
             document.getElementById('connectBtn').disabled = false;
             document.getElementById('disconnectBtn').disabled = true;
@@ -375,12 +1020,19 @@ function startMonitoring() {
     
     // 发送开始监控请求
     const interval = document.getElementById('intervalSelect').value;
+    // 采集方式格式为 "模式[:采样频率]"
+    const [mode, rate] = document.getElementById('modeSelect').value.split(':');
+    const packageName = document.getElementById('packageInput').value.trim();
+    const powerRate = parseInt(document.getElementById('powerRateSelect').value);
     fetch('/api/start_monitoring', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ interval: parseFloat(interval) })
+        body: JSON.stringify({
+            interval: parseFloat(interval), mode: mode, rate: rate ? parseInt(rate) : null, package: packageName || null,
+            power_rate: powerRate
+        })
     })
     .then(response => response.json())
     .then(data => {
@@ -390,14 +1042,10 @@ function startMonitoring() {
             document.getElementById('startMonitoringBtn').disabled = true;
             document.getElementById('stopMonitoringBtn').disabled = false;
             
-            // 清空历史数据
-            performanceData = [];
-            document.getElementById('dataPointCount').textContent = '0';
-            
-            // 重置图表
-            performanceChart.data.labels = [];
-            performanceChart.data.datasets[0].data = [];
-            performanceChart.update();
+            // 清空历史数据和图表
+            liveBuffer.clear();
+            latestSample = null;
+            scheduleRender();
         } else {
             alert('启动监控失败: ' + data.message);
         }
@@ -431,97 +1079,56 @@ function stopMonitoring() {
     });
 }
 
-// 导出数据
+// 导出数据（由服务器从录制文件流式生成，包含整个会话而不只是本页面收到的数据）
 function exportData() {
-    if (performanceData.length === 0) {
+    if (!currentSerial) {
         alert('没有可导出的数据');
         return;
     }
-    
-    // 准备CSV数据
-    let csvContent = '时间戳,FPS,CPU平均负载,GPU负载,功率(mW)';
-    
-    // 添加CPU核心负载的表头
-    const firstData = performanceData[0];
-    const coreCount = Object.keys(firstData.cpu_load).length;
-    for (let i = 0; i < coreCount; i++) {
-        csvContent += `,CPU核心${i}负载(%)`;
-    }
-    csvContent += '\n';
-    
-    // 添加数据行
-    performanceData.forEach(data => {
-        const time = new Date(data.timestamp * 1000).toLocaleString();
-        const cpuLoads = Object.values(data.cpu_load);
-        const avgCpuLoad = (cpuLoads.reduce((a, b) => a + b, 0) / cpuLoads.length).toFixed(2);
-        
-        let row = [
-            time,
-            data.fps,
-            avgCpuLoad,
-            data.gpu_load,
-            data.power
-        ];
-        
-        // 添加每个CPU核心的负载数据
-        cpuLoads.forEach(load => {
-            row.push(load);
-        });
-        
-        csvContent += row.join(',') + '\n';
-    });
-    
-    // 创建并下载CSV文件
-    const blob = new Blob([new Uint8Array([0xEF, 0xBB, 0xBF]), csvContent], { type: 'text/csv;charset=utf-8' });
     const link = document.createElement('a');
-    link.href = URL.createObjectURL(blob);
-    link.download = `性能数据_${new Date().toISOString().slice(0,19).replace(/:/g,'-')}.csv`;
+    link.href = `/api/sessions/${encodeURIComponent(currentSerial)}/export?format=csv`;
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
-    URL.revokeObjectURL(link.href);
 }
 
-// 创建CSV内容
-let csvContent = 'data:text/csv;charset=utf-8,';
-csvContent += '时间戳,FPS,CPU频率(MHz),GPU频率(MHz),CPU负载(%),GPU负载(%),电流(mA),功率(mW)\n';
+// CPU簇描述，如 "8核 (4×2000MHz + 4×2800MHz)"
+function describeCpu(profile) {
+    if (!profile || !profile.cpu_cores) {
+        return '-';
+    }
+    const clusters = (profile.clusters || [])
+        .map(cluster => `${cluster.cores.length}×${cluster.max_freq || '?'}MHz`);
+    return `${profile.cpu_cores}核` + (clusters.length ? ` (${clusters.join(' + ')})` : '');
+}
 
-performanceData.forEach(data => {
-    const time = new Date(data.timestamp * 1000).toLocaleString();
-    csvContent += `${time},${data.fps},${data.cpu_freq},${data.gpu_freq},${data.cpu_load},${data.gpu_load},${data.current},${data.power}\n`;
-});
+function showDeviceInfo(deviceInfo, profile) {
+    document.getElementById('deviceModel').textContent = deviceInfo.model || '-';
+    document.getElementById('osVersion').textContent = deviceInfo.os_version || '-';
+    document.getElementById('apiLevel').textContent = deviceInfo.api_level || '-';
+    document.getElementById('cpuTopology').textContent = describeCpu(profile);
+    document.getElementById('deviceInfoSection').style.display = 'block';
+}
 
-// 创建下载链接
-const encodedUri = encodeURI(csvContent);
-const link = document.createElement('a');
-link.setAttribute('href', encodedUri);
-link.setAttribute('download', `性能数据_${new Date().toISOString().slice(0,19).replace(/:/g,'-')}.csv`);
-document.body.appendChild(link);
-link.click();
-document.body.removeChild(link);
-
-// 更新连接状态
-function updateConnectionStatus(connected, message) {
+// 更新连接状态，info为连接接口的返回值（含设备信息时不再单独请求）
+function updateConnectionStatus(connected, message, info) {
     const statusElement = document.getElementById('connectionStatus');
     const deviceIdElement = document.getElementById('deviceId');
     const deviceInfoSection = document.getElementById('deviceInfoSection');
-    const deviceModelElement = document.getElementById('deviceModel');
-    const osVersionElement = document.getElementById('osVersion');
-    const apiLevelElement = document.getElementById('apiLevel');
     
     if (connected) {
         statusElement.innerHTML = `<span class="status-indicator status-connected"></span> 已连接`;
         deviceIdElement.textContent = message.split(': ')[1] || '未知';
         
-        // 获取设备信息
-        fetch('/api/device_info')
-            .then(response => response.json())
+        if (info && info.device_info) {
+            showDeviceInfo(info.device_info, info.profile);
+            return;
+        }
+        // 获取设备信息（服务器端已缓存，没有缓存时在后台任务中读取）
+        runJob('/api/device_info')
             .then(data => {
                 if (data.success && data.device_info) {
-                    deviceModelElement.textContent = data.device_info.model || '-';
-                    osVersionElement.textContent = data.device_info.os_version || '-';
-                    apiLevelElement.textContent = data.device_info.api_level || '-';
-                    deviceInfoSection.style.display = 'block';
+                    showDeviceInfo(data.device_info, data.profile);
                 }
             })
             .catch(error => {
@@ -543,4 +1150,46 @@ function updateMonitoringStatus(monitoring, message) {
     } else {
         statusElement.innerHTML = `<span class="status-indicator status-disconnected"></span> 未监控`;
     }
-}
\ No newline at end of file
+    setPowerPolling(monitoring);
+}
+
+// 调试面板：各采集方法的耗时、错误、超时和默认值次数，以及监控循环和推送的统计
+function loadDebugMetrics() {
+    fetch('/api/metrics/debug')
+        .then(response => response.json())
+        .then(data => {
+            const series = data.metrics || {};
+            const byCollector = {};
+            const collectorRow = name => byCollector[name] || (byCollector[name] = {
+                calls: 0, p50: null, p95: null, errors: 0, timeouts: 0, exceptions: 0, fallbacks: 0
+            });
+            (series.collector_duration_seconds || []).forEach(item => {
+                Object.assign(collectorRow(item.labels.collector), { calls: item.count, p50: item.p50, p95: item.p95 });
+            });
+            [['collector_errors_total', 'errors'], ['collector_timeouts_total', 'timeouts'],
+             ['collector_exceptions_total', 'exceptions'], ['collector_fallbacks_total', 'fallbacks']]
+                .forEach(([name, key]) => {
+                    (series[name] || []).forEach(item => {
+                        collectorRow(item.labels.collector)[key] += item.value;
+                    });
+                });
+            const formatSeconds = value => value === null ? '-' : `≤${value * 1000}ms`;
+            document.getElementById('debugCollectors').innerHTML = Object.entries(byCollector)
+                .sort(([a], [b]) => a.localeCompare(b))
+                .map(([name, row]) => `<tr><td>${name}</td><td>${row.calls}</td><td>${formatSeconds(row.p50)}</td>` +
+                    `<td>${formatSeconds(row.p95)}</td><td>${row.errors}</td><td>${row.timeouts}</td>` +
+                    `<td>${row.exceptions}</td><td>${row.fallbacks}</td></tr>`)
+                .join('');
+
+            const total = name => (series[name] || []).reduce((sum, item) => sum + (item.value || item.count || 0), 0);
+            const quality = (series.sample_quality_total || [])
+                .filter(item => item.labels.quality !== 'ok')
+                .map(item => `${item.labels.metric}:${item.labels.quality}=${item.value}`)
+                .join(' ');
+            document.getElementById('debugSummary').textContent =
+                `推送样本 ${total('monitor_samples_total')} · 错过截止时间 ${total('monitor_tick_overruns_total')} · ` +
+                `丢弃 ${total('telemetry_dropped_total')} · Socket.IO推送 ${total('socketio_emits_total')} 次 / ` +
+                `${(total('socketio_emit_bytes_total') / 1024).toFixed(1)} KB` + (quality ? ` · 非真实读数 ${quality}` : '');
+        })
+        .catch(error => console.error('获取调试数据失败:', error));
+}
@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from collections import deque
+
+import rollup
+
+# 录制文件目录，每个会话一个SQLite文件
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+# 内存环形缓冲区保留的最近样本数（4Hz下约5分钟），用于网页重连后回放
+RING_SIZE = 1200
+# 攒批写入磁盘的间隔（秒）和最大行数，减少事务次数
+FLUSH_INTERVAL = 1.0
+FLUSH_ROWS = 64
+
+# 标量指标列，顺序即表结构中的列顺序
+SCALAR_COLUMNS = (
+    ('fps', 'REAL'),
+    ('frame_time_p50', 'REAL'),
+    ('frame_time_p90', 'REAL'),
+    ('frame_time_p99', 'REAL'),
+    ('jank', 'INTEGER'),
+    ('big_jank', 'INTEGER'),
+    ('gpu_freq', 'INTEGER'),
+    ('gpu_load', 'INTEGER'),
+    ('current', 'REAL'),
+    ('power', 'REAL'),
+    # 目标应用所有进程的CPU占用（%，100为一个核心）和常驻内存（MB）
+    ('app_cpu', 'REAL'),
+    ('app_rss', 'REAL'),
+)
+# 每个核心一列，列名为 cpu_freq_<核心编号> / cpu_load_<核心编号>
+CORE_METRICS = ('cpu_freq', 'cpu_load')
+
+_CORE_COLUMN_RE = re.compile(r'^(cpu_freq|cpu_load)_(\d+)$')
+
+
+def new_session_id(serial, directory=RECORDINGS_DIR):
+    """生成会话ID：序列号（去掉文件名中不允许的字符）加开始时间
+
+    同一秒内已有同名录制时追加序号；返回前以独占方式创建空的录制文件占用该ID，
+    同一设备快速重启监控或重新处理抓包（包括其他工作进程中的）不会写入同一个文件。
+    """
+    safe_serial = re.sub(r'[^\w.-]', '_', serial or 'device')
+    base = f"{safe_serial}_{time.strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(directory, exist_ok=True)
+    index = 1
+    while True:
+        session_id = base if index == 1 else f'{base}_{index}'
+        try:
+            os.close(os.open(recording_path(session_id, directory), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return session_id
+        except FileExistsError:
+            index += 1
+
+
+def recording_path(session_id, directory=RECORDINGS_DIR):
+    return os.path.join(directory, f'{session_id}.db')
+
+
+def flatten_sample(data):
+    """把推送给网页的样本转换为 {列名: 值}，每个核心的频率和负载各占一列"""
+    frame_time = data.get('frame_time') or {}
+    row = {
+        'timestamp': data.get('timestamp'),
+        'fps': data.get('fps'),
+        'frame_time_p50': frame_time.get('p50'),
+        'frame_time_p90': frame_time.get('p90'),
+        'frame_time_p99': frame_time.get('p99'),
+        'jank': data.get('jank'),
+        'big_jank': data.get('big_jank'),
+        'gpu_freq': data.get('gpu_freq'),
+        'gpu_load': data.get('gpu_load'),
+        'current': data.get('current'),
+        'power': data.get('power'),
+        'app_cpu': (data.get('app') or {}).get('cpu'),
+        'app_rss': (data.get('app') or {}).get('rss'),
+    }
+    for metric in CORE_METRICS:
+        for key, value in (data.get(metric) or {}).items():
+            core = key.replace('core_', '')
+            if core.isdigit():
+                row[f'{metric}_{core}'] = value
+    return row
+
+
+def unflatten_sample(row):
+    """把数据库中的一行还原为与实时推送相同结构的样本"""
+    data = {'cpu_freq': {}, 'cpu_load': {}, 'frame_time': {}}
+    for column, value in row.items():
+        match = _CORE_COLUMN_RE.match(column)
+        if match:
+            if value is not None:
+                data[match.group(1)][f'core_{match.group(2)}'] = value
+        elif column.startswith('frame_time_'):
+            data['frame_time'][column[len('frame_time_'):]] = value
+        elif column.startswith('app_'):
+            # 录制中只有应用的总计，进程和线程明细不落盘
+            if value is not None:
+                data.setdefault('app', {})[column[len('app_'):]] = value
+        else:
+            data[column] = value
+    return data
+
+
+# 会话录制
+class SessionRecorder:
+    """一个会话的样本录制：内存环形缓冲区 + 只追加的SQLite文件
+
+    环形缓冲区长度固定，供网页重连时回放最近的数据；
+    所有样本按批写入磁盘（WAL模式，导出等读取不阻塞写入），
+    长时间录制时内存占用保持不变。
+    """
+
+    def __init__(self, session_id, serial, meta=None, directory=RECORDINGS_DIR, ring_size=RING_SIZE):
+        self.session_id = session_id
+        self.serial = serial
+        self.path = recording_path(session_id, directory)
+        self.rows = 0
+        self.closed = False
+        self._ring = deque(maxlen=ring_size)
+        self._pending = []
+        # 增量汇总（1s/10s/60s），已结束的时间桶随样本一起写入
+        self._rollup = rollup.Rollup()
+        self._pending_buckets = []
+        # 告警等事件和高频电流/电压读数，与样本一起批量写入
+        self._pending_events = []
+        self._pending_power = []
+        self.power_rows = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        scalars = ', '.join(f'{name} {kind}' for name, kind in SCALAR_COLUMNS)
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS samples (timestamp REAL NOT NULL, {scalars})')
+        self._db.execute('CREATE INDEX IF NOT EXISTS samples_timestamp ON samples (timestamp)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS events (timestamp REAL NOT NULL, kind TEXT NOT NULL, '
+                         'data TEXT)')
+        # 电流（mA，放电为正）和电压（V）的原始读数，频率高于样本
+        self._db.execute('CREATE TABLE IF NOT EXISTS power (timestamp REAL NOT NULL, current REAL, voltage REAL)')
+        rollup.create_tables(self._db)
+        # 打开已有的录制时沿用其中的列（包括已追加的核心列）
+        self._columns = [row[1] for row in self._db.execute('PRAGMA table_info(samples)')]
+        info = {'session_id': session_id, 'serial': serial, 'started_at': time.time()}
+        info.update(meta or {})
+        self._db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             [(key, json.dumps(value)) for key, value in info.items()])
+        self._db.commit()
+
+    def append(self, data):
+        """记录一个样本，达到批量条件时写入磁盘"""
+        row = flatten_sample(data)
+        with self._lock:
+            self._ring.append(data)
+            self._pending.append(row)
+            self._pending_buckets += self._rollup.add(row)
+            self.rows += 1
+            if len(self._pending) >= FLUSH_ROWS or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self._flush()
+
+    def record_event(self, kind, timestamp, data):
+        """记录一个事件（如告警的触发和解除），随下一批样本写入磁盘"""
+        with self._lock:
+            if not self.closed:
+                self._pending_events.append((timestamp, kind, json.dumps(data, ensure_ascii=False)))
+
+    def append_power(self, readings):
+        """记录一批 (时间, 电流mA, 电压V) 读数，随下一批样本写入磁盘"""
+        with self._lock:
+            if not self.closed:
+                self._pending_power += readings
+                self.power_rows += len(readings)
+
+    def recent(self, limit=None):
+        """返回环形缓冲区中最近的样本（按时间顺序）"""
+        with self._lock:
+            samples = list(self._ring)
+        return samples[-limit:] if limit else samples
+
+    def flush(self):
+        """把尚未写入的样本写入磁盘（导出正在录制的会话前调用）"""
+        with self._lock:
+            if not self.closed:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._pending_buckets += self._rollup.drain()
+            self._flush()
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             ('stopped_at', json.dumps(time.time())))
+            self._db.commit()
+            self._db.close()
+
+    def _flush(self):
+        """写入攒批的数据；写入失败时丢弃这一批（环形缓冲区中仍保留最近的样本），内存占用不随失败增长"""
+        self._last_flush = time.monotonic()
+        rows, self._pending = self._pending, []
+        buckets, self._pending_buckets = self._pending_buckets, []
+        events, self._pending_events = self._pending_events, []
+        readings, self._pending_power = self._pending_power, []
+        try:
+            self._write(rows, buckets, events, readings)
+        except sqlite3.Error as e:
+            self._db.rollback()
+            # 回滚后以表中实际的列为准（追加列的语句可能已被回滚）
+            self._columns = [row[1] for row in self._db.execute('PRAGMA table_info(samples)')]
+            print(f"写入录制 {self.session_id} 失败，丢弃 {len(rows)} 个样本: {str(e)}")
+
+    def _write(self, rows, buckets, events, readings):
+        if buckets:
+            rollup.write_buckets(self._db, buckets)
+        if events:
+            self._db.executemany('INSERT INTO events (timestamp, kind, data) VALUES (?, ?, ?)', events)
+        if readings:
+            self._db.executemany('INSERT INTO power (timestamp, current, voltage) VALUES (?, ?, ?)', readings)
+        if not rows:
+            self._db.commit()
+            return
+        # 核心数在第一批样本中确定，出现新的核心时追加列
+        columns = set()
+        for row in rows:
+            columns.update(row)
+        for column in sorted(columns - set(self._columns), key=_column_order):
+            self._db.execute(f'ALTER TABLE samples ADD COLUMN {column} INTEGER')
+            self._columns.append(column)
+        placeholders = ', '.join('?' for _ in self._columns)
+        self._db.executemany(
+            f"INSERT INTO samples ({', '.join(self._columns)}) VALUES ({placeholders})",
+            [tuple(row.get(column) for column in self._columns) for row in rows]
+        )
+        self._db.commit()
+
+
+def _column_order(column):
+    match = _CORE_COLUMN_RE.match(column)
+    if match:
+        return CORE_METRICS.index(match.group(1)), int(match.group(2))
+    return -1, column
+
+
+def list_recordings(directory=RECORDINGS_DIR):
+    """列出目录中的所有录制及其元数据，按开始时间排序"""
+    if not os.path.isdir(directory):
+        return []
+    recordings = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.db'):
+            continue
+        try:
+            with closing(open_recording(name[:-3], directory)) as db:
+                recordings.append(recording_meta(db))
+        except sqlite3.Error as e:
+            print(f"读取录制 {name} 失败: {str(e)}")
+    return sorted(recordings, key=lambda meta: meta.get('started_at') or 0)
+
+
+def open_recording(session_id, directory=RECORDINGS_DIR):
+    """以只读方式打开录制文件，不存在时抛出FileNotFoundError"""
+    path = recording_path(session_id, directory)
+    if not re.match(r'^[\w.-]+$', session_id) or not os.path.exists(path):
+        raise FileNotFoundError(f'录制不存在: {session_id}')
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+
+
+def recording_meta(db):
+    return {key: json.loads(value) for key, value in db.execute('SELECT key, value FROM meta')}
+
+
+def _has_table(db, name):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def read_events(db, kind=None):
+    """录制中的事件（按时间顺序），旧录制没有事件表时返回空列表"""
+    if not _has_table(db, 'events'):
+        return []
+    sql = 'SELECT timestamp, kind, data FROM events'
+    params = []
+    if kind:
+        sql += ' WHERE kind = ?'
+        params.append(kind)
+    return [dict(json.loads(data), timestamp=timestamp, kind=kind)
+            for timestamp, kind, data in db.execute(sql + ' ORDER BY timestamp', params)]
+
+
+def read_power(db, start=None, end=None):
+    """录制中的高频电流/电压读数 (时间, 电流mA, 电压V) 的游标，旧录制没有该表时返回空列表"""
+    if not _has_table(db, 'power'):
+        return []
+    where = []
+    params = []
+    if start is not None:
+        where.append('timestamp >= ?')
+        params.append(start)
+    if end is not None:
+        where.append('timestamp <= ?')
+        params.append(end)
+    sql = 'SELECT timestamp, current, voltage FROM power'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return db.execute(sql + ' ORDER BY timestamp', params)
+
+
+def recording_columns(db):
+    """录制中的数据列（含timestamp），按表结构顺序"""
+    return [row[1] for row in db.execute('PRAGMA table_info(samples)')]
+
+
+def select_columns(columns, metrics=None):
+    """按指标名筛选列，cpu_load会匹配所有 cpu_load_N 列，frame_time匹配各分位数列"""
+    if not metrics:
+        return [column for column in columns if column != 'timestamp']
+    return [column for column in columns if column != 'timestamp' and
+            any(column == metric or column.startswith(metric + '_') for metric in metrics)]
+
+
+def select_rows(db, columns, start=None, end=None):
+    """按时间顺序查询样本的游标，每行为 (timestamp, 值...) 元组"""
+    where = []
+    params = []
+    if start is not None:
+        where.append('timestamp >= ?')
+        params.append(start)
+    if end is not None:
+        where.append('timestamp <= ?')
+        params.append(end)
+    sql = f"SELECT {', '.join(['timestamp'] + list(columns))} FROM samples"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return db.execute(sql + ' ORDER BY timestamp', params)
+
+
+def iter_rows(db, columns, start=None, end=None, batch=500):
+    """按时间顺序逐批读取样本，返回 (timestamp, 值...) 元组，内存占用与录制长度无关"""
+    cursor = select_rows(db, columns, start, end)
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            break
+        for row in rows:
+            yield row
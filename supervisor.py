@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""多进程分片采集：把设备分配到若干工作进程，每个工作进程运行自己那部分设备的采集会话
+
+网页进程（eventlet）只负责请求处理和推送，解析dumpsys输出、管理adb子进程等工作都在工作进程中进行，
+采集吞吐量随主机核心数增加。工作进程通过标准输入/输出与网页进程通信，每行一条JSON消息：
+
+    网页进程 -> 工作进程  {"op": "call", "id": 1, "serial": ..., "method": "start", "args": [...]}
+                          {"op": "rules", "rules": [...]}
+    工作进程 -> 网页进程  {"op": "reply", "id": 1, "result": ..., "state": {会话统计}}
+                          {"op": "sample", "serial": ..., "row": [...]}     紧凑格式的样本（telemetry.encode_sample）
+                          {"op": "event", "serial": ..., "event": ..., "data": {...}}
+                          {"op": "state", "states": {序列号: 会话统计}}
+
+会话开始时分配到正在监控的会话最少的工作进程；工作进程意外退出后，它的会话立即在其他工作进程上
+按原参数重新开始（新的录制），退出的进程按退避间隔重启。工作进程的日志写入标准错误，
+网页进程退出时工作进程读到输入结束，停止所有会话后退出。
+"""
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+import telemetry
+
+# 工作进程意外退出后的重启等待时间（秒），连续失败时逐次翻倍直到上限
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+# 工作进程运行超过该时长（秒）后退出的，重启等待时间恢复为初始值
+STABLE_AFTER = 60.0
+# 等待工作进程回复的超时时间（秒）
+CALL_TIMEOUT = 10.0
+# 工作进程推送会话统计、网页进程检查规则和重启的间隔（秒）
+STATE_INTERVAL = 1.0
+# 停止时等待工作进程结束会话的时间（秒）
+STOP_TIMEOUT = 5.0
+# 可以转发到工作进程的会话方法
+SESSION_METHODS = ('start', 'stop', 'remove', 'pause', 'resume', 'history', 'app_stats', 'live_stats',
+                   'power_stats', 'flush_recording', 'start_mark', 'stop_mark')
+
+
+def encode_message(message):
+    return (json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+# 工作进程
+class WorkerHost:
+    """工作进程内的会话管理：执行网页进程的调用，把样本和事件写回网页进程"""
+
+    def __init__(self, output):
+        # 在这里导入，网页进程不需要加载采集模块
+        import alerts
+        from session import SessionManager
+        self.output = output
+        self.rule_set = alerts.RuleSet()
+        self.sessions = SessionManager(self.publish, self.rule_set)
+        self._running = True
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        data = encode_message(message)
+        with self._lock:
+            try:
+                self.output.write(data)
+                self.output.flush()
+            except (BrokenPipeError, ValueError):
+                self._running = False  # 网页进程已退出
+
+    def publish(self, serial, event, data):
+        if event == 'performance_data':
+            self.send({'op': 'sample', 'serial': serial, 'row': telemetry.encode_sample(data)})
+        else:
+            self.send({'op': 'event', 'serial': serial, 'event': event, 'data': data})
+
+    def run(self, stream):
+        thread = threading.Thread(target=self._report)
+        thread.daemon = True
+        thread.start()
+        for line in iter(stream.readline, b''):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get('op') == 'call':
+                self._handle_call(message)
+            elif message.get('op') == 'rules':
+                try:
+                    self.rule_set.update(message['rules'])
+                except ValueError as e:
+                    print(f"更新告警规则失败: {str(e)}")
+            if not self._running:
+                break
+        self._running = False
+        self._shutdown()
+
+    def call(self, serial, method, args):
+        from adb_tools import ADBTools
+        if method not in SESSION_METHODS:
+            raise ValueError(f'不支持的方法: {method}')
+        if method == 'start':
+            return self.sessions.start(serial, *args)
+        session = self.sessions.get(serial)
+        if session is None:
+            return None
+        result = getattr(session, method)(*args)
+        if method == 'pause':
+            # 设备已离线，本进程的常驻shell都不再可用
+            ADBTools.close_shells(serial)
+        return result
+
+    def _handle_call(self, message):
+        serial = message.get('serial')
+        if message.get('method') == 'remove':
+            # 移出会话并发出停止请求在读取线程中完成，之后同一设备的start不受影响；
+            # 等待监控线程结束最多需要STOP_TIMEOUT秒，放到单独的线程中，不阻塞其他调用
+            session = self.sessions.remove(serial)
+            thread = threading.Thread(target=self._finish_remove, args=(message, session))
+            thread.daemon = True
+            thread.start()
+            return
+        reply = {'op': 'reply', 'id': message.get('id')}
+        try:
+            reply['result'] = self.call(serial, message.get('method'), message.get('args') or [])
+        except ValueError as e:
+            reply.update(error=str(e), value_error=True)
+        except Exception as e:
+            print(f"[{serial}] 执行 {message.get('method')} 失败: {str(e)}")
+            reply['error'] = str(e)
+        session = self.sessions.get(serial)
+        reply['state'] = session.stats() if session else None
+        self.send(reply)
+
+    def _finish_remove(self, message, session):
+        """等监控线程结束后再关闭它使用的常驻shell通道，然后回复remove调用"""
+        from adb_tools import ADBTools
+        serial = message.get('serial')
+        if session:
+            session.join(STOP_TIMEOUT)
+        ADBTools.close_shells(serial)
+        self.send({'op': 'reply', 'id': message.get('id'), 'result': bool(session), 'state': None})
+
+    def _report(self):
+        while self._running:
+            time.sleep(STATE_INTERVAL)
+            states = {}
+            for stats in self.sessions.list():
+                states[stats['serial']] = stats
+            if states:
+                self.send({'op': 'state', 'states': states})
+
+    def _shutdown(self):
+        from adb_tools import ADBTools
+        self.sessions.stop_all()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for stats in self.sessions.list():
+            session = self.sessions.get(stats['serial'])
+            if session:
+                session.join(max(0.0, deadline - time.monotonic()))
+        ADBTools.close_shells()
+
+
+def run_worker():
+    """工作进程入口：标准输出只用于消息，print等输出改写到标准错误"""
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    WorkerHost(output).run(sys.stdin.buffer)
+
+
+# 网页进程中的工作进程句柄
+class WorkerProcess:
+    """启动一个工作进程，读取它的消息，转发调用并等待回复"""
+
+    def __init__(self, index, on_message, on_exit):
+        self.index = index
+        self.on_message = on_message
+        self.on_exit = on_exit
+        self.proc = None
+        self.alive = False
+        self.started_at = None
+        self.restarts = 0
+        self.restart_at = None
+        self.delay = RESTART_DELAY
+        self.rules_version = None
+        self._next_id = 0
+        self._pending = {}
+        self._stopping = False
+        self._lock = threading.Lock()
+        # 写入单独加锁：写满管道时阻塞不影响读取线程处理回复
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker'],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.alive = True
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        self.rules_version = None
+        thread = threading.Thread(target=self._read, args=(self.proc,))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """关闭输入，工作进程停止所有会话后退出；超时后强制结束"""
+        self._stopping = True
+        proc = self.proc
+        if not proc:
+            return
+        try:
+            proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            proc.wait(timeout=STOP_TIMEOUT + 1)
+        except Exception:
+            proc.kill()
+
+    def send(self, message):
+        data = encode_message(message)
+        with self._write_lock:
+            if not self.alive:
+                raise RuntimeError(f'工作进程 {self.index} 未运行')
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+
+    def call(self, serial, method, args=(), timeout=CALL_TIMEOUT):
+        """调用工作进程中会话的方法，返回 (结果, 会话统计)
+
+        会话方法抛出的ValueError原样抛出，工作进程未运行、退出或超时时抛出RuntimeError。
+        """
+        with self._lock:
+            self._next_id += 1
+            call_id = self._next_id
+            waiter = {'event': threading.Event(), 'reply': None}
+            self._pending[call_id] = waiter
+        try:
+            self.send({'op': 'call', 'id': call_id, 'serial': serial, 'method': method, 'args': list(args)})
+            if not waiter['event'].wait(timeout):
+                raise RuntimeError(f'工作进程 {self.index} 响应超时: {method}')
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f'工作进程 {self.index} 通信失败: {str(e)}')
+        finally:
+            with self._lock:
+                self._pending.pop(call_id, None)
+        reply = waiter['reply']
+        if reply is None:
+            raise RuntimeError(f'工作进程 {self.index} 已退出')
+        if 'error' in reply:
+            if reply.get('value_error'):
+                raise ValueError(reply['error'])
+            raise RuntimeError(reply['error'])
+        return reply.get('result'), reply.get('state')
+
+    def _read(self, proc):
+        for line in iter(proc.stdout.readline, b''):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get('op') == 'reply':
+                with self._lock:
+                    waiter = self._pending.get(message.get('id'))
+                if waiter:
+                    waiter['reply'] = message
+                    waiter['event'].set()
+            else:
+                try:
+                    self.on_message(self, message)
+                except Exception as e:
+                    print(f"处理工作进程 {self.index} 的消息失败: {str(e)}")
+        with self._lock:
+            self.alive = False
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            waiter['event'].set()
+        try:
+            proc.wait(timeout=STOP_TIMEOUT)
+        except Exception:
+            proc.kill()
+        if not self._stopping:
+            self.on_exit(self, proc.returncode)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'index': self.index,
+            'pid': self.proc.pid if self.proc else None,
+            'alive': self.alive,
+            'uptime': round(time.monotonic() - self.started_at, 1) if self.alive else None,
+            'restarts': self.restarts,
+            'pending_calls': pending
+        }
+
+
+class RemoteSession:
+    """网页进程中代表工作进程内会话的对象，提供server.py使用的DeviceSession接口
+
+    monitoring/paused/session_id和stats()读取工作进程定期推送（及每次调用回复）的统计，
+    其他方法转发到会话所在的工作进程；工作进程不可用时返回与会话不存在相同的结果。
+    """
+
+    def __init__(self, supervisor, serial):
+        self.supervisor = supervisor
+        self.serial = serial
+        self.worker = None
+        # 开始监控的参数，工作进程退出后按原参数在其他工作进程上重新开始
+        self.params = None
+        self.wanted = False
+        self.state = {}
+
+    @property
+    def monitoring(self):
+        return bool(self.state.get('monitoring'))
+
+    @property
+    def paused(self):
+        return bool(self.state.get('paused'))
+
+    @property
+    def session_id(self):
+        return self.state.get('session_id')
+
+    def stats(self):
+        stats = dict(self.state) if self.state else {
+            'serial': self.serial, 'session_id': None, 'monitoring': False, 'paused': False}
+        stats['worker'] = self.worker.index if self.worker else None
+        return stats
+
+    def start(self, interval=1.0, mode='poll', rate=None, capture_raw=False, package=None, power_rate=None):
+        if self.wanted and self.worker and self.worker.alive and self.monitoring:
+            return False
+        self.params = [interval, mode, rate, capture_raw, package, power_rate]
+        return self.supervisor.place(self)
+
+    def stop(self):
+        self.wanted = False
+        return bool(self._call('stop', default=False))
+
+    def remove(self):
+        self.wanted = False
+        return self._call('remove', default=False)
+
+    def join(self, timeout=None):
+        pass  # 工作进程等会话结束（最多STOP_TIMEOUT秒）后才回复remove，remove返回时已无需等待
+
+    def pause(self):
+        self._call('pause')
+
+    def resume(self):
+        self._call('resume')
+
+    def history(self, limit=None):
+        return self._call('history', limit, default=None) or []
+
+    def app_stats(self):
+        return self._call('app_stats', default=None) or {'package': None, 'app': None}
+
+    def live_stats(self):
+        return self._call('live_stats')
+
+    def power_stats(self):
+        return self._call('power_stats')
+
+    def flush_recording(self):
+        # 工作进程已退出时录制文件仍在，已写入的部分可以直接读取
+        return self._call('flush_recording', default=self.session_id)
+
+    def start_mark(self, name):
+        return self._call('start_mark', name, raise_errors=True)
+
+    def stop_mark(self, name):
+        return self._call('stop_mark', name, raise_errors=True)
+
+    def _call(self, method, *args, default=None, raise_errors=False):
+        worker = self.worker
+        if worker is None or not worker.alive:
+            if raise_errors:
+                raise ValueError('监控未运行')
+            return default
+        try:
+            result, state = worker.call(self.serial, method, args)
+        except RuntimeError as e:
+            print(f"[{self.serial}] 调用工作进程失败: {str(e)}")
+            if raise_errors:
+                raise ValueError(str(e))
+            return default
+        if state is not None:
+            self.state = state
+        return result
+
+
+# 工作进程池
+class Supervisor:
+    """与session.SessionManager接口相同的会话管理器，会话运行在工作进程池中
+
+    publish(serial, event, data) 与SessionManager相同；rule_set修改后在STATE_INTERVAL内同步到所有工作进程。
+    工作进程在第一次开始监控时启动。
+    """
+
+    def __init__(self, publish, rule_set=None, workers=None):
+        self.publish = publish
+        self.rule_set = rule_set
+        self.count = max(1, int(workers or os.cpu_count() or 1))
+        self._workers = []
+        self._sessions = {}
+        self._running = False
+        self._lock = threading.Lock()
+
+    # SessionManager接口
+    def get(self, serial, create=False):
+        with self._lock:
+            session = self._sessions.get(serial)
+            if session is None and create:
+                session = RemoteSession(self, serial)
+                self._sessions[serial] = session
+            return session
+
+    def start(self, serial, interval=1.0, mode='poll', rate=None, capture_raw=False, package=None, power_rate=None):
+        return self.get(serial, create=True).start(interval, mode, rate, capture_raw, package, power_rate)
+
+    def stop(self, serial):
+        session = self.get(serial)
+        return session.stop() if session else False
+
+    def remove(self, serial):
+        with self._lock:
+            session = self._sessions.pop(serial, None)
+        if session:
+            session.remove()
+        return session
+
+    def find(self, session_id):
+        with self._lock:
+            return next((session for session in self._sessions.values()
+                         if session.session_id == session_id), None)
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.stop()
+
+    def list(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.stats() for session in sessions]
+
+    # 工作进程管理
+    def workers(self):
+        """各工作进程的状态和正在监控的会话数"""
+        with self._lock:
+            loads = self._loads()
+            workers = list(self._workers)
+        return [dict(worker.stats(), sessions=loads.get(worker, 0)) for worker in workers]
+
+    def shutdown(self):
+        """停止所有工作进程（各进程先停止自己的会话）"""
+        self._running = False
+        for worker in list(self._workers):
+            worker.stop()
+
+    def place(self, session):
+        """在正在监控的会话最少的工作进程上开始会话，没有可用的工作进程时返回False"""
+        self._ensure_started()
+        with self._lock:
+            loads = self._loads(exclude=session)
+            alive = [worker for worker in self._workers if worker.alive]
+        if not alive:
+            print(f"[{session.serial}] 没有可用的工作进程")
+            return False
+        worker = min(alive, key=lambda item: (loads.get(item, 0), item.index))
+        if session.worker is not None and session.worker is not worker and session.worker.alive:
+            # 换到负载更小的进程前，结束原进程中已停止的会话
+            session._call('remove')
+        session.worker = worker
+        session.wanted = True
+        try:
+            started, state = worker.call(session.serial, 'start', session.params)
+        except (RuntimeError, ValueError) as e:
+            print(f"[{session.serial}] 在工作进程 {worker.index} 开始监控失败: {str(e)}")
+            session.wanted = False
+            return False
+        if state is not None:
+            session.state = state
+        session.wanted = bool(started)
+        return bool(started)
+
+    def _loads(self, exclude=None):
+        loads = {}
+        for session in self._sessions.values():
+            if session is not exclude and session.wanted and session.worker is not None:
+                loads[session.worker] = loads.get(session.worker, 0) + 1
+        return loads
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._workers = [WorkerProcess(index, self._on_message, self._on_exit) for index in range(self.count)]
+        for worker in self._workers:
+            worker.start()
+        self._sync_rules()
+        thread = threading.Thread(target=self._maintain)
+        thread.daemon = True
+        thread.start()
+        print(f"已启动 {self.count} 个采集工作进程")
+
+    def _on_message(self, worker, message):
+        op = message.get('op')
+        serial = message.get('serial')
+        if op == 'sample':
+            data = telemetry.decode_sample(message['row'])
+            data['serial'] = serial
+            self.publish(serial, 'performance_data', data)
+        elif op == 'event':
+            self.publish(serial, message['event'], message['data'])
+        elif op == 'state':
+            with self._lock:
+                sessions = [(self._sessions.get(serial), stats) for serial, stats in message['states'].items()]
+            for session, stats in sessions:
+                if session and session.worker is worker:
+                    session.state = stats
+
+    def _on_exit(self, worker, returncode):
+        """工作进程意外退出：它的会话在其他工作进程上重新开始，进程按退避间隔重启"""
+        if worker.started_at and time.monotonic() - worker.started_at > STABLE_AFTER:
+            worker.delay = RESTART_DELAY
+        worker.restart_at = time.monotonic() + worker.delay
+        worker.delay = min(worker.delay * 2, MAX_RESTART_DELAY)
+        print(f"工作进程 {worker.index} 已退出（返回值 {returncode}），{round(worker.restart_at - time.monotonic(), 1)}"
+              f"秒后重启")
+        if self._running:
+            self._recover()
+
+    def _recover(self):
+        """重新开始所在工作进程已退出的会话（设备离线的会话开始后会自行等待设备恢复）"""
+        with self._lock:
+            orphans = [session for session in self._sessions.values()
+                       if session.wanted and (session.worker is None or not session.worker.alive)]
+        for session in orphans:
+            previous = session.session_id
+            session.state = {}
+            if self.place(session):
+                print(f"[{session.serial}] 会话 {previous} 已在工作进程 {session.worker.index} 上重新开始")
+
+    def _sync_rules(self):
+        if self.rule_set is None:
+            return
+        for worker in list(self._workers):
+            if worker.alive and worker.rules_version != self.rule_set.version:
+                try:
+                    worker.send({'op': 'rules', 'rules': self.rule_set.rules})
+                    worker.rules_version = self.rule_set.version
+                except (RuntimeError, OSError, ValueError) as e:
+                    print(f"同步告警规则到工作进程 {worker.index} 失败: {str(e)}")
+
+    def _maintain(self):
+        while self._running:
+            time.sleep(STATE_INTERVAL)
+            restarted = False
+            for worker in list(self._workers):
+                if not worker.alive and worker.restart_at is not None and time.monotonic() >= worker.restart_at:
+                    worker.restarts += 1
+                    try:
+                        worker.start()
+                        restarted = True
+                    except OSError as e:
+                        print(f"重启工作进程 {worker.index} 失败: {str(e)}")
+                        worker.restart_at = time.monotonic() + worker.delay
+            self._sync_rules()
+            if restarted:
+                self._recover()
+
+
+if __name__ == '__main__':
+    if '--worker' in sys.argv[1:]:
+        run_worker()
+    else:
+        print('supervisor.py 由server.py在设置 MONITOR_WORKERS 时启动，不直接运行')
+        sys.exit(2)
@@ -0,0 +1,233 @@
+import math
+import time
+import struct
+import threading
+from collections import deque
+
+import metrics
+
+# 线路格式版本，字段顺序变化时递增
+WIRE_VERSION = 3
+# 标量字段的固定顺序，每个样本编码为按此顺序排列的数组，之后是各核心频率、负载数组
+# quality为各指标质量标记编码成的整数（每个指标2位，见metrics.encode_quality）
+FIELDS = ('timestamp', 'fps', 'jank', 'big_jank', 'frame_time_p50', 'frame_time_p90', 'frame_time_p99',
+          'gpu_freq', 'gpu_load', 'current', 'power', 'app_cpu', 'app_rss', 'quality')
+# 每个客户端最多缓存的样本数，落后时丢弃最旧的样本，只保留最新的数据
+MAX_QUEUE = 32
+# 单帧最多合并的样本数
+MAX_BATCH = 16
+# 同一客户端两帧之间的最小间隔（秒），高频采样时多个样本合并为一帧发送
+BATCH_INTERVAL = 0.2
+# 已发送但尚未确认的帧数上限，达到后暂停发送，等待客户端确认
+MAX_INFLIGHT = 2
+# 客户端超过该时间（秒）未确认时视为丢失，恢复发送
+ACK_TIMEOUT = 5.0
+
+# 二进制帧：头部为 版本(B) 样本数(H) 核心数(H)，
+# 每个样本为 timestamp(d) + 其余标量(f) + 核心频率(f)*核心数 + 核心负载(f)*核心数，缺失值为NaN
+_HEADER = struct.Struct('<BHH')
+
+
+def _core_values(values, cores):
+    values = values or {}
+    return [values.get(f'core_{core}') for core in range(cores)]
+
+
+def _core_count(data):
+    cores = 0
+    for metric in ('cpu_freq', 'cpu_load'):
+        for key in (data.get(metric) or {}):
+            core = key.replace('core_', '')
+            if core.isdigit():
+                cores = max(cores, int(core) + 1)
+    return cores
+
+
+def encode_sample(data):
+    """把样本编码为定长数组: [标量字段..., [各核心频率], [各核心负载]]"""
+    frame_time = data.get('frame_time') or {}
+    cores = _core_count(data)
+    quality = data.get('quality')
+    app = data.get('app') or {}
+    return [
+        data.get('timestamp'), data.get('fps'), data.get('jank'), data.get('big_jank'),
+        frame_time.get('p50'), frame_time.get('p90'), frame_time.get('p99'),
+        data.get('gpu_freq'), data.get('gpu_load'), data.get('current'), data.get('power'),
+        app.get('cpu'), app.get('rss'),
+        metrics.encode_quality(quality) if quality else None,
+        _core_values(data.get('cpu_freq'), cores),
+        _core_values(data.get('cpu_load'), cores)
+    ]
+
+
+def decode_sample(row):
+    """encode_sample的逆操作（供非网页客户端使用）"""
+    data = dict(zip(FIELDS, row[:len(FIELDS)]))
+    data['frame_time'] = {key: data.pop(f'frame_time_{key}') for key in ('p50', 'p90', 'p99')}
+    app = {key: data.pop(f'app_{key}') for key in ('cpu', 'rss')}
+    data['app'] = app if app['cpu'] is not None or app['rss'] is not None else None
+    quality = data.pop('quality')
+    if quality is not None:
+        data['quality'] = metrics.decode_quality(quality)
+    freqs, loads = row[len(FIELDS)], row[len(FIELDS) + 1]
+    data['cpu_freq'] = {f'core_{i}': value for i, value in enumerate(freqs) if value is not None}
+    data['cpu_load'] = {f'core_{i}': value for i, value in enumerate(loads) if value is not None}
+    return data
+
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+
+def pack_rows(rows):
+    """把一批已编码的样本打包为二进制帧"""
+    cores = max((len(row[-1]) for row in rows), default=0)
+    sample = struct.Struct(f'<d{len(FIELDS) - 1 + cores * 2}f')
+    parts = [_HEADER.pack(WIRE_VERSION, len(rows), cores)]
+    for row in rows:
+        freqs = list(row[-2]) + [None] * (cores - len(row[-2]))
+        loads = list(row[-1]) + [None] * (cores - len(row[-1]))
+        parts.append(sample.pack(*[_float(value) for value in row[:len(FIELDS)] + freqs + loads]))
+    return b''.join(parts)
+
+
+def schema():
+    """客户端解码所需的格式说明，在订阅时发送一次"""
+    return {'version': WIRE_VERSION, 'fields': list(FIELDS), 'arrays': ['cpu_freq', 'cpu_load'],
+            'quality': {'metrics': list(metrics.QUALITY_METRICS), 'flags': list(metrics.QUALITY_FLAGS)}}
+
+
+class _Client:
+    """一个网页客户端的发送队列"""
+
+    def __init__(self, sid, compact, binary):
+        self.sid = sid
+        self.compact = compact
+        self.binary = binary
+        self.serials = set()
+        self.queue = deque(maxlen=MAX_QUEUE)
+        self.inflight = 0
+        self.last_sent = 0
+        self.deferred = False
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+
+# 遥测推送
+class TelemetryHub:
+    """按客户端分别排队推送性能数据
+
+    每个客户端有独立的有界队列和在途帧计数：客户端确认（ack）之前最多有MAX_INFLIGHT帧在途，
+    其间到达的样本在队列中累积，下次发送时合并为一帧；落后太多时队列丢弃最旧的样本。
+    一个慢的网页只会丢失自己的中间样本，不会在服务器端堆积或拖慢其他网页。
+    emit(event, data, sid, callback) 由调用方提供（Web服务中为Socket.IO）。
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, sid, serial, compact=False, binary=False):
+        """客户端订阅设备数据，compact为False时按旧格式逐条推送字典"""
+        with self._lock:
+            previous = self._clients.get(sid)
+            client = previous
+            if client is None or client.compact != compact or client.binary != binary:
+                client = _Client(sid, compact, binary)
+                if previous:
+                    client.serials = previous.serials
+                self._clients[sid] = client
+            client.serials.add(serial)
+        if compact:
+            self.emit('telemetry_schema', schema(), sid, None)
+
+    def unsubscribe(self, sid, serial=None):
+        """取消订阅，serial为None时移除客户端（断开连接）"""
+        with self._lock:
+            if serial is None:
+                self._clients.pop(sid, None)
+            elif sid in self._clients:
+                self._clients[sid].serials.discard(serial)
+
+    def publish(self, serial, data):
+        """把一个样本放入所有订阅了该设备的客户端队列，并尝试发送"""
+        with self._lock:
+            clients = [client for client in self._clients.values() if serial in client.serials]
+        row = None
+        for client in clients:
+            if client.compact and row is None:
+                row = encode_sample(data)
+            with client.lock:
+                if len(client.queue) == client.queue.maxlen:
+                    client.dropped += 1
+                    metrics.inc('telemetry_dropped_total')
+                client.queue.append((serial, row if client.compact else data, time.monotonic()))
+            self._flush(client)
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients.values())
+        return [{
+            'sid': client.sid,
+            'serials': sorted(client.serials),
+            'compact': client.compact,
+            'binary': client.binary,
+            'queued': len(client.queue),
+            'inflight': client.inflight,
+            'sent': client.sent,
+            'dropped': client.dropped
+        } for client in clients]
+
+    def _flush(self, client):
+        if not client.compact:
+            # 旧格式客户端不回复确认，逐条推送最新样本
+            with client.lock:
+                frames = list(client.queue)
+                client.queue.clear()
+                client.sent += len(frames)
+            for _, data, _ in frames:
+                self.emit('performance_data', data, client.sid, None)
+            return
+
+        with client.lock:
+            if client.inflight >= MAX_INFLIGHT:
+                if time.monotonic() - client.last_sent < ACK_TIMEOUT:
+                    return
+                client.inflight = 0  # 确认丢失（如旧版网页不回复ack）
+            if not client.queue:
+                return
+            wait = BATCH_INTERVAL - (time.monotonic() - client.last_sent)
+            if wait > 0 and len(client.queue) < MAX_BATCH:
+                # 距上一帧太近，稍后把期间到达的样本一起发送
+                if not client.deferred:
+                    client.deferred = True
+                    timer = threading.Timer(wait, self._deferred_flush, args=(client,))
+                    timer.daemon = True
+                    timer.start()
+                return
+            # 同一设备的样本合并为一帧
+            serial, _, queued_at = client.queue[0]
+            metrics.observe('telemetry_queue_lag_seconds', time.monotonic() - queued_at)
+            batch = []
+            while client.queue and len(batch) < MAX_BATCH and client.queue[0][0] == serial:
+                batch.append(client.queue.popleft()[1])
+            client.seq += 1
+            frame = {'v': WIRE_VERSION, 's': serial, 'q': client.seq,
+                     'd': pack_rows(batch) if client.binary else batch}
+            client.inflight += 1
+            client.last_sent = time.monotonic()
+            client.sent += 1
+        self.emit('telemetry', frame, client.sid, lambda *args: self._ack(client))
+
+    def _deferred_flush(self, client):
+        with client.lock:
+            client.deferred = False
+        self._flush(client)
+
+    def _ack(self, client):
+        with client.lock:
+            client.inflight = max(0, client.inflight - 1)
+        self._flush(client)
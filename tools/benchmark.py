@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""采集链路压测：在模拟adb（或真机）上测量各读取方法的耗时、每次推送创建的adb进程数、
+实际推送频率与设定周期的比例，以及从设备读取到数据推送给网页的端到端延迟。
+
+结果与基线阈值（benchmark_baseline.json）比较，超出阈值时以返回码1退出，
+可在普通Linux机器上发现监控循环吞吐量的退化。
+
+模拟adb的dumpsys/getprop/ps每次都启动一个Python解释器，耗时随本机负载变化，因此读取方法的耗时阈值
+按模拟命令的实测耗时（emulated_command_ms）相对基线的倍数放宽，配置了latency_ms/jitter_ms时再加上
+每次调用的命令数乘以每条命令的最大注入延迟；耗时较长的方法按基线中的min_iterations多调用几次。
+每次调用的命令数和进程创建数不受负载影响，按基线严格比较：
+
+    python tools/benchmark.py                     # 默认使用tools/fake_adb.py
+    python tools/benchmark.py --mode agent --interval 0.1
+    ADB_PATH=adb python tools/benchmark.py --serial <序列号> --no-check   # 真机
+"""
+import os
+import sys
+import re
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TOOLS_DIR)
+DEFAULT_BASELINE = os.path.join(TOOLS_DIR, 'benchmark_baseline.json')
+# 监控开始后的预热时间（秒），期间的进程创建（启动shell通道、探测）不计入稳态
+WARMUP = 2.0
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def summarize(values, scale=1000.0):
+    """耗时列表（秒）-> 毫秒统计"""
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * scale, 2) if values else None,
+        'p95_ms': round(percentile(values, 95) * scale, 2) if values else None,
+        'max_ms': round(max(values) * scale, 2) if values else None
+    }
+
+
+class SpawnCounter:
+    """统计模拟adb记录的进程创建次数（真机上不可用，返回None）"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def count(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return sum(1 for _ in f)
+
+    def since(self, start):
+        current = self.count()
+        return None if current is None or start is None else current - start
+
+
+def setup_environment(args):
+    """未指定ADB_PATH时使用模拟adb，并开启进程创建日志"""
+    if not os.environ.get('ADB_PATH'):
+        os.environ['ADB_PATH'] = os.path.join(TOOLS_DIR, 'fake_adb.py')
+    spawn_log = None
+    if os.environ['ADB_PATH'].endswith('fake_adb.py'):
+        spawn_log = os.environ.get('FAKE_ADB_SPAWN_LOG') or os.path.join(
+            tempfile.gettempdir(), f'fake_adb_spawn_{os.getpid()}.log')
+        os.environ['FAKE_ADB_SPAWN_LOG'] = spawn_log
+        if os.path.exists(spawn_log):
+            os.remove(spawn_log)
+    if args.config:
+        os.environ['FAKE_ADB_CONFIG'] = os.path.abspath(args.config)
+    return SpawnCounter(spawn_log)
+
+
+def injected_delay_ms(command=None):
+    """模拟adb配置中注入的命令延迟 (latency_ms, jitter_ms)，真机返回 (0, 0)
+
+    指定命令时按fake_adb的规则匹配（匹配到的规则覆盖全局设置），否则返回所有规则中最大的一组。
+    """
+    path = os.environ.get('FAKE_ADB_CONFIG')
+    if not os.environ.get('ADB_PATH', '').endswith('fake_adb.py') or not path or not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        config = json.load(f)
+    rules = config.get('faults', [])
+    if command is not None:
+        rules = [rule for rule in rules if re.search(rule.get('match', ''), command)]
+        for rule in rules:
+            config = {**config, **rule}
+        rules = []
+    candidates = [config] + [{**config, **rule} for rule in rules]
+    return max(((rule.get('latency_ms', 0), rule.get('jitter_ms', 0)) for rule in candidates), key=sum)
+
+
+def emulated_command_ms(serial, calls=20):
+    """模拟adb执行一条模拟命令（getprop）的耗时中位数（毫秒，不含注入的延迟），真机返回None"""
+    from adb_tools import ADBTools
+    if not os.environ.get('ADB_PATH', '').endswith('fake_adb.py'):
+        return None
+    command = 'getprop ro.product.model'
+    durations = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        ADBTools.shell(command, serial=serial)
+        durations.append(time.perf_counter() - started)
+    latency, jitter = injected_delay_ms(command)
+    return round(max(0.0, percentile(durations, 50) * 1000 - latency - jitter / 2), 2)
+
+
+def command_count():
+    """本进程通过常驻shell执行过的命令数"""
+    import metrics
+    return sum(item['count'] for item in metrics.REGISTRY.snapshot().get('adb_command_duration_seconds', []))
+
+
+def getter_cases(serial):
+    from adb_tools import ADBTools
+    return [
+        ('ping', lambda: ADBTools.ping(serial)),
+        ('get_snapshot', lambda: ADBTools.get_snapshot(serial)),
+        ('get_snapshot_cpu', lambda: ADBTools.get_snapshot(serial, groups=('cpu',), channel='cpu')),
+        ('get_snapshot_gpu', lambda: ADBTools.get_snapshot(serial, groups=('gpu',), channel='gpu')),
+        ('get_snapshot_battery', lambda: ADBTools.get_snapshot(serial, groups=('battery',), channel='battery')),
+        ('get_focused_package', lambda: ADBTools.get_focused_package(serial)),
+        ('get_app_sample', lambda: ADBTools.get_app_sample('com.example.game', serial, channel='app')),
+        ('get_fps', lambda: ADBTools.get_fps(serial)),
+        ('get_device_info', lambda: ADBTools.get_device_info(serial)),
+        ('load_profile', lambda: ADBTools.load_profile(serial)),
+        ('get_cpu_freq', lambda: ADBTools.get_cpu_freq(serial)),
+        ('get_cpu_load', lambda: ADBTools.get_cpu_load(serial)),
+        ('get_gpu_freq', lambda: ADBTools.get_gpu_freq(serial)),
+        ('get_gpu_load', lambda: ADBTools.get_gpu_load(serial)),
+        ('get_battery_info', lambda: ADBTools.get_battery_info(serial)),
+        # 设备上连续读取0.25秒（MIN_BATCH），耗时主要是读数之间的sleep
+        ('get_power_samples', lambda: ADBTools.get_power_samples(serial, 20, 0.25, channel='power')),
+        ('probe_device', lambda: ADBTools.probe_device(serial)),
+    ]
+
+
+def bench_getters(serial, iterations, spawns, baseline=None):
+    """逐个方法重复调用，记录耗时、每次调用执行的命令数和创建的adb进程数"""
+    results = {}
+    limits = (baseline or {}).get('getters', {})
+    for name, call in getter_cases(serial):
+        call()  # 预热：建立shell通道、探测数据源
+        count = max(iterations, limits.get(name, {}).get('min_iterations', 0))
+        durations = []
+        errors = 0
+        start_spawns = spawns.count()
+        start_commands = command_count()
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                errors += 1
+            durations.append(time.perf_counter() - started)
+        result = summarize(durations)
+        result['errors'] = errors
+        result['commands_per_call'] = round((command_count() - start_commands) / count, 3)
+        spawned = spawns.since(start_spawns)
+        result['spawns_per_call'] = round(spawned / count, 3) if spawned is not None else None
+        results[name] = result
+        print(f"  {name:<22} p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+              f"commands/call {result['commands_per_call']:<5}  spawns/call {result['spawns_per_call']}")
+    return results
+
+
+def bench_monitor(serial, interval, duration, mode, rate, spawns):
+    """运行一个完整的监控会话（含遥测推送），测量推送频率、进程创建和端到端延迟"""
+    from adb_tools import ADBTools
+    from session import DeviceSession
+    from telemetry import TelemetryHub, FIELDS
+
+    # 从没有任何shell通道的状态开始，启动阶段的进程创建也计入结果
+    ADBTools.close_shells(serial)
+
+    lock = threading.Lock()
+    publish_times = []
+    emit_latencies = []
+    sampled = {}
+
+    def emit(event, data, sid, callback):
+        now = time.time()
+        if event == 'telemetry':
+            with lock:
+                for row in data['d']:
+                    # 端到端延迟：从设备上读取CPU数据到该样本随遥测帧发出
+                    read_at = sampled.pop(row[FIELDS.index('timestamp')], None)
+                    if read_at:
+                        emit_latencies.append(now - read_at)
+        if callback:
+            callback()  # 模拟网页立即确认
+
+    hub = TelemetryHub(emit)
+    hub.subscribe('benchmark', serial, compact=True)
+
+    def publish(serial, event, data):
+        with lock:
+            publish_times.append(time.monotonic())
+            sampled[data['timestamp']] = (data.get('sampled_at') or {}).get('cpu')
+        hub.publish(serial, data)
+
+    directory = tempfile.mkdtemp(prefix='benchmark_recordings_')
+    session = DeviceSession(serial, publish, directory=directory)
+    try:
+        started = time.monotonic()
+        start_spawns = spawns.count()
+        session.start(interval, mode, rate)
+        time.sleep(WARMUP)
+        with lock:
+            warm_samples = len(publish_times)
+        warm_spawns = spawns.count()
+        time.sleep(duration)
+        with lock:
+            steady_samples = len(publish_times) - warm_samples
+            times = [t for t in publish_times if t >= started + WARMUP]
+        steady_spawns = spawns.since(warm_spawns)
+        total_spawns = spawns.since(start_spawns)
+        stats = session.stats()
+    finally:
+        session.stop()
+        if session._thread:
+            session._thread.join(5)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    achieved = steady_samples / duration
+    result = {
+        'mode': stats['mode'],
+        'interval': interval,
+        'samples': steady_samples,
+        'requested_rate': round(1.0 / interval, 2),
+        'achieved_rate': round(achieved, 2),
+        'rate_ratio': round(achieved * interval, 3),
+        'publish_skipped': stats['publish_skipped'],
+        'interval_jitter': summarize([abs(gap - interval) for gap in gaps]),
+        'emit_latency': summarize(emit_latencies),
+        'startup_spawns': total_spawns - steady_spawns if total_spawns is not None else None,
+        'spawns_per_tick': round(steady_spawns / steady_samples, 3)
+        if steady_spawns is not None and steady_samples else None,
+        'tasks': stats['tasks']
+    }
+    print(f"  模式 {result['mode']}  设定 {result['requested_rate']}/s  实际 {result['achieved_rate']}/s  "
+          f"(比例 {result['rate_ratio']})  跳过 {result['publish_skipped']}")
+    print(f"  端到端延迟 p50 {result['emit_latency']['p50_ms']} ms  p95 {result['emit_latency']['p95_ms']} ms  "
+          f"推送抖动 p95 {result['interval_jitter']['p95_ms']} ms")
+    print(f"  启动进程数 {result['startup_spawns']}  稳态每次推送进程数 {result['spawns_per_tick']}")
+    return result
+
+
+def load_scale(results, baseline):
+    """模拟命令实测耗时相对基线的倍数（不小于1），真机或基线未记录时为1"""
+    measured = results.get('emulated_command_ms')
+    reference = baseline.get('fake_adb', {}).get('emulated_command_ms')
+    if not measured or not reference:
+        return 1.0
+    return max(1.0, measured / reference)
+
+
+def check(results, baseline):
+    """与基线阈值比较，返回超出阈值的项目说明"""
+    failures = []
+    delay = results.get('command_delay_ms', 0)
+    scale = load_scale(results, baseline)
+    for name, limits in baseline.get('getters', {}).items():
+        result = results['getters'].get(name)
+        if result is None:
+            continue
+        for key, limit in limits.items():
+            if key == 'min_iterations':
+                continue
+            if key == 'p95_ms':
+                # 按本机负载放宽，注入的延迟按命令数累加到阈值上
+                limit = round(limit * scale + result['commands_per_call'] * delay, 2)
+            value = result.get(key)
+            if value is not None and value > limit:
+                failures.append(f'{name}.{key} = {value} > {limit}')
+
+    monitor = results.get('monitor')
+    limits = baseline.get('monitor', {})
+    if monitor:
+        checks = [
+            ('rate_ratio', monitor['rate_ratio'], 'min_rate_ratio', lambda v, l: v >= l),
+            ('spawns_per_tick', monitor['spawns_per_tick'], 'max_spawns_per_tick', lambda v, l: v <= l),
+            ('publish_skipped', monitor['publish_skipped'], 'max_publish_skipped', lambda v, l: v <= l),
+            ('emit_latency.p95_ms', monitor['emit_latency']['p95_ms'], 'max_emit_latency_p95_ms',
+             lambda v, l: v <= l),
+            ('interval_jitter.p95_ms', monitor['interval_jitter']['p95_ms'], 'max_interval_jitter_p95_ms',
+             lambda v, l: v <= l),
+        ]
+        for name, value, key, ok in checks:
+            if key in limits and value is not None and not ok(value, limits[key]):
+                failures.append(f'monitor.{name} = {value}，基线 {key} = {limits[key]}')
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='采集链路压测')
+    parser.add_argument('--serial', help='设备序列号，默认使用第一台在线设备')
+    parser.add_argument('--config', help='模拟adb的配置文件（延迟、故障注入等）')
+    parser.add_argument('--iterations', type=int, default=20, help='每个读取方法的调用次数（不少于基线中的min_iterations）')
+    parser.add_argument('--interval', type=float, default=0.25, help='监控推送周期（秒）')
+    parser.add_argument('--duration', type=float, default=10.0, help='监控压测时长（秒，不含预热）')
+    parser.add_argument('--mode', choices=('poll', 'agent'), default='poll', help='采集方式')
+    parser.add_argument('--rate', type=int, help='agent模式的采样频率')
+    parser.add_argument('--skip-getters', action='store_true', help='只测监控循环')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线阈值文件')
+    parser.add_argument('--no-check', action='store_true', help='只输出结果，不与基线比较')
+    parser.add_argument('--output', help='把结果以JSON写入文件')
+    args = parser.parse_args(argv)
+
+    spawns = setup_environment(args)
+    sys.path.insert(0, ROOT_DIR)
+    from adb_tools import ADBTools
+
+    serial = args.serial
+    if not serial:
+        devices = ADBTools.get_devices()
+        if not devices:
+            print('没有可用的设备')
+            return 2
+        serial = devices[0]
+    print(f"adb: {ADBTools.get_adb_path()}  设备: {serial}")
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    results = {'serial': serial, 'command_delay_ms': sum(injected_delay_ms()), 'getters': {}, 'monitor': None}
+    try:
+        if not args.skip_getters:
+            print('读取方法耗时:')
+            ADBTools.ping(serial)  # 建立shell通道，不计入校准
+            before = emulated_command_ms(serial)
+            results['getters'] = bench_getters(serial, args.iterations, spawns, baseline)
+            after = emulated_command_ms(serial)
+            if before is not None:
+                # 取压测前后较慢的一次，覆盖压测期间负载的变化
+                results['emulated_command_ms'] = max(before, after)
+                print(f"  模拟命令耗时 p50 {before} / {after} ms  阈值倍数 {round(load_scale(results, baseline), 2)}")
+        print('监控循环:')
+        results['monitor'] = bench_monitor(serial, args.interval, args.duration, args.mode, args.rate, spawns)
+    finally:
+        ADBTools.close_shells()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.no_check:
+        return 0
+    failures = check(results, baseline)
+    if failures:
+        print('超出基线阈值:')
+        for failure in failures:
+            print(f'  {failure}')
+        return 1
+    print('全部指标在基线阈值内')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""模拟的adb可执行文件，用于在没有真机的Linux环境中测试和压测采集链路
+
+使用方法：设置环境变量 ADB_PATH 指向本文件（需有执行权限），ADBTools.get_adb_path会优先使用它。
+
+每台模拟设备在临时目录下有一个文件系统根目录，后台线程持续刷新 /proc/stat、cpufreq、
+kgsl 和 power_supply 节点；命令中的 /proc、/sys、/data 路径被改写到该目录后交给本机sh执行，
+dumpsys / getprop / ps 由本文件模拟输出（window、battery、SurfaceFlinger --latency、gfxinfo framestats、应用进程）。
+
+环境变量：
+  FAKE_ADB_CONFIG     JSON配置文件路径，修改后对已运行的shell通道也立即生效
+  FAKE_ADB_SPAWN_LOG  每启动一个adb进程追加一行命令参数，用于统计进程创建次数
+
+配置项（括号内为默认值）：
+  devices (["FAKE0001"])  设备序列号列表；states可指定 {序列号: 状态} 模拟离线/未授权
+  cores (8)               CPU核心数
+  kgsl (true)             是否提供Adreno GPU节点
+  surfaceflinger (true)   是否允许 dumpsys SurfaceFlinger --latency，关闭时走gfxinfo
+  fps (60)                模拟的帧率；jank_every (50) 每隔多少帧丢一帧，0为不丢帧
+  app (true)              前台应用的进程是否在运行（ps中是否列出），关闭时应用进程采样找不到pid
+  seed                    随机数种子，便于复现故障注入
+  latency_ms / jitter_ms  每条命令的固定延迟和随机抖动（毫秒）
+  fail_rate               命令返回非0的概率
+  hang_rate / hang_ms     命令卡住的概率和时长（默认10000毫秒），用于触发超时
+  drop_rate               adb进程直接退出的概率（模拟USB断开）
+  faults                  按命令匹配的规则列表，如 [{"match": "kgsl", "fail_rate": 0.5}]，
+                          匹配到的规则覆盖上面的全局设置
+  wireless ({})           可无线连接的地址，如 {"10.0.0.2:5555": {"reachable": true, "connect_ms": 100}}；
+                          adb connect 后该地址作为设备出现，reachable改为false时设备离线、已打开的shell断开，
+                          已连接的地址保存在配置文件旁的 .wireless 文件中（无配置文件时在临时目录）
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import tempfile
+import threading
+import subprocess
+
+DEFAULT_CONFIG = {
+    'devices': ['FAKE0001'],
+    'states': None,
+    'cores': 8,
+    'kgsl': True,
+    'surfaceflinger': True,
+    'fps': 60,
+    'jank_every': 50,
+    'app': True,
+    'seed': None,
+    'latency_ms': 0,
+    'jitter_ms': 0,
+    'fail_rate': 0,
+    'hang_rate': 0,
+    'hang_ms': 10000,
+    'drop_rate': 0,
+    'faults': [],
+    'wireless': {}
+}
+FAULT_KEYS = ('latency_ms', 'jitter_ms', 'fail_rate', 'hang_rate', 'hang_ms', 'drop_rate')
+
+PROPS = {
+    'ro.product.model': 'Pixel Fake',
+    'ro.product.brand': 'google',
+    'ro.product.manufacturer': 'Google',
+    'ro.build.version.release': '13',
+    'ro.build.version.sdk': '33',
+    'ro.product.device': 'fake',
+    'ro.product.cpu.abi': 'arm64-v8a',
+    'ro.hardware': 'qcom',
+    'ro.board.platform': 'kalama',
+    'ro.soc.model': 'SM8550'
+}
+PACKAGE = 'com.example.game'
+ACTIVITY = f'{PACKAGE}/{PACKAGE}.MainActivity'
+# 模拟的应用进程：pid -> (进程名, [(线程名, 平均占用一个核心的比例), ...])，线程号从pid开始递增
+APP_PROCESSES = {
+    4242: (PACKAGE, [('UnityMain', 0.55), ('RenderThread', 0.3), ('Job.worker 1', 0.1),
+                     ('HeapTaskDaemon', 0.05), ('Binder:4242_1', 0.02)]),
+    4290: (f'{PACKAGE}:remote', [(f'{PACKAGE}:remote'[:15], 0.03), ('Binder:4290_1', 0.01)]),
+}
+# SurfaceFlinger --latency 只保留最近127帧
+LATENCY_FRAMES = 127
+VOLTAGE_UV = 3900000
+
+# 命令中需要改写到模拟根目录的路径
+_PATH_RE = re.compile(r'(?<![\w.\-])/(proc|sys|data)(?=/|\b)')
+
+
+class Config:
+    """配置文件按修改时间重新加载，长时间运行的shell通道也能在压测中途切换故障设置"""
+
+    def __init__(self):
+        self.path = os.environ.get('FAKE_ADB_CONFIG')
+        self.values = dict(DEFAULT_CONFIG)
+        self._mtime = None
+        self.reload()
+        self.random = random.Random(self.values['seed'])
+
+    def reload(self):
+        if not self.path:
+            return self.values
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    values = dict(DEFAULT_CONFIG)
+                    values.update(json.load(f))
+                self.values = values
+                self._mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f'fake adb: 读取配置失败: {e}', file=sys.stderr)
+        return self.values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def faults_for(self, command):
+        """返回对该命令生效的故障设置"""
+        values = self.reload()
+        faults = {key: values[key] for key in FAULT_KEYS}
+        for rule in values['faults']:
+            if re.search(rule.get('match', ''), command):
+                faults.update({key: rule[key] for key in FAULT_KEYS if key in rule})
+        return faults
+
+
+def log_spawn(argv):
+    path = os.environ.get('FAKE_ADB_SPAWN_LOG')
+    if path:
+        with open(path, 'a') as f:
+            f.write(f'{time.time():.3f} {" ".join(argv)}\n')
+
+
+def device_root(serial):
+    return os.path.join(tempfile.gettempdir(), 'fake_adb_' + re.sub(r'\W', '_', serial))
+
+
+def rewrite_paths(text, root):
+    return _PATH_RE.sub(lambda match: root + '/' + match.group(1), text)
+
+
+def write_file(path, text):
+    # 先写临时文件再改名，读取方不会看到写了一半的内容
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    with open(temp, 'w') as f:
+        f.write(text)
+    os.replace(temp, path)
+
+
+# 模拟设备
+class FakeDevice:
+    """一台模拟设备的文件系统节点，数值随时间平滑变化"""
+
+    def __init__(self, serial, config):
+        self.serial = serial
+        self.config = config
+        self.root = device_root(serial)
+
+    def setup(self):
+        cores = self.config['cores']
+        write_file(self.root + '/sys/devices/system/cpu/possible', f'0-{cores - 1}\n')
+        # 前一半核心为小核簇，其余为大核簇
+        little = max(1, cores // 2)
+        for core in range(cores):
+            cluster = range(0, little) if core < little else range(little, cores)
+            cpufreq = f'{self.root}/sys/devices/system/cpu/cpu{core}/cpufreq'
+            write_file(f'{cpufreq}/cpuinfo_min_freq', '300000\n')
+            write_file(f'{cpufreq}/cpuinfo_max_freq', f'{2000000 if core < little else 2800000}\n')
+            write_file(f'{cpufreq}/related_cpus', ' '.join(str(c) for c in cluster) + '\n')
+        write_file(self.root + '/proc/sys/kernel/random/boot_id', f'fake-boot-{self.serial}\n')
+        os.makedirs(self.root + '/data/local/tmp', exist_ok=True)
+        # dumpsys / getprop / ps 由本文件模拟，通过PATH优先于系统命令
+        for name in ('dumpsys', 'getprop', 'ps'):
+            path = f'{self.root}/bin/{name}'
+            write_file(path, f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" '
+                             f'--tool {name} "$@"\n')
+            os.chmod(path, 0o755)
+
+    def refresh(self):
+        now = time.time()
+        cores = self.config['cores']
+        lines = []
+        total_busy = total_idle = 0
+        for core in range(cores):
+            # 每个核心的负载在10%~70%之间按不同周期波动，jiffies单调递增
+            weight = 0.3 + 0.1 * core
+            busy = int((0.4 * now + 0.3 / weight * (1 - math.cos(weight * now))) * 100)
+            idle = int(now * 100) - busy
+            total_busy += busy
+            total_idle += idle
+            lines.append(f'cpu{core} {busy} 0 0 {idle} 0 0 0 0 0 0')
+            write_file(f'{self.root}/sys/devices/system/cpu/cpu{core}/cpufreq/scaling_cur_freq',
+                       f'{1000000 + int(500000 * (1 + math.sin(now + core)))}\n')
+        write_file(self.root + '/proc/stat',
+                   f'cpu  {total_busy} 0 0 {total_idle} 0 0 0 0 0 0\n' + '\n'.join(lines) + '\nintr 0\n')
+        if self.config['kgsl']:
+            write_file(self.root + '/sys/class/kgsl/kgsl-3d0/gpuclk', f'{400000000 + int(1e8 * math.sin(now))}\n')
+            write_file(self.root + '/sys/class/kgsl/kgsl-3d0/gpu_busy_percentage',
+                       f'{int(40 + 20 * math.sin(now))} %\n')
+        self.refresh_processes()
+        # 放电电流为负（µA），每5秒有一个200毫秒的尖峰，1Hz的采样通常会错过
+        current = -int(350000 + 100000 * math.sin(3 * now) + (900000 if now % 5 < 0.2 else 0))
+        battery = self.root + '/sys/class/power_supply/battery/'
+        write_file(battery + 'current_now', f'{current}\n')
+        write_file(battery + 'voltage_now', f'{VOLTAGE_UV}\n')
+        write_file(battery + 'uevent',
+                   'POWER_SUPPLY_NAME=battery\nPOWER_SUPPLY_TYPE=Battery\nPOWER_SUPPLY_STATUS=Discharging\n'
+                   f'POWER_SUPPLY_CURRENT_NOW={current}\nPOWER_SUPPLY_VOLTAGE_NOW={VOLTAGE_UV}\n'
+                   'POWER_SUPPLY_CAPACITY=80\n')
+
+    def refresh_processes(self):
+        """/proc/uptime和模拟应用的 /proc/<pid>/stat、statm、task/<tid>/stat，累计时间单调递增"""
+        uptime = time.monotonic()
+        write_file(self.root + '/proc/uptime', f'{uptime:.2f} {uptime * 4:.2f}\n')
+        for pid, (name, threads) in APP_PROCESSES.items():
+            total = 0
+            for index, (thread_name, busy) in enumerate(threads):
+                # 占用在平均值的0.5~1.5倍之间波动
+                ticks = int(100 * busy * (uptime + 0.5 * (1 - math.cos(uptime + index))))
+                total += ticks
+                write_file(f'{self.root}/proc/{pid}/task/{pid + index}/stat',
+                           stat_line(pid + index, thread_name, ticks, len(threads)))
+            write_file(f'{self.root}/proc/{pid}/stat', stat_line(pid, name[:15], total, len(threads)))
+            resident = int((300 + 20 * math.sin(uptime / 10)) * 1048576 / 4096) if pid == 4242 else 12000
+            write_file(f'{self.root}/proc/{pid}/statm', f'{resident * 4} {resident} 20000 10 0 {resident} 0\n')
+
+    def start_refresh(self, interval=0.05):
+        self.setup()
+        self.refresh()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=loop)
+        thread.daemon = True
+        thread.start()
+
+    def env(self):
+        return dict(os.environ, PATH=f'{self.root}/bin:' + os.environ.get('PATH', ''))
+
+
+def stat_line(pid, name, ticks, threads):
+    """/proc/<pid>/stat格式的一行，utime/stime按2:1分配"""
+    utime = ticks * 2 // 3
+    return (f'{pid} ({name}) S 1 {pid} 0 0 -1 4194624 1000 0 0 0 {utime} {ticks - utime} 0 0 '
+            f'10 -10 {threads} 0 1000 2000000000 76800 18446744073709551615\n')
+
+
+def apply_faults(config, command):
+    """按配置注入延迟和故障，返回替换后的命令（None表示保持原样）"""
+    faults = config.faults_for(command)
+    rng = config.random
+    delay = faults['latency_ms'] + rng.uniform(0, faults['jitter_ms'])
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+    if faults['drop_rate'] and rng.random() < faults['drop_rate']:
+        sys.stdout.flush()
+        os._exit(255)
+    if faults['hang_rate'] and rng.random() < faults['hang_rate']:
+        time.sleep(faults['hang_ms'] / 1000.0)
+    if faults['fail_rate'] and rng.random() < faults['fail_rate']:
+        return 'echo "fake adb: injected failure" >&2; (exit 1)'
+    return None
+
+
+# dumpsys / getprop 模拟
+def frame_timestamps(fps, jank_every, count=LATENCY_FRAMES):
+    """最近count帧的显示时间戳（纳秒，CLOCK_MONOTONIC），每jank_every帧丢一帧"""
+    step = int(1e9 / fps)
+    now = int(time.monotonic() * 1e9)
+    last = now - now % step
+    timestamps = []
+    for index in range(count, 0, -1):
+        timestamp = last - index * step
+        if jank_every and (timestamp // step) % jank_every == 0:
+            continue
+        timestamps.append(timestamp)
+    return step, timestamps
+
+
+def dumpsys(config, args):
+    service = args[0] if args else ''
+    if service == 'window':
+        print(f'  mCurrentFocus=Window{{1f2e3d u0 {ACTIVITY}}}')
+        print(f'  mFocusedApp=ActivityRecord{{5a6b7c u0 {ACTIVITY} t42}}')
+    elif service == 'battery':
+        current = -int(350000 + 100000 * math.sin(3 * time.time()))
+        print('Current Battery Service state:\n  AC powered: false\n  USB powered: true\n'
+              f'  status: 3\n  health: 2\n  present: true\n  level: 80\n  scale: 100\n'
+              f'  voltage: {VOLTAGE_UV // 1000}\n  current now: {current}\n  temperature: 300\n'
+              '  technology: Li-ion')
+    elif service == 'SurfaceFlinger':
+        if not config['surfaceflinger']:
+            print('Permission Denial: can\'t access SurfaceFlinger')
+            return 0
+        if '--list' in args:
+            print(f'{ACTIVITY}#0\nSurfaceView[{ACTIVITY}](BLAST)#0\nStatusBar#0\nNavigationBar0#0')
+        elif '--latency' in args:
+            period, timestamps = frame_timestamps(config['fps'], config['jank_every'])
+            print(period)
+            for timestamp in timestamps:
+                print(f'{timestamp - 1000}\t{timestamp}\t{timestamp - 2000}')
+    elif service == 'gfxinfo':
+        print(f'Applications Graphics Acceleration Info:\nUptime: {int(time.monotonic() * 1000)}\n')
+        if 'framestats' in args:
+            _, timestamps = frame_timestamps(config['fps'], config['jank_every'], 120)
+            print(f'** Graphics info for pid 4242 [{PACKAGE}] **\n\nTotal frames rendered: {len(timestamps)}\n')
+            print('---PROFILEDATA---')
+            print('Flags,IntendedVsync,Vsync,HandleInputStart,AnimationStart,DrawStart,'
+                  'SyncStart,IssueDrawCommandsStart,FrameCompleted,')
+            for timestamp in timestamps:
+                start = timestamp - 12000000
+                print(f'0,{start},{start},{start + 100000},{start + 200000},{start + 1000000},'
+                      f'{start + 5000000},{start + 6000000},{timestamp},')
+            print('---PROFILEDATA---')
+    return 0
+
+
+def ps(config):
+    print('  PID NAME')
+    print('    1 init')
+    print('  612 surfaceflinger')
+    if config['app']:
+        for pid, (name, _) in APP_PROCESSES.items():
+            print(f'{pid:>5} {name}')
+    print(f'{9999:>5} ps')
+
+
+def getprop(args):
+    if args:
+        print(PROPS.get(args[0], ''))
+    else:
+        for key, value in PROPS.items():
+            print(f'[{key}]: [{value}]')
+    return 0
+
+
+# 无线连接模拟
+def wireless_state_path(config):
+    if config.path:
+        return config.path + '.wireless'
+    return os.path.join(tempfile.gettempdir(), 'fake_adb_wireless.json')
+
+
+def connected_addresses(config):
+    try:
+        with open(wireless_state_path(config)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_addresses(config, addresses):
+    write_file(wireless_state_path(config), json.dumps(sorted(set(addresses))))
+
+
+def reachable(config, address):
+    target = config.reload()['wireless'].get(address)
+    return bool(target) and target.get('reachable', True)
+
+
+def device_states(config):
+    """USB设备加已无线连接的地址（不可达时为offline）"""
+    values = config.reload()
+    states = dict(values['states'] or {serial: 'device' for serial in values['devices']})
+    for address in connected_addresses(config):
+        states[address] = 'device' if reachable(config, address) else 'offline'
+    return states
+
+
+def connect(config, address):
+    if ':' not in address:
+        address += ':5555'
+    target = config.reload()['wireless'].get(address) or {}
+    time.sleep(target.get('connect_ms', 50) / 1000)
+    if address in connected_addresses(config):
+        print(f'already connected to {address}')
+        return 0
+    if not reachable(config, address):
+        print(f"failed to connect to '{address}': No route to host")
+        return 1
+    save_addresses(config, connected_addresses(config) + [address])
+    print(f'connected to {address}')
+    return 0
+
+
+def disconnect(config, address=None):
+    if address is None:
+        save_addresses(config, [])
+        print('disconnected everything')
+        return 0
+    if ':' not in address:
+        address += ':5555'
+    addresses = connected_addresses(config)
+    if address not in addresses:
+        print(f"error: no such device '{address}'")
+        return 1
+    save_addresses(config, [item for item in addresses if item != address])
+    print(f'disconnected {address}')
+    return 0
+
+
+def track_devices(config):
+    """adb track-devices：设备列表变化时输出 4位十六进制长度 + 列表"""
+    last = None
+    while True:
+        states = device_states(config)
+        payload = ''.join(f'{serial}\t{state}\n' for serial, state in sorted(states.items()))
+        if payload != last:
+            sys.stdout.write(f'{len(payload):04x}{payload}')
+            sys.stdout.flush()
+            last = payload
+        time.sleep(0.1)
+
+
+def run_command(device, config, command):
+    """一次性执行 adb shell <命令> / adb exec-out <命令>"""
+    command = apply_faults(config, command) or command
+    proc = subprocess.Popen(['sh', '-c', rewrite_paths(command, device.root)],
+                            env=device.env(), stdout=subprocess.PIPE)
+    root = device.root.encode()
+    for line in proc.stdout:
+        sys.stdout.buffer.write(line.replace(root, b''))
+        sys.stdout.buffer.flush()
+    return proc.wait()
+
+
+def run_interactive(device, config):
+    """交互式 adb shell：逐行转发stdin到本机sh，每行都可能被注入故障"""
+    proc = subprocess.Popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=device.env(),
+                            universal_newlines=True, bufsize=1)
+
+    def pump():
+        for line in proc.stdout:
+            sys.stdout.write(line.replace(device.root, ''))
+            sys.stdout.flush()
+
+    reader = threading.Thread(target=pump)
+    reader.daemon = True
+    reader.start()
+    # ADBShell把每条命令包在 "{ 命令\n} 2>&1; echo 标记" 中，注入失败时丢弃命令的各行直到 } 行
+    skipping = False
+    wireless = device.serial in connected_addresses(config)
+    for line in sys.stdin:
+        if wireless and not reachable(config, device.serial):
+            break  # 无线连接中断，shell随之断开
+        if line.startswith('}'):
+            skipping = False
+        elif skipping:
+            continue
+        elif line.strip():
+            replaced = apply_faults(config, line)
+            if replaced:
+                line = ('{ ' if line.startswith('{ ') else '') + replaced + '\n'
+                skipping = line.startswith('{ ')
+        proc.stdin.write(rewrite_paths(line, device.root))
+        proc.stdin.flush()
+    proc.stdin.close()
+    code = proc.wait()
+    reader.join(1)
+    return code
+
+
+def main(argv):
+    if argv[:1] == ['--tool']:
+        config = Config()
+        if argv[1] == 'getprop':
+            return getprop(argv[2:])
+        if argv[1] == 'ps':
+            return ps(config)
+        return dumpsys(config, argv[2:])
+
+    log_spawn(argv)
+    config = Config()
+    serial = os.environ.get('ANDROID_SERIAL')
+    while argv and argv[0] in ('-s', '-P', '-H'):
+        if argv[0] == '-s':
+            serial = argv[1]
+        argv = argv[2:]
+    command, rest = (argv[0], argv[1:]) if argv else ('help', [])
+
+    if command == 'version':
+        print('Android Debug Bridge version 1.0.41 (fake)')
+        return 0
+    if command == 'devices':
+        states = device_states(config)
+        print('List of devices attached')
+        for device_serial, state in sorted(states.items()):
+            print(f'{device_serial}\t{state}')
+        print()
+        return 0
+    if command == 'track-devices':
+        track_devices(config)
+        return 0
+    if command == 'connect':
+        return connect(config, rest[0] if rest else '')
+    if command == 'disconnect':
+        return disconnect(config, rest[0] if rest else None)
+    if command in ('kill-server', 'start-server'):
+        return 0
+
+    serial = serial or config['devices'][0]
+    if serial in connected_addresses(config):
+        if not reachable(config, serial):
+            print("adb: device offline", file=sys.stderr)
+            return 1
+    elif serial not in config['devices']:
+        print(f"adb: device '{serial}' not found", file=sys.stderr)
+        return 1
+    device = FakeDevice(serial, config)
+    device.start_refresh()
+
+    if command == 'push':
+        # 推送的脚本中的路径同样改写到模拟根目录
+        with open(rest[0]) as source:
+            content = source.read()
+        write_file(rewrite_paths(rest[1], device.root), rewrite_paths(content, device.root))
+        print(f'{rest[0]}: 1 file pushed, 0 skipped.')
+        return 0
+    if command in ('shell', 'exec-out'):
+        if rest:
+            return run_command(device, config, ' '.join(rest))
+        return run_interactive(device, config)
+    print(f'fake adb: 不支持的命令 {command}', file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
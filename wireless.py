@@ -0,0 +1,234 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_tools import ADBTools, normalize_address, CONNECT_TIMEOUT
+
+# 同时进行的 adb connect 数
+MAX_PARALLEL = 16
+# 保活检查周期（秒）
+KEEPALIVE_INTERVAL = 5.0
+# 保活连续失败多少次视为连接已断开（Wi-Fi半开连接时adb server可能仍显示设备在线）
+KEEPALIVE_FAILURES = 2
+# 断开后重连的等待时间（秒），每次失败翻倍直到上限
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+# 连接成功后等待设备跟踪器报告上线的时间（秒），超时仍不在线视为断开
+ONLINE_GRACE = 10.0
+# 仅供内部使用的字段（单调时钟），不出现在接口返回中
+_INTERNAL_FIELDS = ('next_retry', 'since')
+
+
+def _public(target):
+    info = {key: value for key, value in target.items() if key not in _INTERNAL_FIELDS}
+    info['retry_in'] = round(max(0.0, target['next_retry'] - time.monotonic()), 1) \
+        if target['next_retry'] is not None else None
+    return info
+
+
+# 无线设备池
+class WirelessManager:
+    """并行连接多个 ip:port，并保持池中的连接
+
+    后台线程定期确认池中设备在线并通过常驻shell保活；设备跟踪器报告离线或保活失败时，
+    按退避间隔重连。重连成功后设备重新上线，会话由设备跟踪器的回调恢复
+    （采集器重启、增量状态清零，录制和历史数据不受影响）。
+    连接状态变化时回调 listener(address, state, info)。
+    """
+
+    def __init__(self, is_online, keepalive=KEEPALIVE_INTERVAL):
+        # is_online(serial) 返回设备当前是否在线
+        self.is_online = is_online
+        self.keepalive = keepalive
+        self._targets = {}
+        self._pending = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def targets(self):
+        """池中各地址的连接状态"""
+        with self._lock:
+            return [_public(target) for target in self._targets.values()]
+
+    def get(self, address):
+        with self._lock:
+            target = self._targets.get(normalize_address(address))
+            return _public(target) if target else None
+
+    def connect(self, address, timeout=CONNECT_TIMEOUT, keep=True):
+        """连接一个地址，keep为True时加入池中（断开后自动重连）"""
+        return self._connect(normalize_address(address), timeout, keep)
+
+    def connect_many(self, addresses, timeout=CONNECT_TIMEOUT, keep=True):
+        """并行连接多个地址，按输入顺序返回每个地址的结果"""
+        addresses = list(dict.fromkeys(normalize_address(address) for address in addresses if address.strip()))
+        return list(self._executor.map(lambda address: self._connect(address, timeout, keep), addresses))
+
+    def disconnect(self, address):
+        """断开并移出池，之后不再重连"""
+        address = normalize_address(address)
+        with self._lock:
+            removed = self._targets.pop(address, None)
+        ADBTools.disconnect_wireless(address)
+        if removed:
+            self._notify(address, 'disconnected', _public(dict(removed, state='disconnected')))
+        return removed is not None
+
+    def on_device_changed(self, serial, old_state, new_state):
+        """设备跟踪器的回调：池中设备离线时安排重连，上线时标记为已连接"""
+        with self._lock:
+            target = self._targets.get(serial)
+        if target is None:
+            return
+        if new_state == 'device':
+            self._update(serial, state='connected', online=True, attempts=0, failures=0, last_error=None)
+        elif old_state == 'device':
+            self._dropped(serial, f"设备状态变为 {new_state or '已断开'}")
+
+    # 连接与重连
+    def _connect(self, address, timeout, keep):
+        started = time.monotonic()
+        if keep:
+            with self._lock:
+                if address not in self._targets:
+                    self._targets[address] = {
+                        'address': address, 'state': 'connecting', 'online': False, 'attempts': 0,
+                        'failures': 0, 'reconnects': 0, 'last_error': None, 'connected_at': None,
+                        'next_retry': None, 'since': None
+                    }
+        success, message = ADBTools.connect_wireless(address, timeout)
+        if keep:
+            if success:
+                self._update(address, state='connected', online=False, attempts=0, failures=0, last_error=None,
+                             connected_at=time.time(), next_retry=None, since=time.monotonic())
+            else:
+                self._failed(address, message)
+        return {'address': address, 'success': success, 'message': message,
+                'seconds': round(time.monotonic() - started, 3)}
+
+    def _reconnect(self, address):
+        try:
+            self._update(address, state='reconnecting')
+            # 离线的地址仍留在adb server的列表中时 connect 只会返回 already connected，先断开再重新建立连接
+            ADBTools.disconnect_wireless(address)
+            success, message = ADBTools.connect_wireless(address)
+            if success:
+                with self._lock:
+                    target = self._targets.get(address)
+                    reconnects = target['reconnects'] + 1 if target else 1
+                self._update(address, state='connected', online=False, attempts=0, failures=0, last_error=None,
+                             connected_at=time.time(), next_retry=None, since=time.monotonic(),
+                             reconnects=reconnects)
+                print(f"无线设备 {address} 已重新连接")
+            else:
+                self._failed(address, message)
+        finally:
+            with self._lock:
+                self._pending.discard(address)
+
+    def _dropped(self, address, reason):
+        """连接断开：关闭旧的shell通道，稍后重连"""
+        print(f"无线设备 {address} 连接断开: {reason}")
+        ADBTools.close_shells(address)
+        self._update(address, state='dropped', online=False, last_error=reason,
+                     next_retry=time.monotonic() + RECONNECT_DELAY)
+        self._wake.set()
+
+    def _failed(self, address, message):
+        with self._lock:
+            target = self._targets.get(address)
+            attempts = target['attempts'] + 1 if target else 1
+        delay = min(RECONNECT_DELAY * 2 ** attempts, MAX_RECONNECT_DELAY)
+        self._update(address, state='failed', attempts=attempts, last_error=message,
+                     next_retry=time.monotonic() + delay)
+
+    def _keepalive(self, address):
+        try:
+            if ADBTools.ping(address):
+                self._update(address, failures=0)
+                return
+            with self._lock:
+                target = self._targets.get(address)
+                failures = target['failures'] + 1 if target else 0
+            self._update(address, failures=failures)
+            if failures >= KEEPALIVE_FAILURES:
+                self._dropped(address, f"保活连续失败 {failures} 次")
+        finally:
+            with self._lock:
+                self._pending.discard(address)
+
+    def _update(self, address, **fields):
+        with self._lock:
+            target = self._targets.get(address)
+            if target is None:
+                return
+            old_state = target['state']
+            target.update(fields)
+            info = _public(target)
+        if info['state'] != old_state:
+            self._notify(address, info['state'], info)
+
+    def _notify(self, address, state, info):
+        for listener in self._listeners:
+            try:
+                listener(address, state, info)
+            except Exception as e:
+                print(f"无线连接监听器异常: {str(e)}")
+
+    # 后台维护
+    def _run(self):
+        last_keepalive = 0
+        while self._running:
+            now = time.monotonic()
+            keepalive = now - last_keepalive >= self.keepalive
+            if keepalive:
+                last_keepalive = now
+            try:
+                self._maintain(now, keepalive)
+            except Exception as e:
+                print(f"无线连接维护异常: {str(e)}")
+            self._wake.wait(min(self.keepalive, RECONNECT_DELAY))
+            self._wake.clear()
+
+    def _maintain(self, now, keepalive):
+        with self._lock:
+            targets = [dict(target) for target in self._targets.values() if target['address'] not in self._pending]
+        for target in targets:
+            address = target['address']
+            if target['state'] == 'connected':
+                if self.is_online(address):
+                    if not target['online']:
+                        self._update(address, online=True)
+                    if keepalive:
+                        self._submit(address, self._keepalive)
+                elif target['online'] or now - (target['since'] or now) > ONLINE_GRACE:
+                    # 设备跟踪器的回调通常会先到，这里兜底
+                    self._dropped(address, '设备不在线')
+            elif target['state'] in ('dropped', 'failed') and target['next_retry'] is not None \
+                    and now >= target['next_retry']:
+                self._submit(address, self._reconnect)
+
+    def _submit(self, address, task):
+        with self._lock:
+            if address in self._pending:
+                return
+            self._pending.add(address)
+        self._executor.submit(task, address)